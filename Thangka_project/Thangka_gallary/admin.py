@@ -1,6 +1,47 @@
 from django.contrib import admin
+from django.db.models import Q
+from django.db.models.functions import Lower
 from django.utils.html import format_html
 from .models import Category, Tag, Artist, Artwork, ArtworkImage, Review, ContactMessage, Notification
+from .pagination import EstimatedCountPaginator
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """
+    Changelist settings for tables that grow to millions of rows.
+
+    No exact COUNT(*) (estimated paginator, no "N total" count), and search
+    without LIKE '%term%' scans. Each entry in search_fields is either
+    '=field' (exact match, for unique or indexed columns) or 'field' (a
+    case-insensitive prefix match written as a range over lower(field), which
+    the lower(...) expression indexes in models.py serve). A number searches
+    by primary key.
+
+    Free-text columns (descriptions, review comments, notification messages)
+    are deliberately not searchable here: matching inside them can only be
+    done with a scan of the whole table.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        if term.isdigit():
+            return queryset.filter(pk=int(term)), False
+
+        lowered = term.lower()
+        condition = Q()
+        for index, field in enumerate(self.get_search_fields(request)):
+            if field.startswith('='):
+                condition |= Q(**{field[1:]: term})
+                continue
+            alias = f'_search_{index}'
+            queryset = queryset.alias(**{alias: Lower(field)})
+            condition |= Q(**{f'{alias}__gte': lowered, f'{alias}__lt': lowered + '\uffff'})
+        return queryset.filter(condition), False
+
 
 class ArtworkImageInline(admin.TabularInline):
     model = ArtworkImage
@@ -19,11 +60,17 @@ class ReviewInline(admin.TabularInline):
     extra = 0
     readonly_fields = ('user', 'rating', 'comment', 'created_at')
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('user')
+
 @admin.register(Artwork)
-class ArtworkAdmin(admin.ModelAdmin):
+class ArtworkAdmin(LargeTableAdmin):
     list_display = ('title', 'artist_link', 'category', 'is_published', 'is_featured', 'created_at', 'price', 'views_count')
     list_filter = ('is_published', 'is_featured', 'category', 'materials')
-    search_fields = ('title', 'description')
+    list_select_related = ('artist', 'category')
+    search_fields = ('title', '=slug')  # not description: see LargeTableAdmin
+    date_hierarchy = 'created_at'
+    ordering = ('-created_at',)
     inlines = [ArtworkImageInline, ReviewInline]
     prepopulated_fields = {'slug': ('title',)}
     raw_id_fields = ('artist',)
@@ -39,6 +86,7 @@ class ArtworkAdmin(admin.ModelAdmin):
 @admin.register(Artist)
 class ArtistAdmin(admin.ModelAdmin):
     list_display = ('name', 'user', 'website')
+    list_select_related = ('user',)
     search_fields = ('name', 'user__username')
     raw_id_fields = ('user',)
 
@@ -53,10 +101,13 @@ class TagAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
 
 @admin.register(Review)
-class ReviewAdmin(admin.ModelAdmin):
+class ReviewAdmin(LargeTableAdmin):
     list_display = ('artwork', 'user', 'rating', 'created_at')
-    list_filter = ('rating', 'created_at')
-    search_fields = ('artwork__title', 'user__username', 'comment')
+    list_filter = ('rating',)
+    list_select_related = ('artwork', 'user')
+    search_fields = ('artwork__title', '=user__username')  # not comment: see LargeTableAdmin
+    date_hierarchy = 'created_at'
+    raw_id_fields = ('artwork', 'user')
 
 @admin.register(ContactMessage)
 class ContactAdmin(admin.ModelAdmin):
@@ -65,8 +116,11 @@ class ContactAdmin(admin.ModelAdmin):
     search_fields = ('name', 'email', 'subject', 'message')
 
 @admin.register(Notification)
-class NotificationAdmin(admin.ModelAdmin):
+class NotificationAdmin(LargeTableAdmin):
     list_display = ('user', 'notification_type', 'is_read', 'created_at')
-    list_filter = ('notification_type', 'is_read', 'created_at')
-    search_fields = ('user__username', 'message')
+    list_filter = ('notification_type', 'is_read')
+    list_select_related = ('user',)
+    search_fields = ('=user__username',)  # not message: see LargeTableAdmin
+    date_hierarchy = 'created_at'
     readonly_fields = ('created_at',)
+    raw_id_fields = ('user', 'actor', 'artwork')
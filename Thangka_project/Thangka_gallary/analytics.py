@@ -0,0 +1,201 @@
+"""
+Engagement analytics for artists.
+
+rollup() folds the engagement since its last run into EngagementHourly and
+EngagementDaily:
+
+* likes, bookmarks, reviews and follows are read by id above their table's
+  RollupWatermark, up to the newest row older than
+  ANALYTICS_ROLLUP_LAG_SECONDS (so a row whose transaction is still open
+  isn't skipped past), and grouped by artwork (artist, for follows) and hour
+  in SQL
+* views only exist as Artwork.view_count: what each count grew by since
+  RollupViewMark is put in the hour of the run
+
+Counts are gross: an unlike doesn't take its like back out of the hour it
+was counted in. A run writes its counts and moves the watermarks in one
+transaction, so every row is counted exactly once. Every query of a run
+goes to the primary: the watermarks are locked and moved there, and counting
+from a replica that lags behind would move them past rows it hasn't seen.
+
+series() answers the artist dashboard from the rollups alone: one indexed
+range per artwork over the daily rows (hourly for short ranges), whatever
+the size of the event tables.
+"""
+import datetime
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import (
+    Artist, Artwork, ArtworkLike, Bookmark, EngagementDaily, EngagementHourly, Follow, Review,
+    RollupViewMark, RollupWatermark,
+)
+
+METRICS = ('views', 'likes', 'bookmarks', 'reviews', 'follows')
+# metric -> (event table, column of the artwork, or of the followed user)
+SOURCES = {
+    'likes': (ArtworkLike, 'artwork_id'),
+    'bookmarks': (Bookmark, 'artwork_id'),
+    'reviews': (Review, 'artwork_id'),
+    'follows': (Follow, 'followee_id'),
+}
+ROLLUPS = {'hour': EngagementHourly, 'day': EngagementDaily}
+HOURLY_MAX_DAYS = 14
+DAILY_MAX_DAYS = 3660
+BATCH_SIZE = 500
+
+
+def _hour(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _events(metric, last_id, cutoff, using):
+    """({(owner, artwork or artist id, hour): count}, new watermark) of one event table."""
+    model, column = SOURCES[metric]
+    upper = model.objects.using(using).filter(id__gt=last_id, created_at__lt=cutoff).aggregate(top=Max('id'))['top']
+    if upper is None:
+        return {}, last_id
+    rows = (model.objects.using(using).filter(id__gt=last_id, id__lte=upper).order_by()
+            .annotate(hour=TruncHour('created_at')).values_list(column, 'hour')
+            .annotate(n=Count('id')))
+    if metric != 'follows':
+        return {('artwork', pk, hour): n for pk, hour, n in rows}, upper
+    rows = list(rows)
+    artists = dict(Artist.objects.using(using).filter(user_id__in={pk for pk, _, _ in rows}).values_list('user_id', 'id'))
+    counts = Counter()
+    for user_id, hour, n in rows:
+        if user_id in artists:  # followed users without an artist profile have no dashboard
+            counts[('artist', artists[user_id], hour)] += n
+    return counts, upper
+
+
+def _views(now, first_run, using):
+    """{('artwork', id, hour): views} since the last run, and the RollupViewMarks to save."""
+    seen = dict(RollupViewMark.objects.using(using).values_list('artwork_id', 'views_seen'))
+    hour = _hour(now)
+    counts, marks = {}, []
+    for pk, views in Artwork.objects.using(using).values_list('id', 'view_count').iterator(chunk_size=5000):
+        before = seen.get(pk)
+        if before == views:
+            continue
+        # on the very first run the views so far have no hour: they are only remembered
+        if before is None and first_run:
+            before = views
+        if views > (before or 0):
+            counts[('artwork', pk, hour)] = views - (before or 0)
+        marks.append(RollupViewMark(artwork_id=pk, views_seen=views))
+    return counts, marks
+
+
+def _apply(model, deltas, using):
+    """Add {(owner, id, bucket): Counter(metric=n)} to the rows of one rollup table."""
+    bucket_field = 'hour' if model is EngagementHourly else 'day'
+    updated, created = [], []
+    for owner in ('artwork', 'artist'):
+        mine = {key: counts for key, counts in deltas.items() if key[0] == owner}
+        if not mine:
+            continue
+        ids = {pk for _, pk, _ in mine}
+        buckets = {bucket for _, _, bucket in mine}
+        existing = {(owner, getattr(row, f'{owner}_id'), getattr(row, bucket_field)): row
+                    for row in model.objects.using(using).filter(**{f'{owner}_id__in': ids, f'{bucket_field}__in': buckets})}
+        for key, counts in mine.items():
+            row = existing.get(key)
+            if row is None:
+                row = model(**{f'{owner}_id': key[1], bucket_field: key[2]})
+                created.append(row)
+            else:
+                updated.append(row)
+            for metric, n in counts.items():
+                setattr(row, metric, getattr(row, metric) + n)
+    model.objects.using(using).bulk_update(updated, METRICS, batch_size=BATCH_SIZE)
+    model.objects.using(using).bulk_create(created, batch_size=BATCH_SIZE)
+    return len(updated) + len(created)
+
+
+def rollup(now=None):
+    """Count everything new since the last run. Returns {metric: events counted, 'rows': rollup rows written}."""
+    now = now or timezone.now()
+    cutoff = now - datetime.timedelta(seconds=settings.ANALYTICS_ROLLUP_LAG_SECONDS)
+    hourly = defaultdict(Counter)
+    summary = {}
+    db = router.db_for_write(RollupWatermark)
+    with transaction.atomic(using=db):
+        # locked until commit: a second concurrent run waits instead of counting the same rows
+        marks = {mark.source: mark for mark in RollupWatermark.objects.using(db).select_for_update()}
+        for metric in SOURCES:
+            mark = marks.setdefault(metric, RollupWatermark(source=metric))
+            counts, mark.last_id = _events(metric, mark.last_id, cutoff, db)
+            for key, n in counts.items():
+                hourly[key][metric] += n
+            summary[metric] = sum(counts.values())
+
+        # 'views' keeps the time of the last run (an id has no meaning there)
+        views_mark = marks.setdefault('views', RollupWatermark(source='views'))
+        counts, view_marks = _views(now, not views_mark.last_id, db)
+        for key, n in counts.items():
+            hourly[key]['views'] += n
+        summary['views'] = sum(counts.values())
+        views_mark.last_id = int(now.timestamp())
+
+        daily = defaultdict(Counter)
+        for (owner, pk, hour), counts in hourly.items():
+            daily[(owner, pk, timezone.localtime(hour).date())].update(counts)
+        summary['rows'] = _apply(EngagementHourly, hourly, db) + _apply(EngagementDaily, daily, db)
+
+        RollupViewMark.objects.using(db).bulk_create(view_marks, update_conflicts=True, unique_fields=['artwork'],
+                                           update_fields=['views_seen'], batch_size=BATCH_SIZE)
+        for mark in marks.values():
+            mark.save(using=db)
+
+        # hourly rows are only read for short ranges
+        EngagementHourly.objects.using(db).filter(
+            hour__lt=now - datetime.timedelta(days=settings.ANALYTICS_HOURLY_RETENTION_DAYS)).delete()
+    return summary
+
+
+def series(artist, granularity='day', days=30, artwork_id=None, now=None):
+    """
+    Engagement of an artist's artworks (or of one of them) over the last
+    `days` days, a point per hour or day, zeros included, with totals.
+    """
+    model = ROLLUPS[granularity]
+    days = max(1, min(days, HOURLY_MAX_DAYS if granularity == 'hour' else DAILY_MAX_DAYS))
+    now = now or timezone.now()
+    if granularity == 'hour':
+        end = _hour(now)
+        step = datetime.timedelta(hours=1)
+        buckets = [end - step * i for i in range(days * 24 - 1, -1, -1)]
+    else:
+        end = timezone.localdate(now)
+        step = datetime.timedelta(days=1)
+        buckets = [end - step * i for i in range(days - 1, -1, -1)]
+
+    if artwork_id is not None:
+        owner = Q(artwork_id=artwork_id)
+    else:
+        owner = Q(artwork_id__in=Artwork.objects.filter(artist=artist).values('id')) | Q(artist=artist)
+    rows = (model.objects.filter(owner, **{f'{granularity}__gte': buckets[0], f'{granularity}__lte': end})
+            .values(granularity).annotate(**{metric: Sum(metric) for metric in METRICS}).order_by(granularity))
+    by_bucket = {row[granularity]: row for row in rows}
+
+    points, totals = [], Counter()
+    for bucket in buckets:
+        row = by_bucket.get(bucket, {})
+        point = {'t': bucket.isoformat()}
+        for metric in METRICS:
+            point[metric] = row.get(metric) or 0
+            totals[metric] += point[metric]
+        points.append(point)
+    last_run = RollupWatermark.objects.aggregate(at=Max('updated_at'))['at']
+    return {
+        'granularity': granularity,
+        'series': points,
+        'totals': {metric: totals[metric] for metric in METRICS},
+        'as_of': last_run.isoformat() if last_run else None,
+    }
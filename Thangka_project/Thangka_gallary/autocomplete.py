@@ -0,0 +1,254 @@
+"""
+Autocomplete for tags, artists and categories.
+
+Each worker keeps a PrefixIndex per kind: the normalized names in a sorted
+list, searched with bisect, so a keystroke costs a few microseconds. A name
+is indexed from the start of each of its words ("norbu" finds "Tenzin
+Norbu").
+
+An index is built the first time it's asked for, in a background thread
+that reads from the primary (a lagging replica could predate the generation
+it records). Until then search() answers from the database with a prefix
+range over lower(name), which the lower(...) indexes in models.py serve; it
+matches the start of the whole name only. The signals in signals.py apply
+every change made by this process to its own indexes and bump the kind's
+generation in the shared cache; bulk_create() and bulk_update() send no
+signals, so IndexedQuerySet bumps it for them. At most every CHECK_SECONDS a
+worker compares its generation with the shared one and rebuilds (again in
+the background, still answering from the old index) when another process
+has changed something.
+"""
+import bisect
+import logging
+import threading
+import time
+import unicodedata
+
+from django.core.cache import cache
+from django.db import models, router, transaction
+from django.db.models.functions import Lower
+
+logger = logging.getLogger(__name__)
+
+CHECK_SECONDS = 2
+MAX_RESULTS = 20
+
+
+def normalize(text):
+    # case- and accent-insensitive, single spaces
+    text = unicodedata.normalize('NFKD', text.casefold())
+    return ' '.join(''.join(c for c in text if not unicodedata.combining(c)).split())
+
+
+class PrefixIndex:
+    """Sorted (key, id) entries of one kind, with each entry's result dict."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.loaded = False
+        self.generation = None
+        self.checked_at = 0
+        self._keys = []
+        self._ids = []
+        self._items = {}
+        self._lock = threading.Lock()
+        self._building = False
+
+    @staticmethod
+    def _entry_keys(name):
+        words = normalize(name).split(' ')
+        return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+    def replace(self, items, generation):
+        """Swap in a full set of {id: item} (each item has a 'name')."""
+        entries = sorted((key, pk) for pk, item in items.items() for key in self._entry_keys(item['name']))
+        with self._lock:
+            self._keys = [key for key, _ in entries]
+            self._ids = [pk for _, pk in entries]
+            self._items = items
+            self.generation = generation
+            self.loaded = True
+
+    def put(self, pk, item):
+        with self._lock:
+            self._discard(pk)
+            self._items[pk] = item
+            for key in self._entry_keys(item['name']):
+                position = bisect.bisect_left(self._keys, key)
+                self._keys.insert(position, key)
+                self._ids.insert(position, pk)
+
+    def discard(self, pk):
+        with self._lock:
+            self._discard(pk)
+
+    def _discard(self, pk):
+        item = self._items.pop(pk, None)
+        if item is None:
+            return
+        for key in self._entry_keys(item['name']):
+            position = bisect.bisect_left(self._keys, key)
+            while self._ids[position] != pk:
+                position += 1
+            del self._keys[position]
+            del self._ids[position]
+
+    def search(self, prefix, limit):
+        prefix = normalize(prefix)
+        results, seen = [], set()
+        with self._lock:
+            position = bisect.bisect_left(self._keys, prefix)
+            while position < len(self._keys) and len(results) < limit:
+                if not self._keys[position].startswith(prefix):
+                    break
+                pk = self._ids[position]
+                if pk not in seen:
+                    seen.add(pk)
+                    results.append(self._items[pk])
+                position += 1
+        return results
+
+
+def _kinds():
+    from .models import Artist, Category, Tag
+
+    def named(row):
+        return {'id': row['id'], 'name': row['name'], 'slug': row['slug']}
+
+    def artist(row):
+        # user_id: chat links to a user, not to the artist profile
+        return {'id': row['id'], 'name': row['name'] or row['user__username'] or '', 'user_id': row['user_id']}
+
+    return {
+        'tags': (Tag, ('id', 'name', 'slug'), named),
+        'categories': (Category, ('id', 'name', 'slug'), named),
+        'artists': (Artist, ('id', 'name', 'user_id', 'user__username'), artist),
+    }
+
+
+KINDS = ('tags', 'artists', 'categories')
+MODEL_KINDS = {'tag': 'tags', 'artist': 'artists', 'category': 'categories'}
+INDEXES = {kind: PrefixIndex(kind) for kind in KINDS}
+
+
+def _generation_key(kind):
+    return f'autocomplete:{kind}:generation'
+
+
+def _shared_generation(kind):
+    key = _generation_key(kind)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, time.time_ns() // 1000, None)
+        generation = cache.get(key)
+    return generation
+
+
+def build(kind):
+    """Load a kind's index from the database (in the calling thread)."""
+    model, fields, to_item = _kinds()[kind]
+    generation = _shared_generation(kind)
+    rows = model.objects.using(router.db_for_write(model)).values(*fields)
+    items = {row['id']: to_item(row) for row in rows.iterator(chunk_size=5000)}
+    INDEXES[kind].replace(items, generation)
+    INDEXES[kind].checked_at = time.monotonic()
+    return len(items)
+
+
+def _build_in_background(index):
+    from django.db import connections
+
+    with index._lock:
+        if index._building:
+            return
+        index._building = True
+
+    def run():
+        try:
+            build(index.kind)
+        except Exception:
+            logger.exception("autocomplete: building the %s index failed", index.kind)
+        finally:
+            index._building = False
+            connections.close_all()
+
+    threading.Thread(target=run, name=f'autocomplete-{index.kind}', daemon=True).start()
+
+
+def _from_database(kind, prefix, limit):
+    model, fields, to_item = _kinds()[kind]
+    lowered = prefix.strip().lower()
+    rows = (model.objects.alias(_name=Lower('name'))
+            .filter(_name__gte=lowered, _name__lt=lowered + '\uffff')
+            .order_by('_name').values(*fields)[:limit])
+    return [to_item(row) for row in rows]
+
+
+def search(kind, prefix, limit=10):
+    """(results, source) for a typed prefix; source is 'index', or 'database' while the index is cold."""
+    index = INDEXES[kind]
+    limit = max(1, min(limit, MAX_RESULTS))
+    if not index.loaded:
+        _build_in_background(index)
+        return _from_database(kind, prefix, limit), 'database'
+    now = time.monotonic()
+    if now - index.checked_at > CHECK_SECONDS:
+        index.checked_at = now
+        if _shared_generation(kind) != index.generation:
+            _build_in_background(index)
+    return index.search(prefix, limit), 'index'
+
+
+def _row(kind, instance):
+    row = {'id': instance.pk, 'name': instance.name}
+    if kind == 'artists':
+        row['user_id'] = instance.user_id
+        row['user__username'] = instance.user.username if instance.user_id and not instance.name else ''
+    else:
+        row['slug'] = instance.slug
+    return row
+
+
+def changed(kind, pk, instance=None):
+    """Apply a saved object (or a deleted one's pk, without instance) to this process's index and tell the others."""
+    index = INDEXES[kind]
+    try:
+        generation = cache.incr(_generation_key(kind))
+    except ValueError:
+        generation = None
+    if not index.loaded:
+        return
+    if instance is None:
+        index.discard(pk)
+    else:
+        index.put(pk, _kinds()[kind][2](_row(kind, instance)))
+    # still complete here as long as nothing else changed since our last look
+    if generation is not None and index.generation == generation - 1:
+        index.generation = generation
+
+
+def invalidate(kind):
+    """Have every process (this one included) rebuild its index of a kind at its next check."""
+    try:
+        cache.incr(_generation_key(kind))
+    except ValueError:
+        pass  # flushed: the next check finds a fresh generation anyway
+    INDEXES[kind].checked_at = 0
+
+
+class IndexedQuerySet(models.QuerySet):
+    """For the autocompleted models: bulk writes, which send no signals, invalidate the kind's indexes."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        self._invalidate()
+        return objs
+
+    def bulk_update(self, objs, *args, **kwargs):
+        rows = super().bulk_update(objs, *args, **kwargs)
+        self._invalidate()
+        return rows
+
+    def _invalidate(self):
+        kind = MODEL_KINDS[self.model._meta.model_name]
+        transaction.on_commit(lambda: invalidate(kind), using=self.db)
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+
+
+def user_cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def forget_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    """
+    ModelBackend whose get_user() (run lazily on every authenticated request)
+    is served from the shared cache, with the user's Artist profile loaded in
+    the same row, so `request.user.artist` costs no query either.
+    Entries are dropped by signals whenever the User or Artist is saved.
+    """
+
+    def _user_queryset(self, user_id):
+        return get_user_model()._default_manager.select_related('artist').filter(pk=user_id)
+
+    def get_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = self._user_queryset(user_id).first()
+            if user is None:
+                return None
+            cache.set(key, user, settings.USER_CACHE_SECONDS)
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        key = user_cache_key(user_id)
+        user = await cache.aget(key)
+        if user is None:
+            user = await self._user_queryset(user_id).afirst()
+            if user is None:
+                return None
+            await cache.aset(key, user, settings.USER_CACHE_SECONDS)
+        return user if self.user_can_authenticate(user) else None
@@ -0,0 +1,67 @@
+"""
+Small helpers shared by the ``bench_*`` management commands.
+
+Benchmarks never touch the real database: they run inside
+``scratch_database()``, which builds a throwaway SQLite file with the full
+schema (the same way the test runner does) and removes it afterwards.
+"""
+from contextlib import contextmanager
+import os
+import statistics
+import tempfile
+import time
+
+from django.db import connections
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment,
+)
+
+
+@contextmanager
+def scratch_database():
+    tmpdir = tempfile.mkdtemp(prefix='thangka-bench-')
+    # a file (not :memory:) so that worker threads/processes share the data
+    connections['default'].settings_dict['TEST']['NAME'] = os.path.join(tmpdir, 'bench.sqlite3')
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        yield
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+
+class Timings:
+    """Collects per-request latencies and prints a one-line summary."""
+
+    def __init__(self, label):
+        self.label = label
+        self.samples = []
+        self.errors = 0
+        self.started = None
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.started
+
+    def add(self, seconds, ok=True):
+        self.samples.append(seconds)
+        if not ok:
+            self.errors += 1
+
+    @property
+    def throughput(self):
+        return len(self.samples) / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        if not self.samples:
+            return f"{self.label:<40} no samples"
+        ordered = sorted(self.samples)
+        p95 = ordered[int(len(ordered) * 0.95) - 1] if len(ordered) >= 20 else ordered[-1]
+        return (f"{self.label:<40} {self.throughput:8.0f} req/s   "
+                f"p50 {statistics.median(ordered) * 1000:7.2f} ms   p95 {p95 * 1000:7.2f} ms   "
+                f"errors {self.errors}")
@@ -0,0 +1,305 @@
+"""
+Content-addressed media storage.
+
+Files are named by the SHA-256 of their bytes and fanned out over two levels
+of directories (blobs/ab/cd/abcd...ef.jpg), so the same scan uploaded twice
+is stored once, and no directory grows past a few hundred entries however
+large the library gets. A name always means the same bytes, so serve_media
+sends blobs as immutable.
+
+A blob may back several file fields, so every save() counts a reference in
+MediaBlob and delete() removes the file only when the last one is given back
+(signals.py does that when an image or artist is deleted, or its file is
+replaced or cleared). Names from before the switch aren't counted and are
+never removed by a reference drop; the `migrate_media` command moves them
+into the blob store.
+
+save_many() stores a batch: a thread pool streams each file to a temporary
+name while hashing it, then the new files' fsyncs are issued together, the
+files are renamed into place and every directory touched is fsynced once,
+instead of write/fsync/rename/fsync one file after another. save() is a
+batch of one.
+
+LocalObjectStorage is a stand-in for an S3-style bucket with the same names
+and counting: objects are written whole, and there are no local paths, so
+everything that uses it goes through the code paths a remote store needs.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import uuid
+
+from django.core.files import File
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils._os import safe_join
+from django.utils.deconstruct import deconstructible
+
+PREFIX = 'blobs'
+READ_SIZE = 1024 * 1024
+BLOB_NAME = re.compile(r'blobs/[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9]{1,8})?')
+
+
+def is_blob_name(name):
+    return bool(name) and BLOB_NAME.fullmatch(name) is not None
+
+
+def blob_name(digest, filename):
+    extension = os.path.splitext(filename or '')[1].lower()
+    if not re.fullmatch(r'\.[a-z0-9]{1,8}', extension):
+        extension = ''
+    return f'{PREFIX}/{digest[:2]}/{digest[2:4]}/{digest}{extension}'
+
+
+def fsync_path(path, directory=False):
+    fd = os.open(path, os.O_RDONLY | (getattr(os, 'O_DIRECTORY', 0) if directory else 0))
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class Staged:
+    """A hashed file at a temporary path, not stored yet."""
+
+    def __init__(self, name, path, size, owned):
+        self.name = name
+        self.path = path
+        self.size = size
+        self.owned = owned  # our temporary copy (False: the caller's temporary file, to be moved)
+
+    def discard(self):
+        if self.owned:
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+def release(fieldfile):
+    """Give back a deleted row's reference to its file, if that file is a counted blob."""
+    if fieldfile and isinstance(fieldfile.storage, ContentAddressedStorage) and is_blob_name(fieldfile.name):
+        fieldfile.storage.delete(fieldfile.name)
+
+
+@deconstructible(path='Thangka_gallary.blobstore.ContentAddressedStorage')
+class ContentAddressedStorage(FileSystemStorage):
+    # files with a temporary_file_path() (large uploads, finished chunked
+    # uploads) are hashed where they are and renamed into place
+    moves_files = True
+
+    def __init__(self, workers=8, fsync=True, **kwargs):
+        super().__init__(**kwargs)
+        self.workers = workers
+        self.fsync = fsync
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+    def pool(self):
+        with self._pool_lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.workers, thread_name_prefix='blobstore')
+            return self._pool
+
+    def get_available_name(self, name, max_length=None):
+        return name  # the stored name comes from the content, see _save()
+
+    def _save(self, name, content):
+        return self.save_many([(name, content)])[0]
+
+    def save_many(self, items):
+        """Store [(name, content)]; returns the blob name of each, in order."""
+        items = [(name, content if hasattr(content, 'chunks') else File(content, name)) for name, content in items]
+        pool = self.pool() if len(items) > 1 else None
+        if pool is None:
+            staged = [self._stage(item) for item in items]
+        else:
+            futures = [pool.submit(self._stage, item) for item in items]
+            staged, error = [], None
+            for future in futures:
+                try:
+                    staged.append(future.result())
+                except Exception as e:
+                    error = error or e
+            if error is not None:
+                for s in staged:
+                    s.discard()
+                raise error
+        try:
+            self._commit(staged, pool)
+        finally:
+            for s in staged:
+                s.discard()
+        return [s.name for s in staged]
+
+    def _staging_dir(self):
+        directory = os.path.join(self.location, PREFIX, 'tmp')
+        os.makedirs(directory, exist_ok=True)
+        return directory
+
+    def _stage(self, item):
+        name, content = item
+        digest = hashlib.sha256()
+        if self.moves_files and hasattr(content, 'temporary_file_path'):
+            path = content.temporary_file_path()
+            with open(path, 'rb') as f:
+                for block in iter(lambda: f.read(READ_SIZE), b''):
+                    digest.update(block)
+            return Staged(blob_name(digest.hexdigest(), name), path, os.path.getsize(path), owned=False)
+
+        fd, path = tempfile.mkstemp(dir=self._staging_dir(), suffix='.part')
+        size = 0
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                for chunk in content.chunks(READ_SIZE):
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return Staged(blob_name(digest.hexdigest(), name), path, size, owned=True)
+
+    def _commit(self, staged, pool):
+        with transaction.atomic():
+            for s in staged:
+                self._add_reference(s.name, s.size)
+            # the reference rows are locked until commit, so a concurrent last
+            # delete() of one of these blobs can't remove it under us
+            fresh = {}
+            for s in staged:
+                if s.name not in fresh and not self._blob_exists(s.name):
+                    fresh[s.name] = s
+            if fresh:
+                self._store(list(fresh.values()), pool)
+
+    def _add_reference(self, name, size):
+        from .models import MediaBlob
+
+        if MediaBlob.objects.filter(name=name).update(refs=F('refs') + 1):
+            return
+        try:
+            with transaction.atomic():
+                MediaBlob.objects.create(name=name, size=size, refs=1)
+        except IntegrityError:  # created by someone else just now
+            MediaBlob.objects.filter(name=name).update(refs=F('refs') + 1)
+
+    def _blob_exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def _store(self, fresh, pool):
+        if self.fsync:
+            paths = [s.path for s in fresh]
+            if pool:
+                list(pool.map(fsync_path, paths))
+            else:
+                for path in paths:
+                    fsync_path(path)
+        directories = set()
+        for s in fresh:
+            target = self.path(s.name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if s.owned:
+                os.replace(s.path, target)
+            else:
+                file_move_safe(s.path, target, allow_overwrite=True)
+            os.chmod(target, self.file_permissions_mode if self.file_permissions_mode is not None else 0o644)
+            directories.add(os.path.dirname(target))
+        if self.fsync:
+            for directory in directories:
+                fsync_path(directory, directory=True)
+
+    def _remove_blob(self, name):
+        super().delete(name)
+
+    def delete(self, name):
+        if not is_blob_name(name):
+            return super().delete(name)
+        from .models import MediaBlob
+
+        MediaBlob.objects.filter(name=name, refs__gt=0).update(refs=F('refs') - 1)
+        transaction.on_commit(lambda: self.collect(name))
+
+    def collect(self, name):
+        """Remove blob `name` if no reference to it is left."""
+        from .models import MediaBlob
+
+        with transaction.atomic():
+            # a save() of the same bytes since then has bumped refs (or waits on this row)
+            if MediaBlob.objects.filter(name=name, refs=0).delete()[0]:
+                self._remove_blob(name)
+
+
+@deconstructible(path='Thangka_gallary.blobstore.LocalObjectStorage')
+class LocalObjectStorage(ContentAddressedStorage):
+    """
+    Objects live under `location` by key. Writes are whole-object PUTs, and
+    path() raises NotImplementedError like any remote storage's, so callers
+    read through open() (see parallel.local_path).
+    """
+    moves_files = False
+
+    def _object_path(self, name):
+        return safe_join(self.location, name)
+
+    def path(self, name):
+        raise NotImplementedError("This backend doesn't support absolute paths.")
+
+    def _staging_dir(self):
+        return None  # the system temporary directory, as a remote store would need
+
+    def _open(self, name, mode='rb'):
+        return File(open(self._object_path(name), mode))
+
+    def exists(self, name):
+        return os.path.lexists(self._object_path(name))
+
+    def size(self, name):
+        return os.path.getsize(self._object_path(name))
+
+    def listdir(self, path):
+        directories, files = [], []
+        with os.scandir(self._object_path(path)) as entries:
+            for entry in entries:
+                (directories if entry.is_dir() else files).append(entry.name)
+        return directories, files
+
+    def get_modified_time(self, name):
+        return self._datetime_from_timestamp(os.path.getmtime(self._object_path(name)))
+
+    def _blob_exists(self, name):
+        return self.exists(name)
+
+    def _put(self, staged):
+        target = self._object_path(staged.name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # an object appears whole or not at all
+        partial = f'{target}.{uuid.uuid4().hex}.put'
+        shutil.copyfile(staged.path, partial)
+        if self.fsync:
+            fsync_path(partial)
+        os.replace(partial, target)
+
+    def _store(self, fresh, pool):
+        if pool:
+            list(pool.map(self._put, fresh))  # parallel uploads, as with a real bucket
+        else:
+            for s in fresh:
+                self._put(s)
+
+    def _remove_blob(self, name):
+        try:
+            os.remove(self._object_path(name))
+        except FileNotFoundError:
+            pass
+
+    def delete(self, name):
+        if is_blob_name(name):
+            return super().delete(name)
+        self._remove_blob(name)
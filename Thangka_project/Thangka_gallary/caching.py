@@ -0,0 +1,151 @@
+"""
+Cache helpers for the gallery.
+
+The catalog generation is a counter in the shared cache that changes every
+time something shown in the public feeds changes (see signals.py). Feed
+responses derive their ETag and payload cache key from it, so revalidating a
+page costs one cache read instead of rebuilding it from the database.
+
+get_or_compute() / @cached_compute cache values that are expensive to
+rebuild (rankings, aggregates) without a stampede when they expire:
+
+* the value is stored with its soft expiry and how long it took to compute,
+  and kept in the cache for another `stale` seconds past that expiry
+* a reader refreshes it early with a probability that grows as the expiry
+  nears and with the compute time ("XFetch"), so under load one request
+  usually recomputes before anything has expired
+* only the holder of a short lock (an atomic cache add) recomputes; the
+  others keep serving the stale value meanwhile, or, when there is no value
+  at all, wait for the holder's for up to `lock_timeout` seconds
+* hits, stale hits, waits and recomputes are counted per name in this
+  process (compute_metrics())
+"""
+from collections import Counter, defaultdict
+import functools
+import math
+import random
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+
+CATALOG_GENERATION_KEY = 'catalog:generation'
+
+
+def _fresh_generation():
+    # after a cache flush, start from a value no client can have seen before
+    return time.time_ns() // 1000
+
+
+def catalog_generation():
+    generation = cache.get(CATALOG_GENERATION_KEY)
+    if generation is None:
+        cache.add(CATALOG_GENERATION_KEY, _fresh_generation(), None)
+        generation = cache.get(CATALOG_GENERATION_KEY)
+    return generation
+
+
+async def acatalog_generation():
+    generation = await cache.aget(CATALOG_GENERATION_KEY)
+    if generation is None:
+        await cache.aadd(CATALOG_GENERATION_KEY, _fresh_generation(), None)
+        generation = await cache.aget(CATALOG_GENERATION_KEY)
+    return generation
+
+
+def bump_catalog_generation():
+    try:
+        cache.incr(CATALOG_GENERATION_KEY)
+    except ValueError:
+        cache.add(CATALOG_GENERATION_KEY, _fresh_generation(), None)
+
+
+WAIT_STEP = 0.05
+
+_metrics = defaultdict(Counter)
+_metrics_lock = threading.Lock()
+
+
+def _count(name, event, amount=1):
+    with _metrics_lock:
+        _metrics[name][event] += amount
+
+
+def compute_metrics():
+    """{name: {'hits': n, 'stale': n, 'waits': n, 'recomputes': n, 'compute_seconds': s, ...}} of this process."""
+    with _metrics_lock:
+        return {name: dict(counts) for name, counts in _metrics.items()}
+
+
+def _recompute(backend, key, compute, timeout, stale, name, lock):
+    started = time.perf_counter()
+    try:
+        value = compute()
+        delta = time.perf_counter() - started
+        backend.set(key, (value, time.time() + timeout, delta), timeout + stale)
+    finally:
+        # only our own lock: after lock_timeout it may have passed to someone else
+        if lock and backend.get(key + ':lock') == lock:
+            backend.delete(key + ':lock')
+    _count(name, 'recomputes')
+    _count(name, 'compute_seconds', delta)
+    return value
+
+
+def get_or_compute(key, compute, timeout, *, name=None, stale=None, lock_timeout=10, beta=1.0, backend=None):
+    """
+    The cached value of `key`, calling compute() to (re)build it with at most
+    one caller at a time across processes. `timeout` is how long a value is
+    fresh; it's served stale for `stale` more seconds (default: `timeout`)
+    while its refresh runs. beta > 1 refreshes earlier, 0 only on expiry.
+    """
+    backend = backend or cache
+    name = name or key
+    stale = timeout if stale is None else stale
+    lock_key = key + ':lock'
+    entry = backend.get(key)
+    if entry is not None:
+        value, expires, delta = entry
+        now = time.time()
+        if now - delta * beta * math.log(1 - random.random()) < expires:
+            _count(name, 'hits')
+            return value
+        lock = uuid.uuid4().hex
+        if not backend.add(lock_key, lock, lock_timeout):
+            _count(name, 'stale' if now >= expires else 'hits')
+            return value
+        return _recompute(backend, key, compute, timeout, stale, name, lock)
+
+    lock = uuid.uuid4().hex
+    if backend.add(lock_key, lock, lock_timeout):
+        _count(name, 'misses')
+        return _recompute(backend, key, compute, timeout, stale, name, lock)
+    # someone else is computing it: wait for their value rather than pile on
+    deadline = time.monotonic() + lock_timeout
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_STEP)
+        entry = backend.get(key)
+        if entry is not None:
+            _count(name, 'waits')
+            return entry[0]
+    _count(name, 'lock_timeouts')
+    return _recompute(backend, key, compute, timeout, stale, name, None)
+
+
+def cached_compute(name, timeout, **options):
+    """
+    Decorator form of get_or_compute(): the key is built from `name` and the
+    positional arguments, and the function gets an .invalidate(*args).
+    """
+    def decorate(function):
+        def key(*args):
+            return ':'.join(['compute', name, *map(str, args)])
+
+        @functools.wraps(function)
+        def wrapper(*args):
+            return get_or_compute(key(*args), lambda: function(*args), timeout, name=name, **options)
+
+        wrapper.invalidate = lambda *args: (options.get('backend') or cache).delete(key(*args))
+        return wrapper
+    return decorate
@@ -0,0 +1,188 @@
+"""
+Streaming catalog exports (CSV / JSONL, optionally gzipped).
+
+Everything here is a generator: rows come from a values() query read with
+``.iterator(chunk_size=...)`` (a server-side cursor on PostgreSQL), tags and
+image paths are fetched once per chunk, and each serialized line is handed on
+(and compressed) as soon as it is produced. Memory use depends on the chunk
+size, not on the size of the catalog. Used by the staff export view and the
+``export_catalog`` command.
+
+An incremental export (``since``) has every artwork that was edited (its
+row, its tags or its images: see signals.py) or got a like, bookmark or
+review in the window, and a ``deleted`` row for every artwork deleted in it.
+View counts and removed likes, bookmarks or reviews don't select an artwork:
+its counts catch up the next time it is exported, and a full export is exact.
+"""
+import csv
+import datetime
+import io
+import json
+import zlib
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.db.models import Avg, F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from .models import Artwork, ArtworkImage, ArtworkLike, ArtworkTombstone, Bookmark, Review
+from .queries import count_per_artwork, per_artwork
+
+COLUMNS = (
+    'id', 'title', 'slug', 'artist', 'category', 'tags', 'images', 'materials', 'year_created',
+    'price', 'is_published', 'is_featured', 'view_count', 'likes_count', 'bookmarks_count',
+    'reviews_count', 'average_rating', 'created_at', 'updated_at', 'deleted',
+)
+CHUNK_SIZE = 2000
+
+
+def parse_since(value):
+    """ISO date or datetime -> aware datetime (None if empty); ValueError if malformed."""
+    if not value:
+        return None
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f"not an ISO date or datetime: {value!r}")
+        moment = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment, datetime.timezone.utc)
+    return moment
+
+
+def catalog_rows(since=None, until=None, chunk_size=CHUNK_SIZE):
+    """
+    Yield one dict per artwork changed in (since, until], oldest edit first,
+    then the artworks deleted in it. Engagement counts are correlated
+    subqueries, so rows never multiply.
+    """
+    queryset = Artwork.objects.order_by('updated_at', 'id')
+    if since is None:
+        if until is not None:
+            queryset = queryset.filter(updated_at__lte=until)
+    else:
+        window = {'gt': since} if until is None else {'gt': since, 'lte': until}
+        changed = Q(**{f'updated_at__{op}': moment for op, moment in window.items()})
+        for model in (ArtworkLike, Bookmark, Review):
+            new_rows = model.objects.filter(**{f'created_at__{op}': moment for op, moment in window.items()})
+            changed |= Q(pk__in=new_rows.values('artwork_id'))
+        queryset = queryset.filter(changed)
+    rows = queryset.values(
+        'id', 'title', 'slug', 'materials', 'year_created', 'price', 'is_published',
+        'is_featured', 'view_count', 'created_at', 'updated_at',
+        artist_name=F('artist__name'),
+        category_name=F('category__name'),
+        likes_count=count_per_artwork(ArtworkLike),
+        bookmarks_count=count_per_artwork(Bookmark),
+        reviews_count=count_per_artwork(Review),
+        average_rating=per_artwork(Review, Avg('rating')),
+    ).iterator(chunk_size=chunk_size)
+
+    yield from _artwork_rows(rows, chunk_size)
+    if since is not None:
+        yield from _tombstone_rows(since, until)
+
+
+def _artwork_rows(rows, chunk_size):
+    through = Artwork.tags.through
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        ids = [row['id'] for row in chunk]
+        tags, images = {}, {}
+        for artwork_id, name in (through.objects.filter(artwork_id__in=ids)
+                                 .order_by('tag__name').values_list('artwork_id', 'tag__name')):
+            tags.setdefault(artwork_id, []).append(name)
+        for artwork_id, name in (ArtworkImage.objects.filter(artwork_id__in=ids)
+                                 .order_by('order', 'id').values_list('artwork_id', 'image')):
+            images.setdefault(artwork_id, []).append(default_storage.url(name))
+        for row in chunk:
+            yield {
+                'id': row['id'],
+                'title': row['title'],
+                'slug': row['slug'],
+                'artist': row['artist_name'] or '',
+                'category': row['category_name'] or '',
+                'tags': tags.get(row['id'], []),
+                'images': images.get(row['id'], []),
+                'materials': row['materials'],
+                'year_created': row['year_created'],
+                'price': str(row['price']) if row['price'] is not None else None,
+                'is_published': row['is_published'],
+                'is_featured': row['is_featured'],
+                'view_count': row['view_count'],
+                'likes_count': row['likes_count'],
+                'bookmarks_count': row['bookmarks_count'],
+                'reviews_count': row['reviews_count'],
+                'average_rating': round(row['average_rating'], 2) if row['average_rating'] is not None else None,
+                'created_at': row['created_at'].isoformat(),
+                'updated_at': row['updated_at'].isoformat(),
+                'deleted': False,
+            }
+
+
+def _tombstone_rows(since, until):
+    tombstones = ArtworkTombstone.objects.filter(deleted_at__gt=since).order_by('deleted_at', 'id')
+    if until is not None:
+        tombstones = tombstones.filter(deleted_at__lte=until)
+    empty = dict.fromkeys(COLUMNS)
+    for artwork_id, slug, deleted_at in tombstones.values_list('artwork_id', 'slug', 'deleted_at').iterator():
+        yield {**empty, 'id': artwork_id, 'slug': slug, 'tags': [], 'images': [],
+               'updated_at': deleted_at.isoformat(), 'deleted': True}
+
+
+def jsonl_lines(rows):
+    for row in rows:
+        yield json.dumps(row, ensure_ascii=False) + '\n'
+
+
+def csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def line(values):
+        writer.writerow(values)
+        text = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return text
+
+    yield line(COLUMNS)
+    for row in rows:
+        # lists become '|'-separated cells
+        yield line(['|'.join(row[c]) if isinstance(row[c], list) else row[c] for c in COLUMNS])
+
+
+FORMATS = {'csv': csv_lines, 'jsonl': jsonl_lines}
+
+
+def encoded(lines, block_size=64 * 1024):
+    """Join text lines into UTF-8 blocks of about `block_size` bytes."""
+    parts, size = [], 0
+    for text in lines:
+        data = text.encode('utf-8')
+        parts.append(data)
+        size += len(data)
+        if size >= block_size:
+            yield b''.join(parts)
+            parts, size = [], 0
+    if parts:
+        yield b''.join(parts)
+
+
+def gzipped(blocks, level=6):
+    """Compress a stream of byte blocks into a single gzip member on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # 31: gzip header and trailer
+    for block in blocks:
+        data = compressor.compress(block)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(fmt='csv', since=None, until=None, compress=True, chunk_size=CHUNK_SIZE):
+    blocks = encoded(FORMATS[fmt](catalog_rows(since, until, chunk_size)))
+    return gzipped(blocks) if compress else blocks
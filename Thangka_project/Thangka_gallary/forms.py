@@ -1,5 +1,6 @@
 from django import forms
 from django.contrib.auth.models import User
+from django.urls import reverse
 from .models import Artwork, Artist, ContactMessage
 
 class RegisterForm(forms.ModelForm):
@@ -32,10 +33,38 @@ class ArtistForm(forms.ModelForm):
         model = Artist
         fields = ('name', 'bio', 'avatar', 'website', 'twitter', 'instagram')
 
+class AutocompleteSelectMultiple(forms.SelectMultiple):
+    """
+    Multi-select of model rows that renders only the selected ones; the
+    others are looked up as the user types (api/autocomplete, autocomplete.js)
+    instead of being listed in full.
+    """
+    def __init__(self, kind, attrs=None):
+        super().__init__(attrs)
+        self.kind = kind
+
+    def get_context(self, name, value, attrs):
+        context = super().get_context(name, value, attrs)
+        context['widget']['attrs'].update({
+            'data-autocomplete': self.kind,
+            'data-autocomplete-url': reverse('autocomplete'),
+        })
+        return context
+
+    def optgroups(self, name, value, attrs=None):
+        iterator = self.choices
+        ids = [v for v in value if str(v).isdigit()]
+        self.choices = [iterator.choice(obj) for obj in iterator.queryset.filter(pk__in=ids)]
+        try:
+            return super().optgroups(name, value, attrs)
+        finally:
+            self.choices = iterator
+
 class ArtworkForm(forms.ModelForm):
     class Meta:
         model = Artwork
         fields = ('title', 'description', 'category', 'tags', 'materials', 'year_created', 'price', 'is_featured', 'is_published')
+        widgets = {'tags': AutocompleteSelectMultiple('tags')}
         # DO NOT add a FileField here for multiple images!
 
 class ContactForm(forms.ModelForm):
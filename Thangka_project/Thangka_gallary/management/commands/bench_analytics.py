@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth.models import User
+from django.utils import timezone
+import datetime
+import random
+import time
+
+from Thangka_gallary import analytics
+from Thangka_gallary.benchmarks import Timings, scratch_database
+from Thangka_gallary.models import Artist, Artwork, EngagementDaily, EngagementHourly
+
+
+class Command(BaseCommand):
+    help = ("Fill the engagement rollups with years of history for many artists and time the "
+            "analytics series an artist dashboard asks for. Uses a scratch database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--artists', type=int, default=50)
+        parser.add_argument('--artworks', type=int, default=20, help="per artist")
+        parser.add_argument('--years', type=int, default=3)
+        parser.add_argument('--requests', type=int, default=50)
+
+    def handle(self, *args, **options):
+        rng = random.Random(1)
+        today = timezone.localdate()
+        hour = timezone.now().replace(minute=0, second=0, microsecond=0)
+        days = 365 * options['years']
+        with scratch_database():
+            users = User.objects.bulk_create(User(username=f'bench_artist_{i}') for i in range(options['artists']))
+            artists = Artist.objects.bulk_create(Artist(user=user, name=user.username) for user in users)
+            artworks = Artwork.objects.bulk_create(
+                Artwork(title=f'Thangka {i}', artist=artist)
+                for artist in artists for i in range(options['artworks']))
+            started = time.perf_counter()
+            for artwork in artworks:
+                EngagementDaily.objects.bulk_create(
+                    (EngagementDaily(artwork=artwork, day=today - datetime.timedelta(days=d),
+                                     views=rng.randint(0, 50), likes=rng.randint(0, 5))
+                     for d in range(days)), batch_size=2000)
+                EngagementHourly.objects.bulk_create(
+                    (EngagementHourly(artwork=artwork, hour=hour - datetime.timedelta(hours=h),
+                                      views=rng.randint(0, 5))
+                     for h in range(24 * 14)), batch_size=2000)
+            self.stdout.write(f"{len(artworks) * days} daily and {len(artworks) * 24 * 14} hourly rows "
+                              f"in {time.perf_counter() - started:.0f} s")
+
+            for label, granularity, span in [('48 hours, hourly', 'hour', 2), ('30 days', 'day', 30),
+                                             ('1 year', 'day', 365), (f"{options['years']} years", 'day', days)]:
+                timings = Timings(f'series: {label}')
+                with timings:
+                    for _ in range(options['requests']):
+                        artist = rng.choice(artists)
+                        started = time.perf_counter()
+                        analytics.series(artist, granularity, span)
+                        timings.add(time.perf_counter() - started)
+                self.stdout.write(timings.summary())
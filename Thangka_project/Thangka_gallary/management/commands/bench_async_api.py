@@ -0,0 +1,92 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.test import Client, AsyncClient, override_settings
+from django.urls import reverse
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import logging
+import time
+
+from Thangka_gallary.benchmarks import scratch_database, Timings
+from Thangka_gallary.models import Artist, Artwork, Notification
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Compare WSGI (thread pool) and ASGI (event loop) throughput of the JSON and toggle APIs "
+            "in a single process, against a scratch database")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per endpoint and mode")
+        parser.add_argument('--concurrency', type=int, default=64, help="Requests in flight at once")
+        parser.add_argument('--artworks', type=int, default=200, help="Artworks in the scratch catalog")
+
+    def handle(self, *args, **options):
+        # failed requests are counted in the summary; keep their tracebacks out of the report
+        logging.getLogger('django.request').setLevel(logging.CRITICAL)
+        # throughput, not the rate limiter: with RATE_LIMITS on, most requests would be 429s
+        with scratch_database(), override_settings(RATE_LIMITS={}):
+            self.seed(options['artworks'])
+            for label, method, url, data in self.endpoints():
+                wsgi = self.run_wsgi(label, method, url, data, options['requests'], options['concurrency'])
+                asgi = asyncio.run(self.run_asgi(label, method, url, data, options['requests'], options['concurrency']))
+                self.stdout.write(wsgi.summary())
+                self.stdout.write(asgi.summary())
+
+    def seed(self, count):
+        self.user = User.objects.create_user(username='bench_user', password='bench')
+        other = User.objects.create_user(username='bench_artist', password='bench')
+        artist = Artist.objects.get(user=other)
+        Artwork.objects.bulk_create([
+            Artwork(title=f"Bench Thangka {i}", slug=f"bench-thangka-{i}", artist=artist)
+            for i in range(count)
+        ])
+        self.artwork_ids = list(Artwork.objects.values_list('pk', flat=True))
+        self.other = other
+        self.notification = Notification.objects.create(
+            user=self.user, actor=other, notification_type='like', message='bench')
+
+    def endpoints(self):
+        # toggles spread over the catalog, like many users clicking different cards
+        def artwork(i):
+            return {'artwork_id': self.artwork_ids[i % len(self.artwork_ids)]}
+        return [
+            ('gallery_json', 'get', reverse('gallery_json'), lambda i: {'page': 2}),
+            ('artist_artworks_json', 'get', reverse('artist_artworks_json'), lambda i: {'page': 2}),
+            ('toggle_like', 'post', reverse('toggle_like'), artwork),
+            ('toggle_bookmark', 'post', reverse('toggle_bookmark'), artwork),
+            ('toggle_follow', 'post', reverse('toggle_follow'), lambda i: {'user_id': self.other.pk}),
+            ('mark_notif_read', 'post', reverse('mark_notif_read', args=[self.notification.pk]), lambda i: {}),
+        ]
+
+    def run_wsgi(self, label, method, url, data, total, concurrency):
+        timings = Timings(f"WSGI {label}")
+
+        def worker(offset):
+            client = Client(raise_request_exception=False)
+            client.force_login(self.user)
+            for i in range(offset, total, concurrency):
+                started = time.perf_counter()
+                response = getattr(client, method)(url, data(i))
+                timings.add(time.perf_counter() - started, response.status_code == 200)
+
+        with timings, ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(worker, range(concurrency)))
+        return timings
+
+    async def run_asgi(self, label, method, url, data, total, concurrency):
+        timings = Timings(f"ASGI {label}")
+        client = AsyncClient(raise_request_exception=False)
+        await client.aforce_login(self.user)
+        gate = asyncio.Semaphore(concurrency)
+
+        async def one(i):
+            async with gate:
+                started = time.perf_counter()
+                response = await getattr(client, method)(url, data(i))
+                timings.add(time.perf_counter() - started, response.status_code == 200)
+
+        with timings:
+            await asyncio.gather(*(one(i) for i in range(total)))
+        return timings
@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+import time
+
+from Thangka_gallary.benchmarks import scratch_database
+
+User = get_user_model()
+
+CONFIGURATIONS = [
+    ('db sessions + ModelBackend', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+    }),
+    ('cached_db sessions + CachedModelBackend', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'AUTHENTICATION_BACKENDS': ['Thangka_gallary.backends.CachedModelBackend'],
+    }),
+]
+
+
+class Command(BaseCommand):
+    help = "Measure the fixed database cost (queries and time) of an authenticated request"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+
+    def handle(self, *args, **options):
+        total = options['requests']
+        with scratch_database():
+            user = User.objects.create_user(username='bench_user', password='bench')
+            # my_state with no ids does nothing but load the session and request.user
+            url = reverse('my_state') + '?ids='
+            for label, overrides in CONFIGURATIONS:
+                with override_settings(**overrides):
+                    cache.clear()
+                    client = Client()
+                    client.force_login(user)
+                    client.get(url)  # warm the caches, as any earlier request would
+                    with CaptureQueriesContext(connections['default']) as queries:
+                        started = time.perf_counter()
+                        for _ in range(total):
+                            client.get(url)
+                        elapsed = time.perf_counter() - started
+                    tables = sorted({q['sql'].split(' FROM ')[1].split()[0].strip('"')
+                                     for q in queries.captured_queries if ' FROM ' in q['sql']})
+                    self.stdout.write(
+                        f"{label:<42} {len(queries) / total:5.2f} queries/request   "
+                        f"{elapsed / total * 1000:6.3f} ms/request   tables: {', '.join(tables) or '-'}")
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+import random
+import time
+
+from Thangka_gallary import autocomplete
+from Thangka_gallary.benchmarks import Timings, scratch_database
+from Thangka_gallary.models import Artist, Tag
+
+SYLLABLES = ['ten', 'zin', 'nor', 'bu', 'pe', 'ma', 'dor', 'je', 'tra', 'shi', 'lha', 'mo', 'kar', 'gya', 'tso', 'ri']
+
+
+def _name(rng, words):
+    return ' '.join(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 3))).title()
+                    for _ in range(words))
+
+
+class Command(BaseCommand):
+    help = ("Time autocomplete lookups for typed prefixes from the in-memory prefix index, from the "
+            "database fallback and through the API; fails if the index's p95 is 1 ms or more. "
+            "Uses a scratch database.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tags', type=int, default=20000)
+        parser.add_argument('--artists', type=int, default=20000)
+        parser.add_argument('--lookups', type=int, default=2000)
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with scratch_database():
+            Tag.objects.bulk_create((Tag(name=f'{_name(rng, 1)} {i}') for i in range(options['tags'])),
+                                    batch_size=1000)
+            Artist.objects.bulk_create((Artist(name=_name(rng, 2)) for _ in range(options['artists'])),
+                                       batch_size=1000)
+            # what people type: the first 1-4 letters of a word in a name
+            prefixes = [(kind, rng.choice(_name(rng, 2).split())[:rng.randint(1, 4)])
+                        for kind in ('tags', 'artists') for _ in range(options['lookups'] // 2)]
+
+            database = Timings('database fallback')
+            with database:
+                for kind, prefix in prefixes:
+                    started = time.perf_counter()
+                    autocomplete._from_database(kind, prefix, 10)
+                    database.add(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            entries = sum(autocomplete.build(kind) for kind in ('tags', 'artists'))
+            self.stdout.write(f"built indexes of {entries} names in {time.perf_counter() - started:.2f} s")
+
+            index = Timings('prefix index')
+            with index:
+                for kind, prefix in prefixes:
+                    started = time.perf_counter()
+                    autocomplete.search(kind, prefix)
+                    index.add(time.perf_counter() - started)
+
+            client = Client()
+            api = Timings('GET api/autocomplete (index)')
+            with api:
+                for kind, prefix in prefixes:
+                    started = time.perf_counter()
+                    response = client.get('/api/autocomplete/', {'kind': kind, 'q': prefix})
+                    api.add(time.perf_counter() - started, response.status_code == 200)
+
+            for timings in (database, index, api):
+                self.stdout.write(timings.summary())
+        ordered = sorted(index.samples)
+        p95 = ordered[int(len(ordered) * 0.95) - 1]
+        if p95 >= 0.001:
+            raise CommandError(f"prefix index p95 is {p95 * 1000:.2f} ms")
+        self.stdout.write(self.style.SUCCESS(f"prefix index p95 {p95 * 1e6:.0f} us"))
@@ -0,0 +1,74 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+import time
+import uuid
+
+from Thangka_gallary.parallel import process_pool
+
+
+def _hammer(args):
+    """Worker: read one expensive cached value as fast as possible until `deadline`."""
+    key, timeout, compute_seconds, deadline, protected = args
+    from django.core.cache import cache
+    from Thangka_gallary.caching import get_or_compute
+
+    computes = []
+
+    def compute():
+        computes.append(time.time())
+        time.sleep(compute_seconds)
+        return 'value'
+
+    reads = 0
+    while time.time() < deadline:
+        if protected:
+            get_or_compute(key, compute, timeout, name='bench', lock_timeout=5)
+        elif cache.get(key) is None:
+            cache.set(key, compute(), timeout)
+        reads += 1
+    return reads, computes
+
+
+class Command(BaseCommand):
+    help = ("Read one cached value that expires every --timeout seconds from several workers, first "
+            "with a plain get/set and then through caching.get_or_compute(), and check that the "
+            "latter recomputes it once per expiry")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=8)
+        parser.add_argument('--seconds', type=float, default=6.0)
+        parser.add_argument('--timeout', type=float, default=2.0)
+        parser.add_argument('--compute-ms', type=int, default=50)
+
+    def handle(self, *args, **options):
+        backend = settings.CACHES['default']['BACKEND']
+        if backend.endswith('LocMemCache'):
+            # per-process: processes wouldn't share it, threads of this one do
+            self.stdout.write(self.style.WARNING(
+                "The default cache is per-process LocMemCache, so the workers are threads of this process; "
+                "set THANGKA_REDIS_URL to test across processes."))
+            pool = ThreadPoolExecutor(options['workers'])
+        else:
+            pool = process_pool(options['workers'])
+
+        timeout, seconds = options['timeout'], options['seconds']
+        expiries = int(seconds / timeout)
+        with pool:
+            for protected in (False, True):
+                deadline = time.time() + seconds
+                task = (f'bench:compute:{uuid.uuid4().hex}', timeout, options['compute_ms'] / 1000, deadline, protected)
+                results = list(pool.map(_hammer, [task] * options['workers']))
+                reads = sum(r[0] for r in results)
+                computes = sorted(t for r in results for t in r[1])
+                gaps = [b - a for a, b in zip(computes, computes[1:])]
+                label = 'get_or_compute' if protected else 'plain get/set'
+                self.stdout.write(f"{label:<16} reads={reads} recomputes={len(computes)} "
+                                  f"(expiries in {seconds:g} s: {expiries}) "
+                                  f"shortest gap between recomputes={min(gaps, default=0):.2f} s")
+
+        # early refreshes start a little before expiry (so there can be more recomputes
+        # than expiries), but two recomputes of the same value would be close together
+        if min(gaps, default=timeout) < timeout / 2:
+            raise CommandError("More than one recompute per expiry.")
+        self.stdout.write(self.style.SUCCESS("One recompute per expiry."))
@@ -0,0 +1,106 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+import time
+
+import numpy as np
+
+from Thangka_gallary.benchmarks import scratch_database, Timings
+from Thangka_gallary.models import Artist, Artwork, ArtworkLike, ArtworkSimilarity, Bookmark
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = ("Build item-to-item similarities for a synthetic catalog in a scratch database, "
+            "check them against a dense numpy computation and time /api/recommendations/")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--artworks', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--interactions', type=int, default=40, help="Likes + bookmarks per user")
+        parser.add_argument('--requests', type=int, default=300)
+        parser.add_argument('--max-pairs', type=int, default=50_000,
+                            help="Small blocks, so the blocking is exercised too")
+
+    def handle(self, *args, **options):
+        from Thangka_gallary import similarity
+
+        rng = np.random.default_rng(7)
+        with scratch_database():
+            users, item_ids = self.seed(rng, options['artworks'], options['users'], options['interactions'])
+
+            started = time.perf_counter()
+            artworks, rows, blocks = similarity.compute(max_pairs=options['max_pairs'])
+            self.stdout.write(f"compute_similarities: {artworks} artworks, {rows} rows, {blocks} blocks, "
+                              f"{(time.perf_counter() - started) * 1000:.0f} ms")
+            self.verify(similarity, item_ids)
+
+            client = Client()
+            url = reverse('recommendations')
+            timings = Timings('GET /api/recommendations/')
+            sql_seconds = 0.0
+            with timings:
+                for i in range(options['requests']):
+                    client.force_login(users[i % len(users)])
+                    started = time.perf_counter()
+                    with CaptureQueriesContext(connections['default']) as queries:
+                        response = client.get(url)
+                    timings.add(time.perf_counter() - started,
+                                response.status_code == 200 and response.json()['source'] == 'similar')
+                    sql_seconds += sum(float(q['time']) for q in queries.captured_queries)
+            self.stdout.write(timings.summary())
+            self.stdout.write(f"queries per request: {len(queries)}, "
+                              f"mean SQL time {sql_seconds / options['requests'] * 1000:.2f} ms")
+
+    def seed(self, rng, artwork_count, user_count, per_user):
+        users = User.objects.bulk_create(User(username=f'bench_user_{i}') for i in range(user_count))
+        artist = Artist.objects.create(name='Bench Artist')
+        Artwork.objects.bulk_create(
+            Artwork(title=f'Thangka {i}', slug=f'thangka-{i}', artist=artist) for i in range(artwork_count))
+        item_ids = np.asarray(Artwork.objects.order_by('pk').values_list('pk', flat=True))
+
+        # each user mostly likes artworks from one of 20 "taste" clusters
+        clusters = 20
+        likes, bookmarks = [], []
+        for user in users:
+            taste = rng.integers(clusters)
+            picks = np.where(rng.random(per_user) < 0.8,
+                             rng.integers(artwork_count // clusters, size=per_user) * clusters + taste,
+                             rng.integers(artwork_count, size=per_user))
+            for n, index in enumerate(np.unique(picks % artwork_count)):
+                model, target = (Bookmark, bookmarks) if n % 4 == 0 else (ArtworkLike, likes)
+                target.append(model(user=user, artwork_id=int(item_ids[index])))
+        ArtworkLike.objects.bulk_create(likes, batch_size=2000)
+        Bookmark.objects.bulk_create(bookmarks, batch_size=2000)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(f"seeded {len(users)} users, {artwork_count} artworks, "
+                          f"{len(likes)} likes, {len(bookmarks)} bookmarks")
+        return users, item_ids
+
+    def verify(self, similarity, item_ids):
+        """Stored top-K must match a dense users x artworks cosine computation."""
+        users, items, weights = similarity._interactions()
+        user_ids, rows = np.unique(users, return_inverse=True)
+        columns = np.searchsorted(item_ids, items)
+        dense = np.zeros((len(user_ids), len(item_ids)))
+        dense[rows, columns] = weights
+        norms = np.linalg.norm(dense, axis=0)
+        norms[norms == 0] = 1
+        cosine = (dense.T @ dense) / np.outer(norms, norms)
+        np.fill_diagonal(cosine, 0)
+
+        stored = {}
+        for artwork_id, score in ArtworkSimilarity.objects.values_list('artwork_id', 'score'):
+            stored.setdefault(artwork_id, []).append(score)
+        for position, artwork_id in enumerate(item_ids.tolist()):
+            expected = np.sort(cosine[position])[::-1][:similarity.TOP_K]
+            expected = expected[expected >= similarity.MIN_SCORE]
+            got = np.sort(stored.get(artwork_id, []))[::-1]
+            if len(got) != len(expected) or not np.allclose(got, expected, atol=1e-5):
+                raise CommandError(f"neighbours of artwork {artwork_id} differ from the dense computation")
+        self.stdout.write(self.style.SUCCESS("neighbour scores match the dense computation"))
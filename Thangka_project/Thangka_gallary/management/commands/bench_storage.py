@@ -0,0 +1,78 @@
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management.base import BaseCommand, CommandError
+import os
+import shutil
+import tempfile
+import time
+
+from Thangka_gallary.benchmarks import scratch_database
+from Thangka_gallary.blobstore import ContentAddressedStorage, LocalObjectStorage
+from Thangka_gallary.models import MediaBlob
+
+
+def disk_usage(root):
+    total = 0
+    for directory, _, files in os.walk(root):
+        total += sum(os.path.getsize(os.path.join(directory, name)) for name in files)
+    return total
+
+
+class Command(BaseCommand):
+    help = ("Write the same set of files through plain FileSystemStorage and through the "
+            "content-addressed stores (one by one and in batches) and report writes per second, "
+            "disk used and whether the reference counts add up. Uses a scratch database and directory.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=400)
+        parser.add_argument('--size-kb', type=int, default=256)
+        parser.add_argument('--duplicates', type=float, default=0.25,
+                            help="Fraction of the files that repeat an earlier one (default: %(default)s)")
+        parser.add_argument('--batch-size', type=int, default=32)
+        parser.add_argument('--workers', type=int, nargs='+', default=[1, 4, 8])
+        parser.add_argument('--no-fsync', action='store_true')
+
+    def handle(self, *args, **options):
+        count, size = options['files'], options['size_kb'] * 1024
+        unique = max(1, round(count * (1 - options['duplicates'])))
+        payloads = [os.urandom(size) for _ in range(unique)]
+        files = [(f'scan_{i}.jpg', payloads[i % unique]) for i in range(count)]
+        fsync = not options['no_fsync']
+        self.stdout.write(f"{count} files of {options['size_kb']} KB, {unique} distinct, fsync={'on' if fsync else 'off'}")
+
+        with scratch_database():
+            self.run('FileSystemStorage (never fsyncs), one by one', FileSystemStorage, {}, files, batch=None)
+            self.run('content-addressed, one by one', ContentAddressedStorage,
+                     {'fsync': fsync}, files, batch=None)
+            for workers in options['workers']:
+                self.run(f'content-addressed, batches, {workers} threads', ContentAddressedStorage,
+                         {'fsync': fsync, 'workers': workers}, files, batch=options['batch_size'])
+            self.run(f'object-store stand-in, batches, {max(options["workers"])} threads', LocalObjectStorage,
+                     {'fsync': fsync, 'workers': max(options['workers'])}, files, batch=options['batch_size'])
+
+    def run(self, label, storage_class, kwargs, files, batch):
+        root = tempfile.mkdtemp(prefix='thangka-bench-media-')
+        MediaBlob.objects.all().delete()
+        try:
+            storage = storage_class(location=root, **kwargs)
+            started = time.perf_counter()
+            if batch is None:
+                names = [storage.save(f'artworks/{name}', ContentFile(data)) for name, data in files]
+            else:
+                names = []
+                for start in range(0, len(files), batch):
+                    names += storage.save_many([(f'artworks/{name}', ContentFile(data))
+                                                for name, data in files[start:start + batch]])
+            elapsed = time.perf_counter() - started
+            megabytes = sum(len(data) for _, data in files) / 1024 ** 2
+            self.stdout.write(f"{label:<46} {len(files) / elapsed:8.0f} writes/s  {megabytes / elapsed:7.1f} MB/s  "
+                              f"disk {disk_usage(root) / 1024 ** 2:7.1f} MB  files {len(set(names))}")
+            if isinstance(storage, ContentAddressedStorage):
+                if sum(MediaBlob.objects.values_list('refs', flat=True)) != len(files):
+                    raise CommandError(f"{label}: reference counts don't add up to {len(files)}")
+                for name in names:
+                    storage.delete(name)
+                if MediaBlob.objects.exists() or any(storage.exists(name) for name in set(names)):
+                    raise CommandError(f"{label}: blobs left after deleting every reference")
+        finally:
+            shutil.rmtree(root)
@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+import time
+import uuid
+
+from Thangka_gallary.parallel import process_pool
+
+
+def _hammer(args):
+    """Worker process: take tokens as fast as possible until `deadline`."""
+    key, rate, burst, deadline = args
+    from Thangka_gallary.throttle import hit
+    admitted = attempts = 0
+    spent = 0.0
+    while time.time() < deadline:
+        started = time.perf_counter()
+        allowed, _ = hit(key, rate, burst)
+        spent += time.perf_counter() - started
+        attempts += 1
+        admitted += allowed
+    return admitted, attempts, spent
+
+
+def _ready(_):
+    time.sleep(0.2)  # long enough for every worker to get one
+
+
+class Command(BaseCommand):
+    help = ("Hammer one rate-limit bucket from several processes and check that the total "
+            "admitted stays within burst + rate * duration; also reports the cost of a check")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--seconds', type=float, default=3.0)
+        parser.add_argument('--rate', default='600/m')
+        parser.add_argument('--burst', type=int, default=50)
+
+    def handle(self, *args, **options):
+        from Thangka_gallary.throttle import parse_rate, shared_cache
+
+        shared = shared_cache()
+        if not shared:
+            self.stdout.write(self.style.WARNING(
+                "The default cache isn't shared between processes, so each worker gets its own buckets "
+                "and only the per-process limit is checked; set THANGKA_REDIS_URL to test the shared limit."))
+
+        workers = options['workers']
+        rate, burst = parse_rate(options['rate']), options['burst']
+        key = f'bench:{uuid.uuid4().hex}'
+
+        with process_pool(workers) as pool:
+            # spawn the workers first: starting them can take longer than --seconds
+            list(pool.map(_ready, range(workers)))
+            start = time.time()
+            deadline = start + options['seconds']
+            results = list(pool.map(_hammer, [(key, rate, burst, deadline)] * workers))
+
+        admitted = sum(r[0] for r in results)
+        attempts = sum(r[1] for r in results)
+        spent = sum(r[2] for r in results)
+        # the sliding window may admit up to one extra window's worth at a boundary
+        bound = (burst + rate * (deadline - start) + burst) * (1 if shared else workers)
+        cost = spent / attempts * 1e6 if attempts else 0
+        self.stdout.write(f"workers={workers} attempts={attempts} admitted={admitted} "
+                          f"bound={bound:.0f} cost={cost:.1f} us/check")
+        scope = "across processes" if shared else "in each process"
+        if admitted > bound:
+            raise CommandError(f"Rate limit exceeded {scope}.")
+        self.stdout.write(self.style.SUCCESS(f"Limit held {scope}."))
@@ -0,0 +1,58 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+import os
+import time
+
+from Thangka_gallary.caching import bump_catalog_generation
+from Thangka_gallary.models import ArtworkImage
+from Thangka_gallary.parallel import local_path, process_pool
+from Thangka_gallary.placeholders import analyze_file
+
+
+class Command(BaseCommand):
+    help = ("Record the intrinsic size and build the inline placeholder of every artwork image "
+            "that has none yet")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Redo images that already have a placeholder")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                            help="processes for decoding images")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        images = ArtworkImage.objects.exclude(image='').order_by('pk')
+        if not options['all']:
+            images = images.filter(placeholder='')
+        pending = list(images.values_list('pk', 'image'))
+
+        started = time.monotonic()
+        done = unreadable = 0
+        with process_pool(options['workers']) as pool:
+            for start in range(0, len(pending), options['batch_size']):
+                batch = pending[start:start + options['batch_size']]
+                paths = [local_path(name) for _, name in batch]
+                analyzed = iter(pool.map(analyze_file, [path for path in paths if path], chunksize=16))
+
+                updated = []
+                for (pk, name), path in zip(batch, paths):
+                    if path:
+                        result = next(analyzed)
+                    else:
+                        with default_storage.open(name) as f:
+                            result = analyze_file(f)
+                    if result is None:
+                        unreadable += 1
+                    else:
+                        width, height, placeholder = result
+                        updated.append(ArtworkImage(pk=pk, width=width, height=height, placeholder=placeholder))
+
+                with transaction.atomic():
+                    ArtworkImage.objects.bulk_update(updated, ['width', 'height', 'placeholder'], batch_size=500)
+                done += len(updated)
+                self.stdout.write(f"  {start + len(batch)}/{len(pending)} images")
+
+        if done:
+            bump_catalog_generation()  # the feeds carry the placeholders
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {done} placeholders ({unreadable} unreadable) in {time.monotonic() - started:.1f} s"))
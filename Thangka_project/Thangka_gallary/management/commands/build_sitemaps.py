@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+import time
+
+from Thangka_gallary.publishing import build_sitemaps
+
+
+class Command(BaseCommand):
+    help = ("Write gzipped sitemaps of up to 50k artwork URLs each plus sitemap.xml; "
+            "only id ranges whose artworks changed since the last run are rewritten")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="rewrite every file, changed or not")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        written, removed = build_sitemaps(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{written} written, {removed} removed under {settings.PUBLISHED_ROOT} "
+            f"in {time.perf_counter() - started:.2f}s"))
@@ -0,0 +1,45 @@
+from datetime import timedelta
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from Thangka_gallary.models import UploadSession
+from Thangka_gallary.uploads import part_path, remove_part
+
+
+class Command(BaseCommand):
+    help = ("Abort chunked uploads nobody has touched for a while and delete their part files, "
+            "plus any part file no open upload owns (run from cron)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=settings.CHUNKED_UPLOAD_EXPIRY_HOURS,
+                            help="Age of the last chunk after which an open upload expires (default: %(default)s)")
+        parser.add_argument('--purge-days', type=float, default=30,
+                            help="Also delete finished and aborted session rows older than this")
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        stale = UploadSession.objects.filter(status='open', updated_at__lt=now - timedelta(hours=options['hours']))
+        expired = 0
+        for session in stale.only('pk'):
+            # the filter is re-checked by the update, which loses to a chunk arriving meanwhile
+            if stale.filter(pk=session.pk).update(status='aborted', updated_at=now):
+                remove_part(session)
+                expired += 1
+
+        orphans = 0
+        if os.path.isdir(settings.CHUNKED_UPLOAD_DIR):
+            live = {os.path.basename(part_path(s)) for s in UploadSession.objects.filter(status='open').only('pk')}
+            for name in os.listdir(settings.CHUNKED_UPLOAD_DIR):
+                path = os.path.join(settings.CHUNKED_UPLOAD_DIR, name)
+                # part files of sessions created after the listing above are still young
+                if name not in live and os.path.getmtime(path) < now.timestamp() - 3600:
+                    os.remove(path)
+                    orphans += 1
+
+        purged, _ = (UploadSession.objects.exclude(status='open')
+                     .filter(updated_at__lt=now - timedelta(days=options['purge_days'])).delete())
+        self.stdout.write(self.style.SUCCESS(
+            f"Expired {expired} uploads, removed {orphans} orphaned part files, purged {purged} old sessions"))
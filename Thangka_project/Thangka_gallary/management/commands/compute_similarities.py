@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+import time
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the item-to-item similarity table behind the \"For you\" recommendations "
+            "from likes and bookmarks (run from cron)")
+
+    def add_arguments(self, parser):
+        # numpy is only needed here, not by the web processes
+        from Thangka_gallary import similarity
+
+        parser.add_argument('--top-k', type=int, default=similarity.TOP_K,
+                            help="Neighbours kept per artwork (default: %(default)s)")
+        parser.add_argument('--max-pairs', type=int, default=similarity.MAX_PAIRS,
+                            help="Products expanded per block; bounds memory (default: %(default)s)")
+
+    def handle(self, *args, **options):
+        from Thangka_gallary import similarity
+
+        started = time.monotonic()
+        artworks, rows, blocks = similarity.compute(top_k=options['top_k'], max_pairs=options['max_pairs'])
+        self.stdout.write(f"{artworks} artworks with interactions, {rows} neighbour rows "
+                          f"in {blocks} blocks, {(time.monotonic() - started) * 1000:.0f} ms")
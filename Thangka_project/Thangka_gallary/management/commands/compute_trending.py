@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+import time
+
+from Thangka_gallary.caching import bump_catalog_generation
+
+
+class Command(BaseCommand):
+    help = ("Recompute the time-decayed trending score of every published artwork "
+            "(run from cron, or keep running with --interval)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Keep running and recompute every N seconds (default: once)")
+
+    def handle(self, *args, **options):
+        # numpy is only needed here, not by the web processes
+        from Thangka_gallary import trending
+
+        while True:
+            started = time.monotonic()
+            total, written = trending.compute()
+            if written:
+                # trending feeds are cached per catalog generation
+                bump_catalog_generation()
+            self.stdout.write(f"Scored {total} artworks, {written} changed, "
+                              f"in {(time.monotonic() - started) * 1000:.0f} ms")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
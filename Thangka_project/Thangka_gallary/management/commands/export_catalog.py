@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+import resource
+import sys
+import time
+
+from Thangka_gallary.exports import CHUNK_SIZE, FORMATS, export_stream, parse_since
+
+
+class Command(BaseCommand):
+    help = ("Stream the artwork catalog to a CSV or JSONL file (gzipped when the name ends "
+            "in .gz); --since exports only what changed after that moment, deletions included "
+            "(see Thangka_gallary/exports.py)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help="file name, or - for stdout")
+        parser.add_argument('--format', choices=sorted(FORMATS),
+                            help="default: from the file name, else csv")
+        parser.add_argument('--since', help="ISO date/datetime of the previous export's 'until'")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        output = options['output']
+        name = output[:-3] if output.endswith('.gz') else output
+        fmt = options['format'] or ('jsonl' if name.endswith('.jsonl') else 'csv')
+        compress = output.endswith('.gz')
+        try:
+            since = parse_since(options['since'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        until = timezone.now()
+
+        started = time.perf_counter()
+        written = 0
+        f = sys.stdout.buffer if output == '-' else open(output, 'wb')
+        try:
+            for block in export_stream(fmt, since, until, compress, options['chunk_size']):
+                f.write(block)
+                written += len(block)
+        finally:
+            if f is not sys.stdout.buffer:
+                f.close()
+
+        elapsed = time.perf_counter() - started
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        # progress goes to stderr so that `-` output stays clean
+        self.stderr.write(f"{written / 1e6:.1f} MB in {elapsed:.2f}s, peak RSS {peak_mb:.0f} MB")
+        self.stderr.write(f"Next incremental export: --since {until.isoformat()}")
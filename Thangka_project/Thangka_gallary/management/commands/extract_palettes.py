@@ -0,0 +1,67 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+import os
+import time
+
+from Thangka_gallary.caching import bump_catalog_generation
+from Thangka_gallary.models import ArtworkImage
+from Thangka_gallary.parallel import local_path, process_pool
+
+
+class Command(BaseCommand):
+    help = ("Extract the dominant-colour palette of every artwork image that has none yet "
+            "and rebuild its search-by-colour index rows")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Recompute images that already have a palette or were marked unreadable")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                            help="processes for decoding and clustering")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        # numpy is only needed by the workers and here, not by the web processes
+        from Thangka_gallary import palette
+
+        images = ArtworkImage.objects.exclude(image='').order_by('pk')
+        if not options['all']:
+            images = images.filter(palette='')
+        pending = list(images.values_list('pk', 'artwork_id', 'image'))
+
+        started = time.monotonic()
+        done = unreadable = 0
+        with process_pool(options['workers']) as pool:
+            for start in range(0, len(pending), options['batch_size']):
+                batch = pending[start:start + options['batch_size']]
+                paths = [local_path(name) for _, _, name in batch]
+                local = [path for path in paths if path]
+                extracted = iter(pool.map(palette.extract_file, local, chunksize=8))
+
+                palettes = {}  # None for an unreadable (or missing) image: marked, so the next run skips it
+                for (pk, artwork_id, name), path in zip(batch, paths):
+                    result = next(extracted) if path else self.extract_stored(palette, name)
+                    unreadable += result is None
+                    palettes[pk] = (artwork_id, result)
+
+                with transaction.atomic():
+                    ArtworkImage.objects.bulk_update(
+                        [ArtworkImage(pk=pk, palette=palette.dumps(colours)) for pk, (_, colours) in palettes.items()],
+                        ['palette'], batch_size=500)
+                    palette.save_colors({pk: (artwork_id, colours or [])
+                                         for pk, (artwork_id, colours) in palettes.items()})
+                done += len(palettes)
+                self.stdout.write(f"  {start + len(batch)}/{len(pending)} images")
+
+        if done > unreadable:
+            bump_catalog_generation()
+        self.stdout.write(self.style.SUCCESS(
+            f"Extracted {done - unreadable} palettes ({unreadable} unreadable) in {time.monotonic() - started:.1f} s"))
+
+    def extract_stored(self, palette, name):
+        # remote storage: read here, a missing file counts as unreadable
+        try:
+            with default_storage.open(name) as f:
+                return palette.extract_file(f)
+        except OSError:
+            return None
@@ -0,0 +1,107 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import transaction
+import json
+import os
+import time
+
+from Thangka_gallary.models import ArtworkImage
+from Thangka_gallary.parallel import local_path, process_pool
+from Thangka_gallary.perceptual import DEFAULT_DISTANCE, HashIndex, dhash_file, hashes_changed
+
+
+class Command(BaseCommand):
+    help = ("Hash every artwork image that has no perceptual hash yet, then group the library "
+            "into clusters of near-duplicate images")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--distance', type=int, default=DEFAULT_DISTANCE,
+                            help="Max Hamming distance (of 64 bits) between near-duplicates (default: %(default)s)")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                            help="processes for hashing images")
+        parser.add_argument('--output', help="write the clusters to this JSONL file")
+        parser.add_argument('--include-same-artwork', action='store_true',
+                            help="also report duplicates between images of one artwork")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        hashed, unreadable = self.backfill(options['workers'])
+        self.stdout.write(f"Hashed {hashed} images ({unreadable} unreadable) "
+                          f"in {time.monotonic() - started:.1f} s")
+
+        started = time.monotonic()
+        rows = list(ArtworkImage.objects.filter(dhash__isnull=False).order_by('pk')
+                    .values_list('pk', 'dhash', 'artwork_id', 'image'))
+        clusters = self.cluster(rows, options['distance'], options['include_same_artwork'])
+        self.stdout.write(f"{len(clusters)} clusters of near-duplicates among {len(rows)} images "
+                          f"in {(time.monotonic() - started) * 1000:.0f} ms")
+
+        output = open(options['output'], 'w') if options['output'] else None
+        try:
+            for cluster in clusters:
+                if output:
+                    output.write(json.dumps(cluster) + '\n')
+                else:
+                    members = ', '.join(f"image {m['image_id']} (artwork {m['artwork_id']})"
+                                        for m in cluster['images'])
+                    self.stdout.write(f"  max distance {cluster['max_distance']}: {members}")
+        finally:
+            if output:
+                output.close()
+
+    def backfill(self, workers):
+        pending = list(ArtworkImage.objects.filter(dhash__isnull=True).exclude(image='')
+                       .values_list('pk', 'image'))
+        if not pending:
+            return 0, 0
+        local = [(pk, local_path(name)) for pk, name in pending]
+        values = {}
+        with process_pool(workers) as pool:
+            paths = [(pk, path) for pk, path in local if path]
+            for (pk, _), value in zip(paths, pool.map(dhash_file, [path for _, path in paths], chunksize=16)):
+                values[pk] = value
+        for (pk, path), (_, name) in zip(local, pending):
+            if path is None:
+                with default_storage.open(name) as f:
+                    values[pk] = dhash_file(f)
+
+        hashed = [ArtworkImage(pk=pk, dhash=value) for pk, value in values.items() if value is not None]
+        with transaction.atomic():
+            ArtworkImage.objects.bulk_update(hashed, ['dhash'], batch_size=500)
+        if hashed:
+            hashes_changed()  # the running servers' indexes only follow new ids
+        return len(hashed), len(values) - len(hashed)
+
+    def cluster(self, rows, max_distance, include_same_artwork):
+        """Connected components of the "within max_distance" graph, largest first."""
+        ids = [row[0] for row in rows]
+        index = HashIndex(ids, [row[1] for row in rows])
+        artwork_of = {row[0]: row[2] for row in rows}
+        parent = {pk: pk for pk in ids}
+
+        def root(pk):
+            while parent[pk] != pk:
+                parent[pk] = parent[parent[pk]]
+                pk = parent[pk]
+            return pk
+
+        worst = {}
+        for pk, value, artwork_id, _ in rows:
+            for other, d in index.search(value, max_distance):
+                if other <= pk or (not include_same_artwork and artwork_of[other] == artwork_id):
+                    continue
+                a, b = root(pk), root(other)
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+                worst[pk] = max(worst.get(pk, 0), d)
+                worst[other] = max(worst.get(other, 0), d)
+
+        groups = {}
+        for pk, _, artwork_id, name in rows:
+            if pk in worst:
+                groups.setdefault(root(pk), []).append(
+                    {'image_id': pk, 'artwork_id': artwork_id, 'image': name})
+        clusters = [{'images': members, 'max_distance': max(worst[m['image_id']] for m in members)}
+                    for members in groups.values()]
+        clusters.sort(key=lambda c: (-len(c['images']), c['images'][0]['image_id']))
+        return clusters
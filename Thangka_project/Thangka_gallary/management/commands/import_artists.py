@@ -0,0 +1,238 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.validators import validate_email
+from django.db import IntegrityError, transaction
+from concurrent.futures import ThreadPoolExecutor
+from Thangka_gallary.models import Artist
+from Thangka_gallary.caching import bump_catalog_generation
+from Thangka_gallary.parallel import process_pool
+import csv
+import io
+import json
+import os
+import time
+
+User = get_user_model()
+
+ARTIST_FIELDS = ('name', 'bio', 'website', 'twitter', 'instagram')
+AVATAR_MAX_SIZE = 512  # px, longest side
+RESULT_COLUMNS = ('line', 'username', 'status', 'user_id', 'detail')
+
+
+def read_rows(path):
+    """
+    Yield (line_number, dict) from a .csv (with a header row) or .jsonl file;
+    a line that can't be read gives (line_number, reason) instead.
+    """
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith('.jsonl'):
+            for number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError as exc:
+                    yield number, f"invalid JSON: {exc.msg} (column {exc.colno})"
+                    continue
+                yield number, row if isinstance(row, dict) else "not a JSON object"
+        else:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def process_avatar(source):
+    """Shrink an avatar to AVATAR_MAX_SIZE and store it; returns the storage name."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((AVATAR_MAX_SIZE, AVATAR_MAX_SIZE))
+        if image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85, optimize=True)
+    name = os.path.splitext(os.path.basename(source))[0] + '.jpg'
+    return default_storage.save(f'artists/avatars/{name}', ContentFile(buffer.getvalue()))
+
+
+class Command(BaseCommand):
+    help = ("Create artist accounts in bulk from a CSV or JSONL file (columns: username, email, "
+            "password, name, bio, website, twitter, instagram, avatar) and write a per-row result file")
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--results', help="result CSV (default: <input>.results.csv)")
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2,
+                            help="processes for password hashing")
+        parser.add_argument('--avatar-workers', type=int, default=8,
+                            help="threads for avatar resizing and storage")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if not os.path.isfile(path):
+            raise CommandError(f"File not found: {path}")
+        results_path = options['results'] or os.path.splitext(path)[0] + '.results.csv'
+        base_dir = os.path.dirname(os.path.abspath(path))
+        started = time.perf_counter()
+        timings = {}
+
+        results = {}  # line -> result dict
+        entries = self.validate(read_rows(path), results)
+
+        # 1. password hashing is deliberately slow, so spread it over processes
+        stage = time.perf_counter()
+        passwords = [entry['password'] for entry in entries]
+        if any(passwords):
+            chunksize = max(1, len(passwords) // (options['workers'] * 4))
+            # make_password lives in django.contrib.auth.hashers, safe to import in a worker
+            with process_pool(options['workers']) as pool:
+                hashes = list(pool.map(make_password, passwords, chunksize=chunksize))
+        else:
+            hashes = [make_password(None) for _ in passwords]
+        timings['hash'] = time.perf_counter() - stage
+
+        # 2. avatars: decoding and resizing release the GIL, storage is I/O
+        stage = time.perf_counter()
+        with ThreadPoolExecutor(options['avatar_workers']) as pool:
+            futures = {
+                entry['line']: pool.submit(process_avatar, os.path.join(base_dir, entry['avatar']))
+                for entry in entries if entry['avatar']
+            }
+            avatars = {}
+            for line, future in futures.items():
+                try:
+                    avatars[line] = future.result()
+                except Exception as exc:
+                    results[line]['detail'] = f"avatar skipped: {exc}"
+        timings['avatars'] = time.perf_counter() - stage
+
+        # 3. bulk inserts; bulk_create sends no post_save, so create_artist_profile
+        # does not add a second Artist per user
+        stage = time.perf_counter()
+        size = options['batch_size']
+        try:
+            for start in range(0, len(entries), size):
+                batch = entries[start:start + size]
+                users = [
+                    User(username=entry['username'], email=entry['email'], password=password)
+                    for entry, password in zip(batch, hashes[start:start + size])
+                ]
+                self.insert(batch, users, avatars, results)
+        finally:
+            # avatars were stored (and their blobs counted) before their rows existed
+            self.release_avatars(avatars, results)
+        timings['insert'] = time.perf_counter() - stage
+
+        created = sum(result['status'] == 'created' for result in results.values())
+        if created:
+            # artist names appear in the public feeds
+            bump_catalog_generation()
+
+        with open(results_path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, RESULT_COLUMNS)
+            writer.writeheader()
+            for line in sorted(results):
+                writer.writerow(results[line])
+
+        elapsed = time.perf_counter() - started
+        counts = {}
+        for result in results.values():
+            counts[result['status']] = counts.get(result['status'], 0) + 1
+        self.stdout.write(', '.join(f"{status}={n}" for status, n in sorted(counts.items())))
+        self.stdout.write(' '.join(f"{name}={seconds:.2f}s" for name, seconds in timings.items()))
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(results)} rows in {elapsed:.2f}s ({len(results) / elapsed:.0f} rows/s, "
+            f"{created / elapsed:.0f} accounts/s). Results: {results_path}"))
+
+    def validate(self, rows, results):
+        """Check rows and return the ones to import; others get a result straight away."""
+        entries = []
+        seen = set()
+        for line, row in rows:
+            if isinstance(row, str):
+                results[line] = {'line': line, 'username': '', 'status': 'error', 'user_id': '', 'detail': row}
+                continue
+            row = {key: '' if value is None else str(value).strip() for key, value in row.items() if key}
+            username = row.get('username', '')
+            results[line] = {'line': line, 'username': username, 'status': 'error', 'user_id': '', 'detail': ''}
+            try:
+                if not username:
+                    raise ValidationError("username is required")
+                User.username_validator(username)
+                if len(username) > User._meta.get_field('username').max_length:
+                    raise ValidationError("username is too long")
+                if row.get('email'):
+                    validate_email(row['email'])
+                if row.get('password'):
+                    validate_password(row['password'], User(username=username, email=row.get('email', '')))
+            except ValidationError as exc:
+                results[line]['detail'] = '; '.join(exc.messages)
+                continue
+            if username in seen:
+                results[line]['detail'] = "duplicate username in file"
+                continue
+            seen.add(username)
+            entries.append({
+                'line': line,
+                'username': username,
+                'email': row.get('email', ''),
+                'password': row.get('password') or None,
+                'avatar': row.get('avatar', ''),
+                'artist': {field: row.get(field) or '' for field in ARTIST_FIELDS},
+            })
+
+        existing = set()
+        names = [entry['username'] for entry in entries]
+        for start in range(0, len(names), 500):
+            existing.update(User.objects.using('default').filter(
+                username__in=names[start:start + 500]).values_list('username', flat=True))
+        for entry in entries:
+            if entry['username'] in existing:
+                results[entry['line']].update(status='skipped', detail="username already exists")
+        return [entry for entry in entries if entry['username'] not in existing]
+
+    def insert(self, batch, users, avatars, results):
+        try:
+            with transaction.atomic():
+                self.create_rows(batch, users, avatars)
+        except IntegrityError:
+            # someone registered one of these names meanwhile: go row by row
+            for entry, user in zip(batch, users):
+                user.pk = None
+                try:
+                    with transaction.atomic():
+                        self.create_rows([entry], [user], avatars)
+                except IntegrityError as exc:
+                    results[entry['line']].update(status='error', detail=str(exc))
+                else:
+                    results[entry['line']].update(status='created', user_id=user.pk)
+            return
+        for entry, user in zip(batch, users):
+            results[entry['line']].update(status='created', user_id=user.pk)
+
+    def release_avatars(self, avatars, results):
+        """Give back the stored avatars (blob references) of rows that weren't created."""
+        for line, name in avatars.items():
+            if results[line]['status'] != 'created':
+                default_storage.delete(name)
+
+    def create_rows(self, batch, users, avatars):
+        User.objects.bulk_create(users)
+        if any(user.pk is None for user in users):
+            # backends without RETURNING (MySQL) don't set primary keys
+            ids = dict(User.objects.using('default').filter(
+                username__in=[user.username for user in users]).values_list('username', 'id'))
+            for user in users:
+                user.pk = ids[user.username]
+        Artist.objects.bulk_create(
+            Artist(user=user, avatar=avatars.get(entry['line']),
+                   **{**entry['artist'], 'name': entry['artist']['name'] or user.username})
+            for entry, user in zip(batch, users)
+        )
@@ -3,6 +3,7 @@ from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files import File
 from Thangka_gallary.models import Artwork, ArtworkImage, Artist, Category
+from Thangka_gallary.perceptual import dhash_file
 import os
 
 User = get_user_model()
@@ -10,6 +11,10 @@ User = get_user_model()
 class Command(BaseCommand):
     help = "Create sample Artwork entries from files placed in MEDIA_ROOT/sample_thangkas/"
 
+    def add_arguments(self, parser):
+        parser.add_argument('--allow-duplicates', action='store_true',
+                            help="Import files even if the same image is already in the library")
+
     def handle(self, *args, **options):
         media_dir = os.path.join(getattr(settings, 'MEDIA_ROOT', ''), 'sample_thangkas')
         if not os.path.isdir(media_dir):
@@ -33,9 +38,17 @@ class Command(BaseCommand):
         # optional: get a category if you have one
         category = Category.objects.first() if 'Category' in globals() else None
 
-        created = 0
+        created = skipped = 0
         for i, fname in enumerate(files, start=1):
             fp = os.path.join(media_dir, fname)
+            # running the command twice must not import everything twice
+            value = dhash_file(fp)
+            if value is not None and not options['allow_duplicates']:
+                existing = ArtworkImage.objects.filter(dhash=value).values_list('artwork_id', flat=True).first()
+                if existing:
+                    skipped += 1
+                    self.stdout.write(f"Skipped {fname}: already imported as artwork #{existing}")
+                    continue
             title = os.path.splitext(fname)[0].replace('_',' ').title()[:60]
             description = f"Sample Thangka {i} imported from sample_thangkas"
             art = Artwork.objects.create(
@@ -52,4 +65,4 @@ class Command(BaseCommand):
             created += 1
             self.stdout.write(f"Created artwork: {title}")
 
-        self.stdout.write(self.style.SUCCESS(f"Imported {created} artworks."))
\ No newline at end of file
+        self.stdout.write(self.style.SUCCESS(f"Imported {created} artworks, skipped {skipped} duplicates."))
\ No newline at end of file
@@ -0,0 +1,114 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+import time
+
+from Thangka_gallary.blobstore import ContentAddressedStorage, PREFIX, is_blob_name
+from Thangka_gallary.caching import bump_catalog_generation
+from Thangka_gallary.models import Artist, ArtworkImage, MediaBlob
+
+# every file field stored in default_storage
+FIELDS = [(ArtworkImage, 'image'), (Artist, 'avatar')]
+
+
+class Command(BaseCommand):
+    help = ("Move media saved under upload_to names into the content-addressed blob store "
+            "(identical files end up as one blob), or with --recount rebuild the reference counts "
+            "from the database and remove blobs nothing points at (run --recount while no uploads are in flight)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--keep-originals', action='store_true',
+                            help="Leave the old files in place after their rows point at blobs")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be done")
+        parser.add_argument('--recount', action='store_true')
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError("The default storage is not content-addressed (see STORAGES in settings)")
+        if options['recount']:
+            return self.recount(options['dry_run'])
+
+        started = time.monotonic()
+        moved, missing, originals = 0, 0, set()
+        for model, field in FIELDS:
+            pending = list(model.objects.exclude(**{field: ''}).exclude(**{field: None})
+                           .exclude(**{f'{field}__startswith': f'{PREFIX}/'})
+                           .order_by('pk').values_list('pk', field))
+            self.stdout.write(f"{model.__name__}.{field}: {len(pending)} files to move")
+            if options['dry_run']:
+                continue
+            for start in range(0, len(pending), options['batch_size']):
+                batch = [(pk, name) for pk, name in pending[start:start + options['batch_size']]
+                         if default_storage.exists(name)]
+                missing += min(options['batch_size'], len(pending) - start) - len(batch)
+                files = [default_storage.open(name) for _, name in batch]
+                try:
+                    with transaction.atomic():
+                        names = default_storage.save_many(list(zip((name for _, name in batch), files)))
+                        model.objects.bulk_update([model(pk=pk, **{field: new}) for (pk, _), new in zip(batch, names)],
+                                                  [field], batch_size=500)
+                finally:
+                    for f in files:
+                        f.close()
+                moved += len(batch)
+                originals.update(name for _, name in batch)
+                self.stdout.write(f"  {start + len(batch)}/{len(pending)}")
+
+        removed = 0
+        if originals and not options['keep_originals']:
+            # an old name may still be in use by a row added since (several rows could share it)
+            in_use = set()
+            for model, field in FIELDS:
+                in_use.update(model.objects.filter(**{f'{field}__in': originals}).values_list(field, flat=True))
+            for name in originals - in_use:
+                default_storage.delete(name)
+                removed += 1
+        if moved:
+            bump_catalog_generation()  # image URLs in the cached feeds changed
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} files into {MediaBlob.objects.count()} blobs ({missing} missing on disk), "
+            f"removed {removed} originals, in {time.monotonic() - started:.1f} s"))
+
+    def recount(self, dry_run):
+        counts = {}
+        for model, field in FIELDS:
+            rows = (model.objects.filter(**{f'{field}__startswith': f'{PREFIX}/'})
+                    .values_list(field).annotate(n=Count('pk')).order_by())
+            for name, n in rows:
+                if is_blob_name(name):
+                    counts[name] = counts.get(name, 0) + n
+
+        fixed = 0
+        stored = dict(MediaBlob.objects.values_list('name', 'refs'))
+        for name, n in counts.items():
+            if stored.get(name) != n:
+                fixed += 1
+                if not dry_run:
+                    size = default_storage.size(name) if default_storage.exists(name) else 0
+                    MediaBlob.objects.update_or_create(name=name, defaults={'refs': n, 'size': size})
+
+        # blobs on disk (or rows) that no field points at, left by failed or rolled-back saves
+        unreferenced = set(stored) - set(counts)
+        for top in self.listdir(PREFIX)[0]:
+            if top == 'tmp':
+                continue
+            for middle in self.listdir(f'{PREFIX}/{top}')[0]:
+                for name in self.listdir(f'{PREFIX}/{top}/{middle}')[1]:
+                    name = f'{PREFIX}/{top}/{middle}/{name}'
+                    if is_blob_name(name) and name not in counts:
+                        unreferenced.add(name)
+        if not dry_run:
+            for name in unreferenced:
+                MediaBlob.objects.update_or_create(name=name, defaults={'refs': 0, 'size': 0})
+                default_storage.collect(name)
+        self.stdout.write(self.style.SUCCESS(
+            f"{len(counts)} referenced blobs, {fixed} counts {'wrong' if dry_run else 'fixed'}, "
+            f"{len(unreferenced)} unreferenced blobs {'found' if dry_run else 'removed'}"))
+
+    def listdir(self, path):
+        try:
+            return default_storage.listdir(path)
+        except FileNotFoundError:
+            return [], []
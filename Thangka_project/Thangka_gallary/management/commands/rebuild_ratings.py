@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+import time
+
+from Thangka_gallary import ratings
+
+
+class Command(BaseCommand):
+    help = ("Recompute Artwork.rating_* from the reviews; needed only after bulk review "
+            "changes that bypass signals (queryset.update(), raw SQL, imports)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('artwork_ids', nargs='*', type=int, help="default: every artwork")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        ratings.rebuild(options['artwork_ids'] or None)
+        self.stdout.write(self.style.SUCCESS(
+            f"Rating aggregates rebuilt in {(time.monotonic() - started) * 1000:.0f} ms"))
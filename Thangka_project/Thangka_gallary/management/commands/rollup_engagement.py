@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+import time
+
+from Thangka_gallary import analytics
+
+
+class Command(BaseCommand):
+    help = ("Add the views, likes, bookmarks, reviews and follows since the last run to the hourly "
+            "and daily engagement rollups (run from cron, or keep running with --interval)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Keep running and roll up every N seconds (default: once)")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.monotonic()
+            summary = analytics.rollup()
+            counted = ', '.join(f"{summary[metric]} {metric}" for metric in analytics.METRICS)
+            self.stdout.write(f"Rolled up {counted} into {summary['rows']} rows "
+                              f"in {(time.monotonic() - started) * 1000:.0f} ms")
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
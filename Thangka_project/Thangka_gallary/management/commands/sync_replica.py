@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.conf import settings
+from django.db import connections
+import os
+import sqlite3
+import time
+
+
+class Command(BaseCommand):
+    help = "Copy the primary SQLite database into the read-replica file (local stand-in for replication)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=0,
+                            help="Keep running and re-sync every N seconds (default: sync once)")
+
+    def handle(self, *args, **options):
+        primary = connections['default'].settings_dict
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError("sync_replica only knows how to copy SQLite databases.")
+
+        source = str(primary['NAME'])
+        target = str(settings.REPLICA_DB_PATH)
+        interval = options['interval']
+
+        while True:
+            started = time.monotonic()
+            self.sync(source, target)
+            self.stdout.write(f"Replica refreshed in {(time.monotonic() - started) * 1000:.0f} ms -> {target}")
+            if not interval:
+                break
+            time.sleep(interval)
+
+        if 'replica' not in settings.DATABASES:
+            self.stdout.write(self.style.WARNING("Replica file created; restart the server to start routing reads to it."))
+
+    def sync(self, source, target):
+        # back up into a temp file and swap it in atomically, so readers never
+        # see a half-written replica (each request opens a fresh connection)
+        tmp = f"{target}.tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        src = sqlite3.connect(source)
+        dst = sqlite3.connect(tmp)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+        os.replace(tmp, target)
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+import time
+
+from Thangka_gallary import warmup
+
+
+class Command(BaseCommand):
+    help = ("Warm up after a deploy: compile the templates, import the views, and prime the shared "
+            "cache with the first pages of every public feed and the most-viewed artworks")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--feed-pages', type=int, default=settings.WARMUP_FEED_PAGES,
+                            help="Pages of each feed to build (default: %(default)s)")
+        parser.add_argument('--top-artworks', type=int, default=settings.WARMUP_TOP_ARTWORKS,
+                            help="Most-viewed artworks to prime (default: %(default)s)")
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+
+        def report(name, step):
+            self.stdout.write(f"  {name:<12} {step['count']:6}  {step['ms']:7} ms")
+
+        warmup.run(options['feed_pages'], options['top_artworks'], on_step=report)
+        self.stdout.write(self.style.SUCCESS(f"Warmed up in {time.monotonic() - started:.1f} s"))
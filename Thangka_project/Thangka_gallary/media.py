@@ -0,0 +1,197 @@
+"""
+Serving uploaded files (MEDIA_ROOT) in production.
+
+* strong ETag + Last-Modified, answered with 304 on If-None-Match / If-Modified-Since
+* single byte ranges (206 / 416, honouring If-Range) for very large scans
+* file bytes go out through FileResponse, so servers with wsgi.file_wrapper
+  (gunicorn, uWSGI) transfer them with sendfile() instead of copying in Python
+* optional X-Accel-Redirect (nginx) / X-Sendfile (Apache, lighttpd) mode,
+  where Django only checks the request and the front proxy sends the file
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+from .blobstore import is_blob_name
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# unfinished chunked uploads were kept here before CHUNKED_UPLOAD_DIR moved out of MEDIA_ROOT
+PRIVATE_MEDIA_DIRS = ('incoming',)
+
+# not in every platform's mime.types; used for the published feeds
+mimetypes.add_type('application/rss+xml', '.rss')
+mimetypes.add_type('application/atom+xml', '.atom')
+
+
+class RangeFile:
+    """
+    Read-only window over an open file, for 206 responses. It keeps fileno()
+    and leaves the file positioned at the window start, so sendfile-capable
+    servers still do a zero-copy transfer bounded by Content-Length.
+    """
+
+    def __init__(self, f, start, length):
+        self._f = f
+        self._f.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size is None or size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self._f.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def fileno(self):
+        return self._f.fileno()
+
+    def close(self):
+        self._f.close()
+
+
+def file_etag(stat):
+    # size + mtime in ns identify the bytes on disk without reading them
+    return '"%x-%x"' % (stat.st_size, stat.st_mtime_ns)
+
+
+def parse_range(header, size):
+    """
+    Return (start, end) inclusive for a single satisfiable byte range, None
+    when the header should be ignored (absent, malformed or multi-range) and
+    False when it is unsatisfiable.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def _if_range_allows(request, etag, mtime):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    date = parse_http_date_safe(if_range)
+    return date is not None and date >= mtime
+
+
+def _accel_response(path, relative, content_type):
+    response = HttpResponse(content_type=content_type)
+    mode = settings.MEDIA_ACCEL_REDIRECT
+    if mode == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(relative)
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def serve_file(request, root, relative, max_age=None, immutable=False):
+    try:
+        path = safe_join(root, relative)
+    except SuspiciousFileOperation:
+        raise Http404("File not found")
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise Http404("File not found")
+    if not os.path.isfile(path):
+        raise Http404("File not found")
+
+    etag = file_etag(stat)
+    mtime = int(stat.st_mtime)
+    if max_age is None:
+        max_age = getattr(settings, 'MEDIA_CACHE_SECONDS', 86400)
+
+    def finish(response):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(mtime)
+        response['Accept-Ranges'] = 'bytes'
+        if immutable:
+            patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+        else:
+            patch_cache_control(response, public=True, max_age=max_age)
+        return response
+
+    not_modified = get_conditional_response(request, etag=etag, last_modified=mtime)
+    if not_modified is not None:
+        return finish(not_modified)
+
+    content_type, encoding = mimetypes.guess_type(path)
+    if encoding == 'gzip':
+        # a .gz file is sent as-is, not as gzip-encoded content_type
+        content_type = 'application/gzip'
+    content_type = content_type or 'application/octet-stream'
+    if getattr(settings, 'MEDIA_ACCEL_REDIRECT', None):
+        return finish(_accel_response(path, relative, content_type))
+
+    size = stat.st_size
+    byte_range = None
+    if _if_range_allows(request, etag, mtime):
+        byte_range = parse_range(request.META.get('HTTP_RANGE', ''), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return finish(response)
+
+    f = open(path, 'rb')
+    if byte_range is None:
+        response = FileResponse(f, content_type=content_type)
+        del response['Content-Disposition']
+        return finish(response)
+
+    start, end = byte_range
+    length = end - start + 1
+    response = FileResponse(RangeFile(f, start, length), status=206, content_type=content_type)
+    response['Content-Length'] = str(length)
+    response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    return finish(response)
+
+
+def _is_private_media(path):
+    if os.path.normpath(path).split(os.sep)[0] in PRIVATE_MEDIA_DIRS:
+        return True
+    # wherever CHUNKED_UPLOAD_DIR is configured, part files are never served
+    parts = os.path.realpath(settings.CHUNKED_UPLOAD_DIR)
+    target = os.path.realpath(os.path.join(settings.MEDIA_ROOT, path))
+    return target == parts or target.startswith(parts + os.sep)
+
+
+@require_safe
+def serve_media(request, path):
+    """Production route for files under MEDIA_ROOT, other than unfinished uploads."""
+    if _is_private_media(path):
+        raise Http404("File not found")
+    # content-addressed names never change meaning (blobstore.py)
+    return serve_file(request, settings.MEDIA_ROOT, path, immutable=is_blob_name(path))
+
+
+@require_safe
+def serve_published(request, path):
+    """Sitemaps and feeds written by build_sitemaps / build_feeds (publishing.py)."""
+    return serve_file(request, settings.PUBLISHED_ROOT, path, max_age=settings.PUBLISHED_CACHE_SECONDS)
@@ -0,0 +1,171 @@
+import mimetypes
+import os
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, JsonResponse
+from django.utils.deprecation import MiddlewareMixin
+from django.utils._os import safe_join
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from .routers import pin_to_primary, unpin
+from .throttle import check_request
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class ReplicaPinMiddleware:
+    """
+    Keep a user's reads on the primary right after they write.
+
+    Unsafe requests (POST/PUT/...) read from the primary for their whole
+    duration and leave a short-lived cookie behind; while that cookie is
+    present the following requests from the same browser are pinned to the
+    primary as well, so users always see their own writes even if the replica
+    has not caught up yet.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def _should_pin(self, request):
+        cookie = getattr(settings, 'REPLICA_PIN_COOKIE', 'db_pin')
+        return request.method not in SAFE_METHODS or cookie in request.COOKIES
+
+    def _remember_write(self, request, response):
+        if request.method in SAFE_METHODS:
+            return response
+        response.set_cookie(
+            getattr(settings, 'REPLICA_PIN_COOKIE', 'db_pin'), '1',
+            max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 15),
+            httponly=True, samesite='Lax',
+        )
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = pin_to_primary(self._should_pin(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            unpin(token)
+        return self._remember_write(request, response)
+
+    async def __acall__(self, request):
+        token = pin_to_primary(self._should_pin(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            unpin(token)
+        return self._remember_write(request, response)
+
+
+def accepted_encodings(header):
+    """Content codings the client accepts (q > 0), from an Accept-Encoding header."""
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        q = params.strip()
+        if q.startswith('q='):
+            try:
+                if float(q[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecompressedStaticMiddleware:
+    """
+    Serve files collected into STATIC_ROOT, preferring the ``.br``/``.gz``
+    copies written by CompressedManifestStaticFilesStorage when the client
+    accepts them. Content-hashed names never change, so they are sent with a
+    one-year ``immutable`` Cache-Control; anything else gets a short max-age.
+    """
+    sync_capable = True
+    async_capable = True
+
+    ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self._hashed_names = None
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def hashed_names(self):
+        if self._hashed_names is None:
+            self._hashed_names = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+        return self._hashed_names
+
+    def static_response(self, request):
+        prefix = settings.STATIC_URL
+        if request.method not in ('GET', 'HEAD') or not request.path.startswith(prefix):
+            return None
+        name = request.path[len(prefix):]
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        served, coding = path, None
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        for candidate, suffix in self.ENCODINGS:
+            if candidate in accepted and os.path.isfile(path + suffix):
+                served, coding = path + suffix, candidate
+                break
+
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        response = FileResponse(open(served, 'rb'), content_type=content_type)
+        del response['Content-Disposition']
+        if coding:
+            response['Content-Encoding'] = coding
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if name in self.hashed_names():
+            patch_cache_control(response, public=True, max_age=31536000, immutable=True)
+        else:
+            patch_cache_control(response, public=True, max_age=60)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.static_response(request)
+        if response is None:
+            response = self.get_response(request)
+        return response
+
+    async def __acall__(self, request):
+        response = self.static_response(request)
+        if response is None:
+            response = await self.get_response(request)
+        return response
+
+
+class RateLimitMiddleware(MiddlewareMixin):
+    """
+    Answer requests to the URL names in settings.RATE_LIMITS that are over
+    their per-user or per-IP budget with a 429 and Retry-After (see throttle.py).
+    """
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        match = request.resolver_match
+        if match is None or match.url_name not in settings.RATE_LIMITS:
+            return None
+        retry_after = check_request(request, match.url_name)
+        if retry_after is None:
+            return None
+        response = JsonResponse({'status': 'error', 'message': 'Too many requests'}, status=429)
+        response['Retry-After'] = str(retry_after)
+        return response
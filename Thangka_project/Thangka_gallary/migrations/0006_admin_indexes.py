@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:47
+
+import django.db.models.functions.text
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Thangka_gallary', '0005_notification'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='artwork',
+            index=models.Index(fields=['created_at'], name='artwork_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='artwork',
+            index=models.Index(django.db.models.functions.text.Lower('title'), name='artwork_title_lower_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(fields=['created_at'], name='notification_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['created_at'], name='review_created_idx'),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 10:53
+
+from django.db import migrations, models
+
+
+def backfill_updated_at(apps, schema_editor):
+    # best guess for rows that predate the column
+    Artwork = apps.get_model('Thangka_gallary', 'Artwork')
+    Artwork.objects.update(updated_at=models.F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Thangka_gallary', '0006_admin_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artwork',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='artwork',
+            index=models.Index(fields=['updated_at', 'id'], name='artwork_updated_idx'),
+        ),
+    ]
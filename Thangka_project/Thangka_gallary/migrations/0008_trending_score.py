@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Thangka_gallary', '0007_artwork_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingState',
+            fields=[
+                ('artwork', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='trending_state', serialize=False, to='Thangka_gallary.artwork')),
+                ('views_seen', models.PositiveIntegerField(default=0)),
+                ('views_mass', models.FloatField(default=0)),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='artwork',
+            name='trending_score',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='artwork',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-trending_score', '-id'], name='artwork_trending_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='artwork',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['category', '-trending_score', '-id'], name='artwork_cat_trending_idx'),
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:07
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_ratings(apps, schema_editor):
+    Artwork = apps.get_model('Thangka_gallary', 'Artwork')
+    Review = apps.get_model('Thangka_gallary', 'Review')
+    fields = {f'rating_{r}': models.Count('id', filter=models.Q(rating=r)) for r in range(1, 6)}
+    db = schema_editor.connection.alias
+    rows = Review.objects.using(db).filter(rating__in=range(1, 6)).order_by().values('artwork_id').annotate(**fields)
+    for row in rows.iterator():
+        histogram = {field: row[field] for field in fields}
+        count = sum(histogram.values())
+        Artwork.objects.using(db).filter(pk=row['artwork_id']).update(
+            rating_count=count,
+            rating_avg=sum(row[f'rating_{r}'] * r for r in range(1, 6)) / count,
+            **histogram)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Thangka_gallary', '0008_trending_score'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artwork',
+            name='rating_1',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='artwork',
+            name='rating_2',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='artwork',
+            name='rating_3',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='artwork',
+            name='rating_4',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='artwork',
+            name='rating_5',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='artwork',
+            name='rating_avg',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='artwork',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['artwork', '-created_at', '-id'], name='review_artwork_recent_idx'),
+        ),
+    ]
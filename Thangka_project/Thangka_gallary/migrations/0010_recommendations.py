@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:14
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Thangka_gallary', '0009_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArtworkSimilarity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.FloatField()),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='artworklike',
+            index=models.Index(fields=['user', '-created_at'], name='like_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bookmark',
+            index=models.Index(fields=['user', '-created_at'], name='bookmark_user_recent_idx'),
+        ),
+        migrations.AddField(
+            model_name='artworksimilarity',
+            name='artwork',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='similarities', to='Thangka_gallary.artwork'),
+        ),
+        migrations.AddField(
+            model_name='artworksimilarity',
+            name='neighbor',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Thangka_gallary.artwork'),
+        ),
+        migrations.AddIndex(
+            model_name='artworksimilarity',
+            index=models.Index(fields=['artwork', '-score', 'neighbor'], name='similarity_artwork_score_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='artworksimilarity',
+            unique_together={('artwork', 'neighbor')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Thangka_gallary', '0010_recommendations'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artworkimage',
+            name='dhash',
+            field=models.BigIntegerField(blank=True, db_index=True, editable=False, null=True),
+        ),
+    ]
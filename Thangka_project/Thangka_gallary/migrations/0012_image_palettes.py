@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Thangka_gallary', '0011_artworkimage_dhash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='artworkimage',
+            name='palette',
+            field=models.CharField(blank=True, editable=False, max_length=80),
+        ),
+        migrations.CreateModel(
+            name='ImageColor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bin', models.PositiveSmallIntegerField()),
+                ('weight', models.PositiveSmallIntegerField()),
+                ('artwork', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Thangka_gallary.artwork')),
+                ('image', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='colors', to='Thangka_gallary.artworkimage')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bin', 'artwork', 'weight'], name='imagecolor_bin_idx')],
+                'unique_together': {('image', 'bin')},
+            },
+        ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-19 11:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('Thangka_gallary', '0016_name_lower_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RollupViewMark',
+            fields=[
+                ('artwork', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='+', serialize=False, to='Thangka_gallary.artwork')),
+                ('views_seen', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='RollupWatermark',
+            fields=[
+                ('source', models.CharField(max_length=20, primary_key=True, serialize=False)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='EngagementDaily',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('likes', models.PositiveIntegerField(default=0)),
+                ('bookmarks', models.PositiveIntegerField(default=0)),
+                ('reviews', models.PositiveIntegerField(default=0)),
+                ('follows', models.PositiveIntegerField(default=0)),
+                ('day', models.DateField()),
+                ('artist', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Thangka_gallary.artist')),
+                ('artwork', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Thangka_gallary.artwork')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(condition=models.Q(('artwork__isnull', False)), fields=('artwork', 'day'), name='engagement_daily_artwork_uniq'), models.UniqueConstraint(condition=models.Q(('artist__isnull', False)), fields=('artist', 'day'), name='engagement_daily_artist_uniq')],
+            },
+        ),
+        migrations.CreateModel(
+            name='EngagementHourly',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('views', models.PositiveIntegerField(default=0)),
+                ('likes', models.PositiveIntegerField(default=0)),
+                ('bookmarks', models.PositiveIntegerField(default=0)),
+                ('reviews', models.PositiveIntegerField(default=0)),
+                ('follows', models.PositiveIntegerField(default=0)),
+                ('hour', models.DateTimeField()),
+                ('artist', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Thangka_gallary.artist')),
+                ('artwork', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='Thangka_gallary.artwork')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['hour'], name='engagement_hourly_hour_idx')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('artwork__isnull', False)), fields=('artwork', 'hour'), name='engagement_hourly_artwork_uniq'), models.UniqueConstraint(condition=models.Q(('artist__isnull', False)), fields=('artist', 'hour'), name='engagement_hourly_artist_uniq')],
+            },
+        ),
+    ]
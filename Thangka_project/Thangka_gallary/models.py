@@ -1,36 +1,63 @@
+import uuid
+
 from django.contrib.auth.models import User
 from django.db import models
+from django.db.models import Q
+from django.db.models.functions import Lower
+from django.utils import timezone
 from django.utils.text import slugify
 from django.urls import reverse
 
+from .autocomplete import IndexedQuerySet
+from .slugs import SlugQuerySet, save_new
+
+# Categories and tags: slugs allocated on bulk_create, autocomplete indexes invalidated by bulk writes
+class NamedQuerySet(IndexedQuerySet, SlugQuerySet):
+    pass
+
 # Category model
 class Category(models.Model):
     name = models.CharField(max_length=120, unique=True)
     slug = models.SlugField(max_length=140, unique=True, blank=True)
 
+    objects = NamedQuerySet.as_manager()
+
     class Meta:
         ordering = ['name']
+        # autocomplete prefix search on lower(name) (autocomplete.py)
+        indexes = [models.Index(Lower('name'), name='category_name_lower_idx')]
 
     def __str__(self):
         return self.name
 
+    def slug_base(self):
+        return slugify(self.name)
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        if self.slug:
+            return super().save(*args, **kwargs)
+        return save_new(self, super().save, *args, **kwargs)
 
 # Tag model
 class Tag(models.Model):
     name = models.CharField(max_length=50, unique=True)
     slug = models.SlugField(max_length=60, unique=True, blank=True)
 
+    objects = NamedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(Lower('name'), name='tag_name_lower_idx')]
+
     def __str__(self):
         return self.name
 
+    def slug_base(self):
+        return slugify(self.name)
+
     def save(self, *args, **kwargs):
-        if not self.slug:
-            self.slug = slugify(self.name)
-        super().save(*args, **kwargs)
+        if self.slug:
+            return super().save(*args, **kwargs)
+        return save_new(self, super().save, *args, **kwargs)
 
 # Artist model
 class Artist(models.Model):
@@ -42,6 +69,11 @@ class Artist(models.Model):
     twitter = models.CharField(max_length=200, blank=True)
     instagram = models.CharField(max_length=200, blank=True)
 
+    objects = IndexedQuerySet.as_manager()
+
+    class Meta:
+        indexes = [models.Index(Lower('name'), name='artist_name_lower_idx')]
+
     def __str__(self):
         return self.name or (self.user.username if self.user else "Unknown")
 
@@ -64,27 +96,106 @@ class Artwork(models.Model):
     price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     materials = models.CharField(max_length=40, choices=MATERIAL_CHOICES, default='other')
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     year_created = models.PositiveSmallIntegerField(null=True, blank=True)
     is_featured = models.BooleanField(default=False)
     is_published = models.BooleanField(default=True)
     view_count = models.PositiveIntegerField(default=0)
+    # time-decayed engagement, recomputed in batch by `manage.py compute_trending`
+    trending_score = models.FloatField(default=0)
+    # review aggregates, kept current by signals (see ratings.py)
+    rating_count = models.PositiveIntegerField(default=0)
+    rating_avg = models.FloatField(null=True, blank=True)
+    rating_1 = models.PositiveIntegerField(default=0)
+    rating_2 = models.PositiveIntegerField(default=0)
+    rating_3 = models.PositiveIntegerField(default=0)
+    rating_4 = models.PositiveIntegerField(default=0)
+    rating_5 = models.PositiveIntegerField(default=0)
+
+    objects = SlugQuerySet.as_manager()
 
     class Meta:
         ordering = ['-is_featured', '-created_at']
+        indexes = [
+            # admin date hierarchy and changelist ordering
+            models.Index(fields=['created_at'], name='artwork_created_idx'),
+            # admin prefix search on lower(title)
+            models.Index(Lower('title'), name='artwork_title_lower_idx'),
+            # incremental catalog exports (exports.py)
+            models.Index(fields=['updated_at', 'id'], name='artwork_updated_idx'),
+            # trending top-N, site-wide and per category; partial so that the
+            # bare `WHERE is_published` Django emits on SQLite can use them
+            models.Index(fields=['-trending_score', '-id'], condition=Q(is_published=True),
+                         name='artwork_trending_idx'),
+            models.Index(fields=['category', '-trending_score', '-id'], condition=Q(is_published=True),
+                         name='artwork_cat_trending_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
     def get_absolute_url(self):
-        return f"/artwork/{self.id}/"
+        # the slug URL is canonical; /artwork/<id>/ redirects to it
+        if self.slug:
+            return reverse('artwork_by_slug', args=[self.slug])
+        return reverse('artwork_detail', args=[self.pk])
+
+    @property
+    def rating_histogram(self):
+        """[(stars, count, percent of all ratings)] from 5 stars down to 1."""
+        total = self.rating_count or 1
+        return [(stars, getattr(self, f'rating_{stars}'), round(100 * getattr(self, f'rating_{stars}') / total))
+                for stars in range(5, 0, -1)]
+
+    def slug_base(self):
+        # created_at is only set by the insert, so a new artwork takes this year
+        year = (self.created_at or timezone.now()).year
+        return f"{slugify(self.title)[:240] or 'artwork'}-{year}"
 
     def save(self, *args, **kwargs):
-        # Ensure slug is unique, use year from created_at
-        if not self.slug:
-            base = slugify(self.title)[:240]
-            year = self.created_at.year if self.created_at else ''
-            self.slug = f"{base}-{year}"
-        super().save(*args, **kwargs)
+        # unique slug from the title and year, with a -N suffix when taken (slugs.py)
+        if self.slug:
+            return super().save(*args, **kwargs)
+        return save_new(self, super().save, *args, **kwargs)
+
+# Per-artwork input of the trending computation that isn't derivable from
+# other tables: views only exist as a running total, so the job remembers the
+# total it last saw and keeps a decayed sum of the views since
+class TrendingState(models.Model):
+    artwork = models.OneToOneField(Artwork, on_delete=models.CASCADE, primary_key=True, related_name='trending_state')
+    views_seen = models.PositiveIntegerField(default=0)
+    views_mass = models.FloatField(default=0)
+    computed_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Trending state for artwork #{self.artwork_id}"
+
+# Precomputed item-to-item neighbours: the top-K artworks most often liked or
+# bookmarked by the same people, rebuilt in batch by `manage.py compute_similarities`
+class ArtworkSimilarity(models.Model):
+    artwork = models.ForeignKey(Artwork, on_delete=models.CASCADE, related_name='similarities')
+    neighbor = models.ForeignKey(Artwork, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+
+    class Meta:
+        unique_together = ('artwork', 'neighbor')
+        indexes = [
+            # an artwork's neighbours, best first, straight from the index
+            models.Index(fields=['artwork', '-score', 'neighbor'], name='similarity_artwork_score_idx'),
+        ]
+
+    def __str__(self):
+        return f"#{self.artwork_id} ~ #{self.neighbor_id} ({self.score:.3f})"
+
+# A deleted artwork, for incremental catalog exports to pass the deletion on
+# (see exports.py)
+class ArtworkTombstone(models.Model):
+    artwork_id = models.BigIntegerField()
+    slug = models.CharField(max_length=300)
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Artwork #{self.artwork_id} deleted"
 
 # ArtworkImage model (supports multiple images per artwork)
 class ArtworkImage(models.Model):
@@ -92,6 +203,15 @@ class ArtworkImage(models.Model):
     image = models.ImageField(upload_to='artworks/')
     caption = models.CharField(max_length=200, blank=True)
     order = models.PositiveSmallIntegerField(default=0)
+    # perceptual hash of the image for near-duplicate detection (see perceptual.py)
+    dhash = models.BigIntegerField(null=True, blank=True, editable=False, db_index=True)
+    # dominant colours, "rrggbb:percent" by decreasing share (see palette.py)
+    palette = models.CharField(max_length=80, blank=True, editable=False)
+    # intrinsic size and a tiny inline WebP, so cards lay out and paint before the image loads
+    # (see placeholders.py)
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    placeholder = models.CharField(max_length=500, blank=True, editable=False)
 
     class Meta:
         ordering = ['order', 'id']
@@ -99,6 +219,134 @@ class ArtworkImage(models.Model):
     def __str__(self):
         return f"{self.artwork.title} image #{self.id}"
 
+# A chunked, resumable upload of one (possibly huge) image file; see uploads.py
+class UploadSession(models.Model):
+    STATUS_CHOICES = [
+        ('open', 'Receiving chunks'),
+        ('complete', 'Complete'),
+        ('aborted', 'Aborted'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='upload_sessions')
+    artwork = models.ForeignKey(Artwork, on_delete=models.CASCADE, related_name='upload_sessions')
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    sha256 = models.CharField(max_length=64, blank=True)  # of the whole file, checked on completion
+    received = models.BigIntegerField(default=0)  # bytes stored, always a prefix of the file
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='open')
+    image = models.ForeignKey(ArtworkImage, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # clean_uploads: stale open sessions
+            models.Index(fields=['status', 'updated_at'], name='upload_status_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.filename} ({self.received}/{self.size} bytes, {self.status})"
+
+# One dominant colour of an image, quantized to a Lab bin: the search-by-colour
+# index. Kept in step with ArtworkImage.palette by signals and `extract_palettes`
+class ImageColor(models.Model):
+    image = models.ForeignKey(ArtworkImage, on_delete=models.CASCADE, related_name='colors')
+    artwork = models.ForeignKey(Artwork, on_delete=models.CASCADE, related_name='+')
+    bin = models.PositiveSmallIntegerField()
+    weight = models.PositiveSmallIntegerField()  # percent of the image
+
+    class Meta:
+        unique_together = ('image', 'bin')
+        indexes = [
+            # ?color= reads only the rows of the bins near the query colour
+            models.Index(fields=['bin', 'artwork', 'weight'], name='imagecolor_bin_idx'),
+        ]
+
+    def __str__(self):
+        return f"Image #{self.image_id} bin {self.bin} ({self.weight}%)"
+
+# A content-addressed media file and how many file fields point at it; the
+# file is removed when the count drops to zero (see blobstore.py)
+class MediaBlob(models.Model):
+    name = models.CharField(max_length=100, primary_key=True)
+    size = models.BigIntegerField()
+    refs = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.name} ({self.refs} refs)"
+
+# Engagement counts per hour and per day, of an artwork (views, likes,
+# bookmarks, reviews) or, with no artwork, of an artist (follows). Filled
+# incrementally by `manage.py rollup_engagement`; the analytics API reads
+# only these (see analytics.py)
+class EngagementRollup(models.Model):
+    artwork = models.ForeignKey(Artwork, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    artist = models.ForeignKey(Artist, on_delete=models.CASCADE, null=True, blank=True, related_name='+')
+    views = models.PositiveIntegerField(default=0)
+    likes = models.PositiveIntegerField(default=0)
+    bookmarks = models.PositiveIntegerField(default=0)
+    reviews = models.PositiveIntegerField(default=0)
+    follows = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        abstract = True
+
+    def owner(self):
+        return f'artwork #{self.artwork_id}' if self.artwork_id else f'artist #{self.artist_id}'
+
+class EngagementHourly(EngagementRollup):
+    hour = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            # one row per artwork and hour / artist and hour, also the indexes of the series queries
+            models.UniqueConstraint(fields=['artwork', 'hour'], condition=Q(artwork__isnull=False),
+                                    name='engagement_hourly_artwork_uniq'),
+            models.UniqueConstraint(fields=['artist', 'hour'], condition=Q(artist__isnull=False),
+                                    name='engagement_hourly_artist_uniq'),
+        ]
+        indexes = [
+            # rollup_engagement drops hourly rows past ANALYTICS_HOURLY_RETENTION_DAYS
+            models.Index(fields=['hour'], name='engagement_hourly_hour_idx'),
+        ]
+
+    def __str__(self):
+        return f"Engagement of {self.owner()} at {self.hour}"
+
+class EngagementDaily(EngagementRollup):
+    day = models.DateField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['artwork', 'day'], condition=Q(artwork__isnull=False),
+                                    name='engagement_daily_artwork_uniq'),
+            models.UniqueConstraint(fields=['artist', 'day'], condition=Q(artist__isnull=False),
+                                    name='engagement_daily_artist_uniq'),
+        ]
+
+    def __str__(self):
+        return f"Engagement of {self.owner()} on {self.day}"
+
+# How far the rollup has read an event table: rows up to last_id are counted
+class RollupWatermark(models.Model):
+    source = models.CharField(max_length=20, primary_key=True)
+    last_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source} rolled up to #{self.last_id}"
+
+# Views only exist as Artwork.view_count: the rollup remembers the count it
+# has already attributed to an hour
+class RollupViewMark(models.Model):
+    artwork = models.OneToOneField(Artwork, on_delete=models.CASCADE, primary_key=True, related_name='+')
+    views_seen = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"Artwork #{self.artwork_id}: {self.views_seen} views rolled up"
+
 # Review model
 class Review(models.Model):
     artwork = models.ForeignKey(Artwork, on_delete=models.CASCADE, related_name='reviews')
@@ -109,6 +357,11 @@ class Review(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='review_created_idx'),
+            # keyset pagination of an artwork's reviews, newest first
+            models.Index(fields=['artwork', '-created_at', '-id'], name='review_artwork_recent_idx'),
+        ]
 
     def __str__(self):
         return f"Review {self.rating} for {self.artwork.title}"
@@ -133,6 +386,12 @@ class ArtworkLike(models.Model):
 
     class Meta:
         unique_together = ('user', 'artwork')
+        indexes = [
+            # a user's most recent likes: recommendation seeds
+            models.Index(fields=['user', '-created_at'], name='like_user_recent_idx'),
+            # artworks liked since the last incremental export
+            models.Index(fields=['created_at'], name='like_created_idx'),
+        ]
 
 class Bookmark(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='bookmarks')
@@ -141,6 +400,12 @@ class Bookmark(models.Model):
 
     class Meta:
         unique_together = ('user', 'artwork')
+        indexes = [
+            # a user's most recent bookmarks: recommendation seeds
+            models.Index(fields=['user', '-created_at'], name='bookmark_user_recent_idx'),
+            # artworks bookmarked since the last incremental export
+            models.Index(fields=['created_at'], name='bookmark_created_idx'),
+        ]
 
 class Follow(models.Model):
     follower = models.ForeignKey(User, on_delete=models.CASCADE, related_name='following')
@@ -183,6 +448,9 @@ class Notification(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='notification_created_idx'),
+        ]
     
     def __str__(self):
         return f"{self.user.username} - {self.get_notification_type_display()}"
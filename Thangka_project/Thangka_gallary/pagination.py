@@ -0,0 +1,100 @@
+"""
+Paginators for very large tables.
+
+Django's Paginator runs an exact ``COUNT(*)`` on every page, which on a
+million-row table means scanning the table (or a whole index) per request.
+``EstimatedCountPaginator`` asks the database's planner statistics for the
+size of an unfiltered table and caps the count of a filtered one, so a page
+costs an index lookup plus one bounded count.
+
+Past the cap the number of pages is unknown, so the last counted page is
+open-ended: it links to the next page while rows remain, and so on from
+there (?p=N works at any depth). The changelist shows the cap as its result
+count. On SQLite run ANALYZE now and then: without sqlite_stat1 an unfiltered
+changelist has no estimate and is capped like a filtered one.
+"""
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+# below this many rows an exact count is cheap enough and always right
+EXACT_COUNT_LIMIT = 10000
+# a filtered changelist never counts past this many rows
+FILTERED_COUNT_CAP = 10000
+
+
+def estimated_table_rows(model, using='default'):
+    """Row count of `model`'s table from planner statistics, or None."""
+    connection = connections[using]
+    table = model._meta.db_table
+    vendor = connection.vendor
+    try:
+        with connection.cursor() as cursor:
+            if vendor == 'postgresql':
+                cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            elif vendor == 'mysql':
+                cursor.execute(
+                    "SELECT table_rows FROM information_schema.tables "
+                    "WHERE table_schema = DATABASE() AND table_name = %s", [table])
+            elif vendor == 'sqlite':
+                # filled in by ANALYZE; the first number of a stat row is the
+                # number of rows in the table
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            else:
+                return None
+            row = cursor.fetchone()
+    except DatabaseError:
+        return None
+    if not row or row[0] is None:
+        return None
+    value = int(str(row[0]).split()[0])
+    # postgres reports -1 for a table that has never been analyzed
+    return value if value >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator whose count never scans a large table:
+
+    * unfiltered querysets use the planner's row estimate when it is above
+      EXACT_COUNT_LIMIT, and an exact count otherwise
+    * filtered querysets count at most FILTERED_COUNT_CAP + 1 rows, and
+      pages from the last counted one on extend the count as they are read
+    """
+    truncated = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not hasattr(queryset, 'query'):
+            return len(queryset)
+
+        if not queryset.query.where:
+            estimate = estimated_table_rows(queryset.model, queryset.db)
+            if estimate is not None and estimate > EXACT_COUNT_LIMIT:
+                return estimate
+            if estimate is not None:
+                return queryset.count()
+
+        # COUNT over a LIMITed subquery stops reading after the cap
+        capped = queryset.order_by()[:FILTERED_COUNT_CAP + 1].count()
+        self.truncated = capped > FILTERED_COUNT_CAP
+        return min(capped, FILTERED_COUNT_CAP)
+
+    def validate_number(self, number):
+        if self.count and self.truncated:
+            try:
+                page = int(number)
+            except (TypeError, ValueError):
+                page = None
+            if page is not None and page >= self.num_pages:
+                self._extend_to(page)
+        return super().validate_number(number)
+
+    def _extend_to(self, number):
+        # count up to one row past the page, so a full page links to the next
+        bottom = (number - 1) * self.per_page
+        rows = self.object_list.order_by()[bottom:bottom + self.per_page + 1].count()
+        if rows:
+            self.count = bottom + rows
+            self.__dict__.pop('num_pages', None)
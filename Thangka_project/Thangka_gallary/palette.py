@@ -0,0 +1,195 @@
+"""
+Dominant-colour palettes of artwork images, and search by colour.
+
+A palette is the k-means clustering, in CIE Lab space, of a 64x64 thumbnail:
+up to K colours with the share of pixels each one covers. Lab is used
+because Euclidean distance there (delta E) roughly follows perceived
+difference, so "lapis blue" and "cinnabar red" land in clusters of their own
+instead of being averaged into brown.
+
+For search, each palette colour is also quantized into a coarse Lab bin
+(L_BINS x AB_BINS x AB_BINS cells, one small integer) and stored as an
+ImageColor row (image, artwork, bin, weight) indexed on bin. A query colour
+turns into the handful of bins within SEARCH_RADIUS of it, each with a
+closeness factor, so ranking reads only the rows of those bins.
+
+Nothing here imports models at import time: extract_file() also runs in
+spawned worker processes (see parallel.py).
+"""
+import numpy as np
+
+K = 5
+ITERATIONS = 12
+THUMBNAIL = 64
+MIN_WEIGHT = 3  # percent; smaller clusters are specks, not a dominant colour
+L_BINS, AB_BINS = 8, 16
+AB_RANGE = (-128.0, 128.0)
+SEARCH_RADIUS = 25.0  # delta E
+
+# sRGB (D65) -> XYZ
+_RGB_TO_XYZ = np.array([
+    [0.4124564, 0.3575761, 0.1804375],
+    [0.2126729, 0.7151522, 0.0721750],
+    [0.0193339, 0.1191920, 0.9503041],
+])
+_WHITE = np.array([0.95047, 1.0, 1.08883])
+
+
+def rgb_to_lab(rgb):
+    """(..., 3) sRGB values in 0..255 -> (..., 3) Lab."""
+    c = np.asarray(rgb, dtype=float) / 255.0
+    linear = np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+    xyz = linear @ _RGB_TO_XYZ.T / _WHITE
+    f = np.where(xyz > (6 / 29) ** 3, np.cbrt(xyz), xyz / (3 * (6 / 29) ** 2) + 4 / 29)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+def lab_to_rgb(lab):
+    lab = np.asarray(lab, dtype=float)
+    fy = (lab[..., 0] + 16) / 116
+    f = np.stack([fy + lab[..., 1] / 500, fy, fy - lab[..., 2] / 200], axis=-1)
+    xyz = np.where(f > 6 / 29, f ** 3, 3 * (6 / 29) ** 2 * (f - 4 / 29)) * _WHITE
+    linear = np.clip(xyz @ np.linalg.inv(_RGB_TO_XYZ).T, 0, 1)
+    c = np.where(linear <= 0.0031308, linear * 12.92, 1.055 * linear ** (1 / 2.4) - 0.055)
+    return np.rint(c * 255).astype(int)
+
+
+def parse_color(value):
+    """'#1f3a93', '1f3a93' or '#13a' -> (r, g, b); ValueError otherwise."""
+    value = (value or '').strip().lstrip('#')
+    if len(value) == 3:
+        value = ''.join(ch * 2 for ch in value)
+    if len(value) != 6:
+        raise ValueError("colour must be #rrggbb")
+    return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def to_hex(rgb):
+    return '%02x%02x%02x' % tuple(int(v) for v in rgb)
+
+
+def kmeans(points, k=K, iterations=ITERATIONS, seed=0):
+    """Lloyd's k-means with k-means++ seeding -> (centers, counts), largest cluster first."""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(np.unique(points, axis=0)))
+    centers = points[[rng.integers(len(points))]]
+    for _ in range(1, k):
+        nearest = ((points[:, None, :] - centers[None]) ** 2).sum(-1).min(axis=1)
+        centers = np.vstack([centers, points[rng.choice(len(points), p=nearest / nearest.sum())]])
+
+    for _ in range(iterations):
+        labels = ((points[:, None, :] - centers[None]) ** 2).sum(-1).argmin(axis=1)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centers)
+        np.add.at(sums, labels, points)
+        moved = np.where(counts[:, None] > 0, sums / np.maximum(counts, 1)[:, None], centers)
+        if np.allclose(moved, centers, atol=0.1):
+            break
+        centers = moved
+    labels = ((points[:, None, :] - centers[None]) ** 2).sum(-1).argmin(axis=1)
+    counts = np.bincount(labels, minlength=k)
+    order = np.argsort(-counts, kind='stable')
+    return centers[order], counts[order]
+
+
+def extract(image):
+    """Palette of a PIL image: [(hex colour, percent of pixels)], dominant first."""
+    thumb = image.convert('RGB')
+    thumb.thumbnail((THUMBNAIL, THUMBNAIL))
+    pixels = np.asarray(thumb, dtype=float).reshape(-1, 3)
+    centers, counts = kmeans(rgb_to_lab(pixels))
+    palette = []
+    for center, count in zip(lab_to_rgb(centers), counts):
+        weight = round(100 * count / len(pixels))
+        if weight >= MIN_WEIGHT:
+            palette.append((to_hex(center), weight))
+    return palette
+
+
+def extract_file(source):
+    """extract() of an image path or file object; None if it can't be decoded."""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(source) as image:
+            image.draft('RGB', (THUMBNAIL * 2, THUMBNAIL * 2))  # JPEGs decode at a fraction of their size
+            return extract(image)
+    except (OSError, UnidentifiedImageError, ValueError):
+        return None
+
+
+# compact text form stored on ArtworkImage.palette: "1f3a93:42 c23b22:20",
+# or UNREADABLE for an image that can't be decoded (so backfills skip it)
+UNREADABLE = '-'
+
+
+def dumps(palette):
+    if palette is None:
+        return UNREADABLE
+    return ' '.join(f'{colour}:{weight}' for colour, weight in palette)
+
+
+def loads(text):
+    palette = []
+    if text == UNREADABLE:
+        return palette
+    for part in (text or '').split():
+        colour, _, weight = part.partition(':')
+        palette.append((colour, int(weight)))
+    return palette
+
+
+def lab_bin(lab):
+    """Lab colour(s) -> bin number(s) in 0 .. L_BINS * AB_BINS**2 - 1."""
+    lab = np.asarray(lab, dtype=float)
+    low, high = AB_RANGE
+    l = np.clip((lab[..., 0] / 100 * L_BINS).astype(int), 0, L_BINS - 1)
+    a = np.clip(((lab[..., 1] - low) / (high - low) * AB_BINS).astype(int), 0, AB_BINS - 1)
+    b = np.clip(((lab[..., 2] - low) / (high - low) * AB_BINS).astype(int), 0, AB_BINS - 1)
+    return (l * AB_BINS + a) * AB_BINS + b
+
+
+def _bin_centers():
+    low, high = AB_RANGE
+    l, a, b = np.meshgrid(np.arange(L_BINS), np.arange(AB_BINS), np.arange(AB_BINS), indexing='ij')
+    step = (high - low) / AB_BINS
+    return np.stack([(l.ravel() + 0.5) * 100 / L_BINS,
+                     low + (a.ravel() + 0.5) * step,
+                     low + (b.ravel() + 0.5) * step], axis=-1)
+
+
+BIN_CENTERS = _bin_centers()
+
+
+def palette_bins(palette):
+    """{bin: weight} of a palette (colours sharing a bin add up)."""
+    bins = {}
+    if palette:
+        numbers = lab_bin(rgb_to_lab([parse_color(colour) for colour, _ in palette]))
+        for number, (_, weight) in zip(numbers.tolist(), palette):
+            bins[number] = bins.get(number, 0) + weight
+    return bins
+
+
+def nearby_bins(rgb, radius=SEARCH_RADIUS):
+    """{bin: closeness in (0, 1]} of every bin whose centre is within `radius` of the colour."""
+    lab = rgb_to_lab(rgb)
+    distances = np.sqrt(((BIN_CENTERS - lab) ** 2).sum(axis=1))
+    close = np.flatnonzero(distances < radius)
+    bins = {int(number): round(1 - float(distances[number]) / radius, 3) for number in close}
+    # the query's own bin always counts, however far its centre
+    bins.setdefault(int(lab_bin(lab)), 1.0)
+    return bins
+
+
+def save_colors(palettes):
+    """Replace the ImageColor rows of {image id: (artwork id, palette)}."""
+    from django.db import transaction
+    from .models import ImageColor
+
+    rows = [ImageColor(image_id=image_id, artwork_id=artwork_id, bin=number, weight=min(weight, 100))
+            for image_id, (artwork_id, palette) in palettes.items()
+            for number, weight in palette_bins(palette).items()]
+    with transaction.atomic():
+        ImageColor.objects.filter(image_id__in=list(palettes)).delete()
+        ImageColor.objects.bulk_create(rows, batch_size=1000)
@@ -0,0 +1,33 @@
+"""
+Process pools for CPU-bound work in management commands.
+
+Workers are spawned (not forked, so they don't inherit open database
+connections or threads) and run django.setup() before their first task. Keep
+task functions in modules that don't import models at import time, since a
+spawned worker imports them before the app registry is ready.
+"""
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def process_pool(workers):
+    return ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker)
+
+
+def local_path(name):
+    """
+    Filesystem path of a stored file, to hand to a worker (file objects don't
+    pickle), or None when the storage is remote and the caller must read it.
+    """
+    from django.core.files.storage import default_storage
+
+    try:
+        return default_storage.path(name)
+    except NotImplementedError:
+        return None
@@ -0,0 +1,231 @@
+"""
+Perceptual hashes of artwork images, for near-duplicate detection.
+
+dHash: the image is reduced to 9x8 grey pixels and each bit says whether a
+pixel is brighter than its right-hand neighbour. Re-encoding, resizing or a
+light colour correction flips few of the 64 bits, so near-duplicates are
+hashes within a small Hamming distance. Hashes are stored on ArtworkImage as
+signed 64-bit integers (the database type).
+
+HashIndex finds every hash within `max_distance` of a query without a full
+scan (multi-index hashing): the hash is cut into CHUNKS 16-bit pieces, and
+two hashes within distance d agree to within d // CHUNKS bits on at least one
+piece (pigeonhole). Each piece has a sorted array, so the candidates are a
+few binary searches, checked with one vectorized popcount.
+
+LibraryIndex follows new images by id. A hash written onto an existing image
+(a backfill, a replaced file) has no new id, so the writer calls
+hashes_changed(), which bumps a generation in the shared cache; every
+process's index rebuilds when it sees the generation move.
+
+Nothing here imports models at import time: dhash_file() also runs in
+spawned worker processes (see parallel.py).
+"""
+from itertools import combinations
+import threading
+import time
+
+import numpy as np
+
+BITS = 64
+CHUNKS = 4
+CHUNK_BITS = BITS // CHUNKS
+DEFAULT_DISTANCE = 6  # out of 64; dHash near-duplicates are usually within 10
+# JPEGs are decoded at the smallest scale of at least this size (see Image.draft);
+# every hash must come from the same decoding for exact matches to work
+DRAFT_SIZE = 128
+# rows added since the index was built are scanned linearly until there are this many
+TAIL_LIMIT = 50_000
+GENERATION_KEY = 'perceptual:generation'
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(values):
+        return np.bitwise_count(values)
+else:
+    _BYTE_BITS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def popcount(values):
+        values = np.ascontiguousarray(values, dtype=np.uint64)
+        return _BYTE_BITS[values.view(np.uint8)].reshape(-1, 8).sum(axis=1)
+
+
+def to_signed(value):
+    return value - (1 << BITS) if value >= 1 << (BITS - 1) else value
+
+
+def to_unsigned(values):
+    return np.asarray(values, dtype=np.int64).view(np.uint64)
+
+
+def dhash(image):
+    """64-bit difference hash of a PIL image, as a signed integer."""
+    from PIL import Image
+
+    grey = np.asarray(image.convert('L').resize((9, 8), Image.Resampling.BOX), dtype=np.int16)
+    bits = (grey[:, 1:] > grey[:, :-1]).ravel()
+    return to_signed(int.from_bytes(np.packbits(bits).tobytes(), 'big'))
+
+
+def dhash_file(source):
+    """dhash() of an image path or file object; None if it can't be decoded."""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(source) as image:
+            image.draft('RGB', (DRAFT_SIZE, DRAFT_SIZE))
+            return dhash(image)
+    except (OSError, UnidentifiedImageError, ValueError):
+        return None
+
+
+def distance(a, b):
+    return bin((a ^ b) & ((1 << BITS) - 1)).count('1')
+
+
+def _chunk(hashes, index):
+    return ((hashes >> np.uint64(index * CHUNK_BITS)) & np.uint64((1 << CHUNK_BITS) - 1)).astype(np.uint16)
+
+
+def _probes(key, radius):
+    """Every 16-bit value within `radius` bits of key."""
+    probes = [key]
+    for flips in range(1, radius + 1):
+        for bits in combinations(range(CHUNK_BITS), flips):
+            probe = key
+            for bit in bits:
+                probe ^= 1 << bit
+            probes.append(probe)
+    return np.array(probes, dtype=np.uint16)
+
+
+class HashIndex:
+    """Immutable multi-index over (ids, hashes); hashes are signed 64-bit values."""
+
+    def __init__(self, ids, hashes):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.hashes = to_unsigned(hashes)
+        self.tables = []
+        for index in range(CHUNKS):
+            keys = _chunk(self.hashes, index)
+            order = np.argsort(keys, kind='stable')
+            self.tables.append((keys[order], order))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, value, max_distance=DEFAULT_DISTANCE):
+        """[(id, distance)] of every hash within max_distance of value, closest first."""
+        if not len(self.ids):
+            return []
+        query = to_unsigned([value])
+        radius = max_distance // CHUNKS
+        candidates = []
+        for index, (keys, order) in enumerate(self.tables):
+            probes = _probes(int(_chunk(query, index)[0]), radius)
+            starts = np.searchsorted(keys, probes, side='left')
+            stops = np.searchsorted(keys, probes, side='right')
+            for start, stop in zip(starts.tolist(), stops.tolist()):
+                if stop > start:
+                    candidates.append(order[start:stop])
+        if not candidates:
+            return []
+        positions = np.unique(np.concatenate(candidates))
+        distances = popcount(self.hashes[positions] ^ query[0]).astype(np.int64)
+        close = distances <= max_distance
+        return _ranked(self.ids[positions[close]], distances[close])
+
+    def scan(self, value, max_distance=DEFAULT_DISTANCE):
+        """Same as search(), by brute force (for small or freshly added sets)."""
+        if not len(self.ids):
+            return []
+        distances = popcount(self.hashes ^ to_unsigned([value])[0]).astype(np.int64)
+        close = distances <= max_distance
+        return _ranked(self.ids[close], distances[close])
+
+
+def _generation():
+    from django.core.cache import cache
+
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        cache.add(GENERATION_KEY, time.time_ns() // 1000, None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def hashes_changed():
+    """Have every LibraryIndex rebuild: call after changing the hash of an existing image."""
+    from django.core.cache import cache
+
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        pass  # flushed: the next _generation() is a fresh value anyway
+
+
+def _ranked(ids, distances):
+    order = np.lexsort((ids, distances))
+    return list(zip(ids[order].tolist(), distances[order].tolist()))
+
+
+class LibraryIndex:
+    """
+    The per-process index of every hashed ArtworkImage. Built on first use;
+    images saved afterwards (by any process) are picked up on each search as a
+    "tail" of ids above the build's high-water mark, and folded into a rebuilt
+    index once the tail reaches TAIL_LIMIT, or as soon as hashes_changed()
+    moves the generation. Matches are re-checked against the database, so
+    deleted images never come back.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.main = None
+        self.tail = HashIndex([], [])
+        self.high_water = 0
+        self.generation = None
+
+    def _rows(self, after):
+        from .models import ArtworkImage
+
+        rows = (ArtworkImage.objects.filter(pk__gt=after, dhash__isnull=False)
+                .order_by('pk').values_list('pk', 'dhash'))
+        ids, hashes = [], []
+        for pk, value in rows.iterator(chunk_size=20000):
+            ids.append(pk)
+            hashes.append(value)
+        return ids, hashes
+
+    def refresh(self):
+        with self.lock:
+            generation = _generation()
+            if self.main is None or len(self.tail) >= TAIL_LIMIT or generation != self.generation:
+                ids, hashes = self._rows(0)
+                self.main, self.tail = HashIndex(ids, hashes), HashIndex([], [])
+                self.high_water = ids[-1] if ids else 0
+                self.generation = generation
+                return
+            ids, hashes = self._rows(self.high_water)
+            if ids:
+                self.tail = HashIndex(np.r_[self.tail.ids, ids], np.r_[self.tail.hashes.view(np.int64), hashes])
+                self.high_water = ids[-1]
+
+    def search(self, value, max_distance=DEFAULT_DISTANCE, exclude_artwork=None):
+        """[(ArtworkImage, distance)] near `value`, closest first."""
+        from .models import ArtworkImage
+
+        self.refresh()
+        matches = dict(self.main.search(value, max_distance))
+        matches.update(self.tail.scan(value, max_distance))
+        if not matches:
+            return []
+        images = ArtworkImage.objects.filter(pk__in=matches).select_related('artwork')
+        if exclude_artwork is not None:
+            images = images.exclude(artwork_id=exclude_artwork)
+        # the hash may have changed since the index saw it
+        found = [(image, distance(image.dhash, value)) for image in images if image.dhash is not None]
+        found = [(image, d) for image, d in found if d <= max_distance]
+        return sorted(found, key=lambda pair: (pair[1], pair[0].pk))
+
+
+library = LibraryIndex()
@@ -0,0 +1,58 @@
+"""
+Low-quality image placeholders (LQIP) and intrinsic sizes of artwork images.
+
+The placeholder is the image shrunk to at most SIZE pixels on its longest
+side and saved as a low-quality WebP, typically 100-250 bytes, stored as a
+data: URI on ArtworkImage.placeholder. Pages and feed items send it inline
+as the <img> background, and the browser's upscaling does the blurring, so
+a card is painted in the image's colours before any image bytes arrive.
+With width/height on the <img> it is laid out at the right size too.
+
+Nothing here imports models at import time: analyze_file() also runs in
+spawned worker processes (see parallel.py).
+"""
+import base64
+import io
+
+SIZE = 24
+QUALITY = 40
+MAX_BYTES = 300  # a placeholder bigger than this is redone at FALLBACK_SIZE
+FALLBACK_SIZE = 12
+# EXIF orientations that rotate the image by 90 degrees (browsers apply them)
+ROTATED = (5, 6, 7, 8)
+
+
+def dimensions(image):
+    """(width, height) of a PIL image as displayed; only reads the header."""
+    width, height = image.size
+    if image.getexif().get(0x0112) in ROTATED:
+        return height, width
+    return width, height
+
+
+def placeholder(image):
+    """data: URI of a tiny WebP of a PIL image (which may be draft-decoded)."""
+    from PIL import ImageOps
+
+    image = ImageOps.exif_transpose(image.convert('RGB'))
+    for size in (SIZE, FALLBACK_SIZE):
+        thumb = image.copy()
+        thumb.thumbnail((size, size))
+        buffer = io.BytesIO()
+        thumb.save(buffer, 'WEBP', quality=QUALITY, method=6)
+        if buffer.tell() <= MAX_BYTES:
+            break
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def analyze_file(source):
+    """(width, height, placeholder) of an image path or file object; None if it can't be decoded."""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(source) as image:
+            width, height = dimensions(image)
+            image.draft('RGB', (SIZE * 4, SIZE * 4))  # JPEGs decode at a fraction of their size
+            return width, height, placeholder(image)
+    except (OSError, UnidentifiedImageError, ValueError):
+        return None
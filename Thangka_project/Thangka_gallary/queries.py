@@ -0,0 +1,18 @@
+"""Query expressions shared by the views, exports and batch jobs."""
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def per_artwork(model, aggregate):
+    """
+    Correlated subquery computing `aggregate` over `model` rows of each
+    artwork. Unlike annotate(Count('likes')) it needs no GROUP BY over the
+    outer query, so ORDER BY ... LIMIT n can still be answered from an index
+    and only the n returned rows pay for the aggregate.
+    """
+    rows = model.objects.filter(artwork=OuterRef('pk')).order_by().values('artwork')
+    return Subquery(rows.annotate(value=aggregate).values('value'))
+
+
+def count_per_artwork(model):
+    return Coalesce(per_artwork(model, Count('*')), 0)
@@ -0,0 +1,53 @@
+"""
+Review aggregates stored on Artwork: rating_count, rating_avg and a 1-5
+histogram (rating_1 .. rating_5).
+
+The signals in signals.py keep them current one review at a time with
+F() increments, so writing a review never re-aggregates the artwork's other
+reviews. rebuild() recomputes them from the Review table, for backfills and
+after bulk changes that bypass signals (queryset.update(), raw SQL).
+"""
+from django.db.models import Count, ExpressionWrapper, F, FloatField, Q, Value
+from django.db.models.functions import Cast, NullIf
+
+from .models import Artwork, Review
+
+RATINGS = range(1, 6)
+HISTOGRAM_FIELDS = [f'rating_{r}' for r in RATINGS]
+
+
+def _average():
+    # from the histogram, so it is always consistent with it
+    total = sum(F(f'rating_{r}') * r for r in RATINGS)
+    return ExpressionWrapper(Cast(total, FloatField()) / NullIf(F('rating_count'), Value(0)),
+                             output_field=FloatField())
+
+
+def apply_delta(artwork_id, rating, delta):
+    """Add (delta=1) or remove (delta=-1) one review with `rating`."""
+    if rating not in RATINGS:
+        return
+    artwork = Artwork.objects.filter(pk=artwork_id)
+    # two statements: the average must see the incremented counters, and not
+    # every database evaluates SET expressions against the old row
+    artwork.update(**{f'rating_{rating}': F(f'rating_{rating}') + delta,
+                      'rating_count': F('rating_count') + delta})
+    artwork.update(rating_avg=_average())
+
+
+def rebuild(artwork_ids=None):
+    """Recompute the aggregates from Review, for all artworks or the given ids."""
+    counts = (Review.objects.filter(rating__in=RATINGS).order_by().values('artwork_id')
+              .annotate(**{f'rating_{r}': Count('id', filter=Q(rating=r)) for r in RATINGS}))
+    artworks = Artwork.objects.all()
+    if artwork_ids is not None:
+        counts = counts.filter(artwork_id__in=artwork_ids)
+        artworks = artworks.filter(pk__in=artwork_ids)
+    artworks.update(rating_count=0, rating_avg=None, **{field: 0 for field in HISTOGRAM_FIELDS})
+    for row in counts.iterator(chunk_size=2000):
+        histogram = {field: row[field] for field in HISTOGRAM_FIELDS}
+        count = sum(histogram.values())
+        Artwork.objects.filter(pk=row['artwork_id']).update(
+            rating_count=count,
+            rating_avg=sum(row[f'rating_{r}'] * r for r in RATINGS) / count,
+            **histogram)
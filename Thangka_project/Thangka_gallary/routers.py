@@ -0,0 +1,55 @@
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# True while reads must go to the primary. Outside a request (management
+# commands, background threads, migrations) that is always the case: those
+# read what they are about to write. ReplicaPinMiddleware unpins the safe
+# requests that have no recent write from the same browser.
+_pinned_to_primary = ContextVar('thangka_pinned_to_primary', default=True)
+
+REPLICA_ALIAS = 'replica'
+
+
+def pin_to_primary(pinned=True):
+    """Pin reads in the current context to the primary. Returns a reset token."""
+    return _pinned_to_primary.set(pinned)
+
+
+def unpin(token):
+    _pinned_to_primary.reset(token)
+
+
+def is_pinned():
+    return _pinned_to_primary.get()
+
+
+class PrimaryReplicaRouter:
+    """
+    Send reads for the gallery models to the ``replica`` alias and every write
+    to ``default``. Falls back to ``default`` when no replica is configured or
+    when reads are pinned: always outside a request, and for requests that
+    write or just wrote (see ReplicaPinMiddleware).
+    """
+
+    def _replica_apps(self):
+        return getattr(settings, 'REPLICA_ROUTED_APPS', ('Thangka_gallary',))
+
+    def db_for_read(self, model, **hints):
+        if REPLICA_ALIAS not in settings.DATABASES or is_pinned():
+            return 'default'
+        if model._meta.app_label not in self._replica_apps():
+            return 'default'
+        return REPLICA_ALIAS
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the replica is a copy of the primary, so objects from either side
+        # can be related to each other
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # the replica is refreshed from a copy of the primary, never migrated
+        return db == 'default'
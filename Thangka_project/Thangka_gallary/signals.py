@@ -1,9 +1,180 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_save
+from django.db import router, transaction
 from django.dispatch import receiver
+from django.utils import timezone
 from django.contrib.auth.models import User
-from .models import Artist
+from .models import Artist, Artwork, ArtworkImage, ArtworkTombstone, Category, Notification, Review, Tag
+from .caching import bump_catalog_generation
+from .backends import forget_user
+from . import autocomplete, blobstore, ratings
 
 @receiver(post_save, sender=User)
 def create_artist_profile(sender, instance, created, **kwargs):
     if created:
         Artist.objects.create(user=instance, name=instance.username)
+
+# anything rendered into the public feeds invalidates their ETags / cached pages
+# (like counts aren't in them: pages load those from my_state, so a like
+# doesn't revalidate every feed on the site)
+@receiver([post_save, post_delete], sender=Artwork)
+@receiver([post_save, post_delete], sender=ArtworkImage)
+@receiver([post_save, post_delete], sender=Artist)
+def catalog_changed(sender, **kwargs):
+    bump_catalog_generation()
+
+# cached request.user (CachedModelBackend) must not outlive a change
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    forget_user(instance.pk)
+
+@receiver([post_save, post_delete], sender=Artist)
+def artist_changed(sender, instance, **kwargs):
+    if instance.user_id:
+        forget_user(instance.user_id)
+
+@receiver([post_save, post_delete], sender=Notification)
+def notification_changed(sender, instance, **kwargs):
+    from .views import notification_summary
+    notification_summary.invalidate(instance.user_id)
+
+# this process's autocomplete indexes follow the change at once, the other workers' within seconds
+AUTOCOMPLETE_KINDS = {Tag: 'tags', Artist: 'artists', Category: 'categories'}
+
+@receiver(post_save, sender=Tag)
+@receiver(post_save, sender=Artist)
+@receiver(post_save, sender=Category)
+def autocomplete_saved(sender, instance, **kwargs):
+    transaction.on_commit(lambda: autocomplete.changed(AUTOCOMPLETE_KINDS[sender], instance.pk, instance))
+
+@receiver(post_delete, sender=Tag)
+@receiver(post_delete, sender=Artist)
+@receiver(post_delete, sender=Category)
+def autocomplete_deleted(sender, instance, **kwargs):
+    pk = instance.pk  # None by the time the transaction commits
+    transaction.on_commit(lambda: autocomplete.changed(AUTOCOMPLETE_KINDS[sender], pk))
+
+# content-addressed files may be shared: give back the deleted row's reference
+@receiver(post_delete, sender=ArtworkImage)
+def release_image_file(sender, instance, **kwargs):
+    blobstore.release(instance.image)
+
+@receiver(post_delete, sender=Artist)
+def release_avatar_file(sender, instance, **kwargs):
+    blobstore.release(instance.avatar)
+
+# ... and so does a file that an edit replaces or clears
+FILE_FIELDS = {ArtworkImage: 'image', Artist: 'avatar'}
+
+@receiver(pre_save, sender=ArtworkImage)
+@receiver(pre_save, sender=Artist)
+def remember_replaced_file(sender, instance, update_fields=None, **kwargs):
+    name = FILE_FIELDS[sender]
+    instance._replaced_file = None
+    if not instance.pk or (update_fields is not None and name not in update_fields):
+        return
+    current = getattr(instance, name)
+    # from the primary: a replica may not have the latest edit yet
+    stored = (sender.objects.using(router.db_for_write(sender)).filter(pk=instance.pk)
+              .values_list(name, flat=True).first())
+    # a new upload counts a reference of its own even when it has the same bytes (and name)
+    if stored and (stored != current.name or (current and not current._committed)):
+        field = sender._meta.get_field(name)
+        instance._replaced_file = field.attr_class(instance, field, stored)
+
+@receiver(post_save, sender=ArtworkImage)
+@receiver(post_save, sender=Artist)
+def release_replaced_file(sender, instance, **kwargs):
+    if getattr(instance, '_replaced_file', None):
+        blobstore.release(instance._replaced_file)
+        instance._replaced_file = None
+
+
+# perceptual hash, colour palette and placeholder of every newly uploaded
+# image, decoded once while it is still in memory (large chunked uploads set
+# _skip_analysis: only their size is read, the rest is left to the backfill
+# commands find_duplicates / extract_palettes / build_placeholders)
+@receiver(pre_save, sender=ArtworkImage)
+def analyze_new_image(sender, instance, **kwargs):
+    image = instance.image
+    instance._palette_changed = instance._rehashed = False
+    if image and not image._committed:
+        from PIL import Image, UnidentifiedImageError
+        from . import palette, perceptual, placeholders
+        skip = getattr(instance, '_skip_analysis', False)
+        image.file.seek(0)
+        try:
+            with Image.open(image.file) as decoded:
+                instance.width, instance.height = placeholders.dimensions(decoded)
+                if not skip:
+                    decoded.draft('RGB', (perceptual.DRAFT_SIZE, perceptual.DRAFT_SIZE))
+                    decoded.load()
+                    instance.dhash = perceptual.dhash(decoded)
+                    instance.palette = palette.dumps(palette.extract(decoded))
+                    instance.placeholder = placeholders.placeholder(decoded)
+        except (OSError, UnidentifiedImageError, ValueError):
+            instance.dhash, instance.palette, instance.placeholder = None, palette.UNREADABLE, ''
+            instance.width = instance.height = None
+        image.file.seek(0)
+        instance._palette_changed = not skip
+        # a new file on an existing row: LibraryIndex only picks up new ids by itself
+        instance._rehashed = not instance._state.adding
+
+@receiver(post_save, sender=ArtworkImage)
+def index_image_colors(sender, instance, **kwargs):
+    if getattr(instance, '_palette_changed', False):
+        from . import palette
+        palette.save_colors({instance.pk: (instance.artwork_id, palette.loads(instance.palette))})
+
+@receiver(post_save, sender=ArtworkImage)
+def reindex_rehashed_image(sender, instance, **kwargs):
+    if getattr(instance, '_rehashed', False):
+        from . import perceptual
+        transaction.on_commit(perceptual.hashes_changed)
+
+# Artwork.rating_* aggregates, one review at a time
+@receiver(pre_save, sender=Review)
+def review_before_save(sender, instance, **kwargs):
+    # an edit may change the rating (or the artwork): remember what it was
+    instance._rating_before = None
+    if instance.pk:
+        # from the primary: a replica may not have the latest edit yet
+        instance._rating_before = (Review.objects.using(router.db_for_write(Review)).filter(pk=instance.pk)
+                                   .values_list('artwork_id', 'rating').first())
+
+@receiver(post_save, sender=Review)
+def review_saved(sender, instance, **kwargs):
+    before = getattr(instance, '_rating_before', None)
+    if before == (instance.artwork_id, instance.rating):
+        return
+    if before:
+        ratings.apply_delta(*before, -1)
+    ratings.apply_delta(instance.artwork_id, instance.rating, 1)
+
+@receiver(post_delete, sender=Review)
+def review_deleted(sender, instance, **kwargs):
+    ratings.apply_delta(instance.artwork_id, instance.rating, -1)
+
+# incremental catalog exports select on Artwork.updated_at: tag and image
+# changes count as edits of the artwork, deletions leave a tombstone
+def touch_artworks(ids):
+    Artwork.objects.filter(pk__in=ids).update(updated_at=timezone.now())
+
+@receiver(m2m_changed, sender=Artwork.tags.through)
+def artwork_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # tag.artworks.clear() doesn't say which artworks it removes
+        instance._cleared_artworks = list(Artwork.objects.filter(tags=instance).values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove', 'post_clear'):
+        if not reverse:
+            touch_artworks([instance.pk])
+        else:
+            touch_artworks(pk_set or getattr(instance, '_cleared_artworks', []))
+
+@receiver(post_save, sender=ArtworkImage)
+@receiver(post_delete, sender=ArtworkImage)
+def artwork_images_changed(sender, instance, **kwargs):
+    touch_artworks([instance.artwork_id])
+
+@receiver(post_delete, sender=Artwork)
+def artwork_deleted(sender, instance, **kwargs):
+    ArtworkTombstone.objects.create(artwork_id=instance.pk, slug=instance.slug)
@@ -0,0 +1,168 @@
+"""
+Item-to-item similarity from likes and bookmarks, for "For you" recommendations.
+
+Likes and bookmarks form a sparse user x artwork matrix X (a bookmark weighs a
+bit more than a like). The similarity of two artworks is the cosine of their
+columns:
+
+    sim(i, j) = (X[:, i] . X[:, j]) / (|X[:, i]| |X[:, j]|)
+
+X^T X is computed like a sparse matrix product, with plain numpy on CSR / CSC
+index arrays: for a block of artworks, every interaction (user, i) is expanded
+into the user's row (user, j), the (i, j) products are summed with one sort,
+and only the top K neighbours of each artwork are kept. Blocks are cut so that
+no block expands into more than MAX_PAIRS products, which bounds memory however
+large the catalog gets. Users with a very long history only contribute their
+most recent MAX_ITEMS_PER_USER interactions (the cost of a user is quadratic in
+their history, and a heavy user says little about any one pair).
+
+Each block replaces its artworks' rows in ArtworkSimilarity in one transaction,
+so readers always see a complete neighbour list.
+"""
+import numpy as np
+from django.db import transaction
+
+from .models import ArtworkLike, ArtworkSimilarity, Bookmark
+
+WEIGHTS = {
+    'like': 1.0,
+    'bookmark': 1.5,
+}
+TOP_K = 50
+MAX_ITEMS_PER_USER = 500
+MAX_PAIRS = 2_000_000
+MIN_SCORE = 0.01
+BATCH_SIZE = 1000
+
+
+def _interactions():
+    """(users, items, weights) for published artworks, one entry per (user, item)."""
+    columns = [[], [], [], []]
+    for kind, model in (('like', ArtworkLike), ('bookmark', Bookmark)):
+        rows = (model.objects.filter(artwork__is_published=True).order_by()
+                .values_list('user_id', 'artwork_id', 'created_at'))
+        for user_id, artwork_id, created_at in rows.iterator(chunk_size=10000):
+            columns[0].append(user_id)
+            columns[1].append(artwork_id)
+            columns[2].append(WEIGHTS[kind])
+            columns[3].append(created_at.timestamp())
+    users = np.array(columns[0], dtype=np.int64)
+    items = np.array(columns[1], dtype=np.int64)
+    weights = np.array(columns[2], dtype=float)
+    moments = np.array(columns[3], dtype=float)
+
+    if not len(users):
+        return users, items, weights
+
+    # newest first within each user, then cap each user's history
+    order = np.lexsort((-moments, users))
+    users, items, weights = users[order], items[order], weights[order]
+    starts = np.flatnonzero(np.r_[True, users[1:] != users[:-1]])
+    rank = np.arange(len(users)) - np.repeat(starts, np.diff(np.r_[starts, len(users)]))
+    keep = rank < MAX_ITEMS_PER_USER
+    users, items, weights = users[keep], items[keep], weights[keep]
+
+    # a like and a bookmark of the same artwork add up
+    keys, inverse = np.unique(np.stack([users, items]), axis=1, return_inverse=True)
+    return keys[0], keys[1], np.bincount(inverse.ravel(), weights=weights, minlength=keys.shape[1])
+
+
+def _compressed(major, minor, weights, size):
+    """Sort entries by `major` -> (pointer array, minor indices, weights)."""
+    order = np.argsort(major, kind='stable')
+    pointers = np.zeros(size + 1, dtype=np.int64)
+    np.cumsum(np.bincount(major, minlength=size), out=pointers[1:])
+    return pointers, minor[order], weights[order]
+
+
+def _blocks(costs, max_pairs):
+    """Cut 0..len(costs) into ranges whose summed cost stays under max_pairs (one item at least)."""
+    bounds = np.cumsum(costs)
+    start = 0
+    while start < len(costs):
+        done = bounds[start - 1] if start else 0
+        stop = max(int(np.searchsorted(bounds, done + max_pairs, side='right')), start + 1)
+        yield start, stop
+        start = stop
+
+
+def _block_neighbours(start, stop, item_ptr, item_users, item_weights,
+                      user_ptr, user_items, user_weights, norms, top_k):
+    """Top-K cosine neighbours of items start..stop-1 -> (items, neighbours, scores)."""
+    span = slice(item_ptr[start], item_ptr[stop])
+    users = item_users[span]
+    left = np.repeat(np.arange(start, stop), np.diff(item_ptr[start:stop + 1]))
+    left_weights = item_weights[span]
+
+    # expand every (user, i) into the user's row: (i, j, w_ui * w_uj)
+    lengths = user_ptr[users + 1] - user_ptr[users]
+    total = int(lengths.sum())
+    offsets = np.repeat(user_ptr[users] - (np.cumsum(lengths) - lengths), lengths)
+    positions = offsets + np.arange(total)
+    i = np.repeat(left, lengths)
+    j = user_items[positions]
+    products = np.repeat(left_weights, lengths) * user_weights[positions]
+    distinct = i != j
+    i, j, products = i[distinct], j[distinct], products[distinct]
+    if not len(i):
+        return i, j, products
+
+    # sum the products of each (i, j) pair
+    width = len(norms)
+    pairs, inverse = np.unique((i - start) * width + j, return_inverse=True)
+    dots = np.bincount(inverse, weights=products, minlength=len(pairs))
+    i, j = pairs // width + start, pairs % width
+    scores = dots / (norms[i] * norms[j])
+
+    # best K per item
+    order = np.lexsort((j, -scores, i))
+    i, j, scores = i[order], j[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, i[1:] != i[:-1]])
+    rank = np.arange(len(i)) - np.repeat(starts, np.diff(np.r_[starts, len(i)]))
+    keep = (rank < top_k) & (scores >= MIN_SCORE)
+    return i[keep], j[keep], scores[keep]
+
+
+def _replace(low, high, artwork_ids, neighbor_ids, scores):
+    """Swap in the neighbour lists of every artwork with low <= id <= high."""
+    stale = ArtworkSimilarity.objects.filter(artwork_id__gte=low)
+    if high is not None:
+        stale = stale.filter(artwork_id__lte=high)
+    with transaction.atomic():
+        stale.delete()
+        ArtworkSimilarity.objects.bulk_create(
+            [ArtworkSimilarity(artwork_id=a, neighbor_id=n, score=round(s, 6))
+             for a, n, s in zip(artwork_ids, neighbor_ids, scores)],
+            batch_size=BATCH_SIZE)
+
+
+def compute(top_k=TOP_K, max_pairs=MAX_PAIRS):
+    """Rebuild ArtworkSimilarity. Returns (artworks with interactions, rows written, blocks)."""
+    users, items, weights = _interactions()
+    if not len(items):
+        _replace(0, None, [], [], [])
+        return 0, 0, 0
+
+    item_ids, item_index = np.unique(items, return_inverse=True)
+    user_ids, user_index = np.unique(users, return_inverse=True)
+    user_ptr, user_items, user_weights = _compressed(user_index, item_index, weights, len(user_ids))
+    item_ptr, item_users, item_weights = _compressed(item_index, user_index, weights, len(item_ids))
+    norms = np.sqrt(np.bincount(item_index, weights=weights ** 2, minlength=len(item_ids)))
+
+    # cost of an item = number of (i, j) products it expands into
+    row_lengths = np.diff(user_ptr)
+    costs = np.bincount(item_index, weights=row_lengths[user_index], minlength=len(item_ids))
+
+    written = blocks = 0
+    low = 0
+    for start, stop in _blocks(costs, max_pairs):
+        i, j, scores = _block_neighbours(start, stop, item_ptr, item_users, item_weights,
+                                         user_ptr, user_items, user_weights, norms, top_k)
+        # the id range also covers artworks that lost all their interactions
+        high = int(item_ids[stop - 1])
+        _replace(low, high, item_ids[i].tolist(), item_ids[j].tolist(), scores.tolist())
+        low = high + 1
+        written += len(i)
+        blocks += 1
+    _replace(low, None, [], [], [])
+    return len(item_ids), written, blocks
@@ -0,0 +1,107 @@
+"""
+Slug allocation for Artwork, Category and Tag.
+
+A new row's slug is its slugified source (see the models' slug_base()), or,
+when that is taken, the source with the next free numeric suffix:
+`green-tara-2024`, `green-tara-2024-2`, `green-tara-2024-3`. allocate()
+does this for a whole batch of sources with one query per QUERY_BATCH
+distinct bases, which fetches every existing slug that is a base or a
+base-N, as a range on the unique index rather than a LIKE (SQLite's LIKE
+can't use it).
+
+The unique constraint stays the arbiter between concurrent writers: two
+requests can allocate the same slug, and the one that inserts second gets
+an IntegrityError, after which save_new() and SlugQuerySet.bulk_create()
+allocate again from what is in the table by then.
+
+The lookups run on the database the rows are written to: a replica that lags
+behind would miss slugs taken a moment ago.
+"""
+import re
+
+from django.db import IntegrityError, models, router, transaction
+
+QUERY_BATCH = 200  # distinct bases per lookup query
+ATTEMPTS = 5  # allocations per save before a collision is let through
+SUFFIX_ROOM = 8  # '-' and up to 7 digits
+SUFFIXED = re.compile(r'^(.+)-(\d+)$')
+
+
+def _writes(model):
+    return model._default_manager.db_manager(router.db_for_write(model))
+
+
+def _taken(model, bases):
+    """{base: set of suffixes in use}, 1 standing for the bare base."""
+    taken = {base: set() for base in bases}
+    bases = sorted(taken)
+    for start in range(0, len(bases), QUERY_BATCH):
+        condition = models.Q()
+        for base in bases[start:start + QUERY_BATCH]:
+            # '.' sorts right after '-': the range holds exactly the slugs starting with base-
+            condition |= models.Q(slug=base) | models.Q(slug__gt=base + '-', slug__lt=base + '.')
+        for slug in _writes(model).filter(condition).values_list('slug', flat=True):
+            if slug in taken:
+                taken[slug].add(1)
+            match = SUFFIXED.match(slug)
+            if match and match.group(1) in taken:
+                taken[match.group(1)].add(int(match.group(2)))
+    return taken
+
+
+def allocate(model, bases):
+    """Unique slugs for a list of slugified sources, in order; duplicates within the list get suffixes too."""
+    max_length = model._meta.get_field('slug').max_length - SUFFIX_ROOM
+    bases = [base[:max_length].strip('-') or model._meta.model_name for base in bases]
+    taken = _taken(model, set(bases))
+    slugs = []
+    for base in bases:
+        used = taken[base]
+        # past the highest suffix rather than into a gap: a deleted artwork's URL doesn't come back
+        suffix = max(used) + 1 if used else 1
+        used.add(suffix)
+        slugs.append(base if suffix == 1 else f'{base}-{suffix}')
+    return slugs
+
+
+def _collided(model, objs):
+    slugs = [obj.slug for obj in objs]
+    return _writes(model).filter(slug__in=slugs).exists()
+
+
+def save_new(instance, save, *args, **kwargs):
+    """Run `save` (the model's own save) with an allocated slug, reallocating when another writer took it."""
+    model = type(instance)
+    for attempt in range(ATTEMPTS):
+        instance.slug = allocate(model, [instance.slug_base()])[0]
+        try:
+            with transaction.atomic(using=kwargs.get('using')):
+                return save(*args, **kwargs)
+        except IntegrityError:
+            if attempt == ATTEMPTS - 1 or not _collided(model, [instance]):
+                instance.slug = ''
+                raise
+
+
+class SlugQuerySet(models.QuerySet):
+    """bulk_create() allocates the slugs of the rows that have none (save() isn't called for them)."""
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        unslugged = [obj for obj in objs if not obj.slug]
+        if not unslugged or kwargs.get('ignore_conflicts'):
+            self._assign(unslugged)
+            return super().bulk_create(objs, *args, **kwargs)
+        for attempt in range(ATTEMPTS):
+            self._assign(unslugged)
+            try:
+                with transaction.atomic(using=self.db):
+                    return super().bulk_create(objs, *args, **kwargs)
+            except IntegrityError:
+                if attempt == ATTEMPTS - 1 or not _collided(self.model, unslugged):
+                    raise
+
+    def _assign(self, objs):
+        for obj, slug in zip(objs, allocate(self.model, [obj.slug_base() for obj in objs])):
+            obj.slug = slug
+
@@ -0,0 +1,123 @@
+// Artist dashboard: feed infinite scroll, floating upload panel, like / bookmark buttons.
+(function(){
+  const feed = document.getElementById('feed');
+  const loadingEl = document.getElementById('loading');
+  if (!feed) return;
+  const esc = Thangka.escapeHtml;
+  let page = 2;
+  let loading = false;
+
+  async function loadMore(){
+    if (loading) return;
+    loading = true;
+    loadingEl.style.display = 'block';
+    try {
+      const res = await fetch(`${feed.dataset.feedUrl}?page=${page}`);
+      const data = await res.json();
+      if (data.items && data.items.length){
+        data.items.forEach(item=>{
+          const art = document.createElement('article');
+          art.className = 'card';
+          art.innerHTML = `
+            ${Thangka.cardImage(item, false)}
+            <div class="card-body"><h3>${esc(item.title)}</h3><p class="muted">${esc(item.artist)}</p></div>
+          `;
+          feed.appendChild(art);
+        });
+        page++;
+        loading = false;
+        loadingEl.style.display = 'none';
+      } else {
+        // no more
+        loadingEl.innerText = 'No more artworks';
+      }
+    } catch(e){
+      console.error(e);
+      loadingEl.innerText = 'Error loading';
+    }
+  }
+
+  Thangka.onNearBottom(800, loadMore);
+
+  document.addEventListener('click', function(e){
+    // like
+    if (e.target.matches('.btn-like')){
+      const span = e.target.querySelector('.likes-count');
+      Thangka.postForm(feed.dataset.likeUrl, {artwork_id: e.target.dataset.id}).then(res=>{
+        if (res.status==='ok'){ span.innerText = res.likes_count; e.target.classList.toggle('active'); }
+      }).catch(console.error);
+    }
+    // bookmark
+    if (e.target.matches('.btn-bookmark')){
+      Thangka.postForm(feed.dataset.bookmarkUrl, {artwork_id: e.target.dataset.id}).then(res=>{
+        if (res.status==='ok'){ e.target.innerText = (res.action==='saved' ? 'Saved' : 'Save'); }
+      }).catch(console.error);
+    }
+  });
+})();
+
+(function(){
+  const toggle = document.getElementById('uploadToggle');
+  const panel = document.getElementById('floatingUpload');
+  const closeBtn = document.getElementById('uploadClose');
+  const minimize = document.getElementById('uploadMinimize');
+  if (!toggle || !panel) return;
+
+  function openPanel(){
+    panel.classList.add('open');
+    panel.setAttribute('aria-hidden','false');
+    toggle.setAttribute('aria-expanded','true');
+  }
+  function closePanel(){
+    panel.classList.remove('open');
+    panel.setAttribute('aria-hidden','true');
+    toggle.setAttribute('aria-expanded','false');
+  }
+
+  toggle.addEventListener('click', ()=> {
+    if (panel.classList.contains('open')) closePanel(); else openPanel();
+  });
+  closeBtn.addEventListener('click', closePanel);
+  minimize.addEventListener('click', closePanel);
+})();
+
+// Analytics: one bar per hour / day of the chosen metric, from the rollup API.
+(function(){
+  const box = document.getElementById('analytics');
+  if (!box) return;
+  const chart = document.getElementById('analyticsChart');
+  const totals = document.getElementById('analyticsTotals');
+  const controls = ['analyticsMetric', 'analyticsRange', 'analyticsArtwork'].map(id=>document.getElementById(id));
+  const [metric, range, artwork] = controls;
+  const LABELS = {views: 'views', likes: 'likes', bookmarks: 'saves', reviews: 'reviews', follows: 'follows'};
+  let data = null;
+
+  function draw(){
+    if (!data) return;
+    const points = data.series;
+    const values = points.map(p=>p[metric.value]);
+    const max = Math.max(1, ...values);
+    const width = 600 / points.length;
+    chart.innerHTML = points.map((p, i)=>{
+      const height = 150 * values[i] / max;
+      return `<rect x="${(i * width).toFixed(2)}" y="${(160 - height).toFixed(2)}" width="${Math.max(width - 1, 0.5).toFixed(2)}"`
+        + ` height="${height.toFixed(2)}"><title>${Thangka.escapeHtml(p.t)}: ${values[i]}</title></rect>`;
+    }).join('');
+    totals.textContent = Object.keys(LABELS).map(k=>`${data.totals[k]} ${LABELS[k]}`).join(' · ')
+      + (data.as_of ? ` (as of ${new Date(data.as_of).toLocaleString()})` : '');
+  }
+
+  function load(){
+    const [granularity, days] = range.value.split(':');
+    const url = new URL(box.dataset.url, window.location.origin);
+    url.searchParams.set('granularity', granularity);
+    url.searchParams.set('days', days);
+    if (artwork.value) url.searchParams.set('artwork', artwork.value);
+    fetch(url).then(r=>r.json()).then(json=>{ data = json; draw(); }).catch(console.error);
+  }
+
+  metric.addEventListener('change', draw);
+  range.addEventListener('change', load);
+  artwork.addEventListener('change', load);
+  load();
+})();
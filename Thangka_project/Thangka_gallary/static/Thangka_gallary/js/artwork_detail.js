@@ -0,0 +1,32 @@
+// Artwork page: load further reviews from the keyset-paginated JSON endpoint.
+(function(){
+  const list = document.getElementById('reviews');
+  const button = document.getElementById('more-reviews');
+  if (!list || !button) return;
+  const escapeHtml = Thangka.escapeHtml;
+  let cursor = list.dataset.cursor;
+
+  function render(review){
+    const when = new Date(review.created_at).toLocaleDateString(undefined, {month: 'short', day: '2-digit', year: 'numeric'});
+    const div = document.createElement('div');
+    div.className = 'review';
+    div.innerHTML = `<p><strong>${escapeHtml(review.user)}</strong>
+      <span class="u-muted">${escapeHtml(review.rating)}★ · ${escapeHtml(when)}</span></p>` +
+      (review.comment ? `<p>${escapeHtml(review.comment)}</p>` : '');
+    list.appendChild(div);
+  }
+
+  button.addEventListener('click', function(){
+    if (!cursor) return;
+    button.disabled = true;
+    fetch(`${list.dataset.moreUrl}?cursor=${encodeURIComponent(cursor)}`)
+      .then(r=>r.json())
+      .then(data=>{
+        data.items.forEach(render);
+        cursor = data.next;
+        if (!cursor) button.remove();
+      })
+      .catch(err=>console.error(err))
+      .finally(()=>{ button.disabled = false; });
+  });
+})();
@@ -0,0 +1,67 @@
+// Multi-selects rendered by AutocompleteSelectMultiple (forms.py) hold only
+// the chosen rows; this adds a search box above each one that suggests names
+// from /api/autocomplete/ as the user types and adds the picked ones.
+(function(){
+  const DELAY = 120;
+
+  function attach(select){
+    const box = document.createElement('div');
+    box.className = 'autocomplete';
+    const input = document.createElement('input');
+    input.type = 'search';
+    input.autocomplete = 'off';
+    input.placeholder = 'Type to add ' + select.dataset.autocomplete + '…';
+    const list = document.createElement('ul');
+    list.className = 'autocomplete-results';
+    list.hidden = true;
+    box.appendChild(input);
+    box.appendChild(list);
+    select.parentNode.insertBefore(box, select);
+
+    const answers = new Map();  // query -> results, so backspacing doesn't refetch
+    let timer = null, latest = '';
+
+    function lookup(q){
+      if (answers.has(q)) return Promise.resolve(answers.get(q));
+      const url = new URL(select.dataset.autocompleteUrl, window.location.origin);
+      url.searchParams.set('kind', select.dataset.autocomplete);
+      url.searchParams.set('q', q);
+      return fetch(url).then(r=>r.json()).then(data=>{
+        answers.set(q, data.results);
+        return data.results;
+      });
+    }
+
+    function show(results){
+      list.innerHTML = results.map(r=>
+        `<li><button type="button" data-id="${r.id}">${Thangka.escapeHtml(r.name)}</button></li>`).join('');
+      list.hidden = !results.length;
+    }
+
+    input.addEventListener('input', function(){
+      clearTimeout(timer);
+      const q = input.value.trim();
+      latest = q;
+      if (!q){ show([]); return; }
+      timer = setTimeout(function(){
+        lookup(q).then(results=>{ if (q === latest) show(results); }).catch(()=>show([]));
+      }, DELAY);
+    });
+
+    list.addEventListener('click', function(e){
+      const button = e.target.closest('button[data-id]');
+      if (!button) return;
+      let option = Array.from(select.options).find(o=>o.value === button.dataset.id);
+      if (!option){
+        option = new Option(button.textContent, button.dataset.id);
+        select.appendChild(option);
+      }
+      option.selected = true;
+      input.value = '';
+      show([]);
+      input.focus();
+    });
+  }
+
+  document.querySelectorAll('select[data-autocomplete]').forEach(attach);
+})();
@@ -0,0 +1,105 @@
+// Helpers shared by the gallery and dashboard page scripts.
+window.Thangka = (function(){
+  function csrfToken(){
+    return (document.cookie.match(/csrftoken=([^;]+)/)||[])[1];
+  }
+
+  function postForm(url, fields){
+    const fd = new FormData();
+    Object.keys(fields).forEach(function(k){ fd.append(k, fields[k]); });
+    return fetch(url, {
+      method: 'POST',
+      headers: {'X-CSRFToken': csrfToken()},
+      body: fd
+    }).then(r=>r.json());
+  }
+
+  const ESCAPES = {'&': '&amp;', '<': '&lt;', '>': '&gt;', '"': '&quot;', "'": '&#39;'};
+  function escapeHtml(value){
+    return String(value == null ? '' : value).replace(/[&<>"']/g, c=>ESCAPES[c]);
+  }
+
+  // <img> of a feed item's thumbnail, sized and painted with its placeholder before it loads
+  function cardImage(item, lazy){
+    if (!item.thumb) return '';
+    let attrs = lazy ? ' loading="lazy"' : '';
+    if (item.thumb_width) attrs += ` width="${item.thumb_width}" height="${item.thumb_height}"`;
+    if (item.placeholder) attrs += ` class="lqip" style="background-image: url(${escapeHtml(item.placeholder)})"`;
+    return `<img${attrs} src="${escapeHtml(item.thumb)}" alt="${escapeHtml(item.title)}">`;
+  }
+
+  // call fn whenever the user scrolls within `margin` px of the page bottom
+  function onNearBottom(margin, fn){
+    function handler(){
+      if ((window.innerHeight + window.scrollY) >= (document.body.offsetHeight - margin)) fn();
+    }
+    window.addEventListener('scroll', handler);
+    return function(){ window.removeEventListener('scroll', handler); };
+  }
+
+  // Like / bookmark / follow changes, queued in localStorage and sent to the
+  // batch endpoint a moment later. Each entry is the desired end state, so
+  // entries queued while offline are simply replayed once we're back online.
+  function EngagementQueue(url, onApplied){
+    this.url = url;
+    this.onApplied = onApplied || function(){};
+    this.timer = null;
+    this.inFlight = false;
+    this.retryAt = 0;
+    window.addEventListener('online', ()=>this.flush());
+  }
+  EngagementQueue.STORAGE_KEY = 'thangka:engagement-queue';
+  EngagementQueue.prototype.load = function(){
+    try { return JSON.parse(localStorage.getItem(EngagementQueue.STORAGE_KEY)) || []; }
+    catch(e){ return []; }
+  };
+  EngagementQueue.prototype.save = function(actions){
+    localStorage.setItem(EngagementQueue.STORAGE_KEY, JSON.stringify(actions));
+  };
+  EngagementQueue.prototype.push = function(type, id, on){
+    const actions = this.load();
+    actions.push({type: type, id: Number(id), on: on});
+    this.save(actions);
+    clearTimeout(this.timer);
+    this.timer = setTimeout(()=>this.flush(), 400);
+  };
+  EngagementQueue.prototype.flush = function(){
+    if (this.inFlight || !navigator.onLine) return;
+    const actions = this.load();
+    if (!actions.length) return;
+    const wait = this.retryAt - Date.now();
+    if (wait > 0){
+      // rate limited: send everything queued meanwhile once the server lets us
+      clearTimeout(this.timer);
+      this.timer = setTimeout(()=>this.flush(), wait);
+      return;
+    }
+    this.inFlight = true;
+    this.save([]);
+    fetch(this.url, {
+      method: 'POST',
+      headers: {'X-CSRFToken': csrfToken(), 'Content-Type': 'application/json'},
+      body: JSON.stringify({actions: actions})
+    }).then(r=>{
+      if (r.status === 429){
+        this.retryAt = Date.now() + (Number(r.headers.get('Retry-After')) || 5) * 1000;
+        this.timer = setTimeout(()=>this.flush(), this.retryAt - Date.now());
+        throw new Error('rate limited');
+      }
+      if (r.status >= 500) throw new Error('retry later');
+      // redirected to login / rejected: nothing to retry
+      if (r.redirected || !r.ok) return {};
+      return r.json();
+    }).then(res=>{
+      this.onApplied(res);
+    }).catch(()=>{
+      // keep the actions (ahead of anything queued meanwhile) for the next flush
+      this.save(actions.concat(this.load()));
+    }).finally(()=>{
+      this.inFlight = false;
+    });
+  };
+
+  return {csrfToken: csrfToken, postForm: postForm, escapeHtml: escapeHtml, cardImage: cardImage,
+          onNearBottom: onNearBottom, EngagementQueue: EngagementQueue};
+})();
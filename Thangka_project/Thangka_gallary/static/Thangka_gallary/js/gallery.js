@@ -0,0 +1,104 @@
+// Explore page: infinite scroll, per-user state hydration, batched like / bookmark buttons.
+(function(){
+  const feed = document.getElementById('pinterest-feed');
+  const loader = document.getElementById('feed-loading');
+  if (!feed) return;
+  const esc = Thangka.escapeHtml;
+  let page = 2;
+  let loading = false;
+  let stop = null;
+
+  const queue = new Thangka.EngagementQueue(feed.dataset.batchUrl, function(res){
+    Object.keys(res.likes_count || {}).forEach(id=>{
+      const btn = feed.querySelector(`.btn-like[data-id="${id}"] .likes-count`);
+      if (btn) btn.innerText = res.likes_count[id];
+    });
+  });
+
+  // the HTML is identical for everyone; fill in this user's liked / saved flags
+  // and the like counts (the cached feed pages don't carry them)
+  function hydrate(cards){
+    const ids = cards.map(c=>c.dataset.id).filter(Boolean);
+    if (!ids.length) return;
+    fetch(feed.dataset.stateUrl + '?ids=' + ids.join(','), {credentials: 'same-origin'})
+      .then(r=>r.json()).then(state=>{
+        Object.keys(state.likes_count || {}).forEach(id=>{
+          const count = feed.querySelector(`.btn-like[data-id="${id}"] .likes-count`);
+          if (count) count.innerText = state.likes_count[id];
+        });
+        state.liked.forEach(id=>{
+          const btn = feed.querySelector(`.btn-like[data-id="${id}"]`);
+          if (btn) btn.classList.add('active');
+        });
+        state.bookmarked.forEach(id=>{
+          const btn = feed.querySelector(`.btn-bookmark[data-id="${id}"]`);
+          if (btn) btn.innerText = 'Saved';
+        });
+      }).catch(()=>{});
+  }
+
+  async function loadPage(){
+    if (loading) return;
+    loading = true;
+    loader.style.display = 'block';
+    try {
+      const url = new URL(feed.dataset.feedUrl, window.location.href);
+      url.searchParams.set('page', page);
+      const res = await fetch(url);
+      const data = await res.json();
+      const added = [];
+      data.items.forEach(item=>{
+        const art = document.createElement('article');
+        art.className = 'card';
+        art.dataset.id = item.id;
+        art.innerHTML = `
+          ${Thangka.cardImage(item, true)}
+          <div class="card-body">
+            <h3>${esc(item.title)}</h3>
+            <p class="muted">${esc(item.artist)}</p>
+            <div class="card-actions">
+              <button class="btn-like" data-id="${item.id}">❤ <span class="likes-count">0</span></button>
+              <button class="btn-bookmark" data-id="${item.id}">Save</button>
+              <a class="btn" href="${esc(item.url)}">View</a>
+            </div>
+          </div>`;
+        feed.appendChild(art);
+        added.push(art);
+      });
+      hydrate(added);
+      if (!data.has_next) {
+        loader.innerText = 'No more';
+        stop();
+      } else {
+        page++;
+        loader.style.display = 'none';
+        loading = false;
+      }
+    } catch(e){
+      console.error(e);
+      loader.innerText = 'Error';
+    }
+  }
+
+  stop = Thangka.onNearBottom(900, loadPage);
+  hydrate(Array.from(feed.querySelectorAll('article.card')));
+  queue.flush();
+
+  document.addEventListener('click', function(e){
+    // optimistic update; the queue sends the new state in the next batch
+    const like = e.target.closest('.btn-like');
+    if (like){
+      const on = !like.classList.contains('active');
+      const count = like.querySelector('.likes-count');
+      like.classList.toggle('active', on);
+      count.innerText = Math.max(0, Number(count.innerText) + (on ? 1 : -1));
+      queue.push('like', like.dataset.id, on);
+    }
+    const bookmark = e.target.closest('.btn-bookmark');
+    if (bookmark){
+      const on = bookmark.innerText.trim() !== 'Saved';
+      bookmark.innerText = on ? 'Saved' : 'Save';
+      queue.push('bookmark', bookmark.dataset.id, on);
+    }
+  });
+})();
@@ -0,0 +1,136 @@
+// Upload page: files above the form's data-chunked-threshold skip the form post
+// and go to /api/uploads/ in chunks, each with its SHA-256. A dropped chunk is
+// retried with backoff; a reload picks up where the server says it stopped
+// (sessions are remembered in localStorage per file).
+(function(){
+  const form = document.getElementById('uploadForm');
+  if (!form) return;
+  const threshold = parseInt(form.dataset.chunkedThreshold, 10);
+  const initUrl = form.dataset.uploadsUrl;
+  const progress = document.getElementById('uploadProgress');
+  const input = document.getElementById('id_images');
+  const RETRIES = 6;
+
+  function storageKey(file){
+    return 'thangka-upload:' + [file.name, file.size, file.lastModified].join(':');
+  }
+
+  function hex(buffer){
+    return Array.from(new Uint8Array(buffer), b=>b.toString(16).padStart(2, '0')).join('');
+  }
+
+  // crypto.subtle only exists on https (and localhost); the server accepts chunks without a checksum
+  function sha256(blob){
+    if (!(window.crypto && crypto.subtle)) return Promise.resolve('');
+    return blob.arrayBuffer().then(buf=>crypto.subtle.digest('SHA-256', buf)).then(hex);
+  }
+
+  function request(method, url, body, headers){
+    return fetch(url, {
+      method: method,
+      headers: Object.assign({'X-CSRFToken': Thangka.csrfToken()}, headers || {}),
+      body: body
+    }).then(r=>r.json().catch(()=>({})).then(data=>({status: r.status, data: data})));
+  }
+
+  function sleep(ms){ return new Promise(resolve=>setTimeout(resolve, ms)); }
+
+  // run fn until it resolves; network errors and 5xx are retried with exponential backoff
+  function withRetry(fn){
+    let attempt = 0;
+    function run(){
+      return fn().then(res=>{
+        if (res.status >= 500) throw new Error('server error ' + res.status);
+        return res;
+      }).catch(err=>{
+        if (++attempt > RETRIES) throw err;
+        return sleep(Math.min(30000, 500 * 2 ** attempt)).then(run);
+      });
+    }
+    return run();
+  }
+
+  function row(file){
+    const el = document.createElement('div');
+    el.className = 'upload-file';
+    el.innerHTML = '<span>' + Thangka.escapeHtml(file.name) + '</span><progress max="' + file.size + '" value="0"></progress>';
+    progress.appendChild(el);
+    return el;
+  }
+
+  function openSession(file, artworkId){
+    const saved = localStorage.getItem(storageKey(file));
+    const resume = saved ? withRetry(()=>request('GET', saved)) : Promise.resolve({status: 404});
+    return resume.then(res=>{
+      if (res.status === 200 && res.data.state === 'open') return res.data;
+      const fields = {artwork_id: artworkId, filename: file.name, size: file.size};
+      return withRetry(()=>request('POST', initUrl, JSON.stringify(fields), {'Content-Type': 'application/json'}))
+        .then(res=>{
+          if (res.status !== 201) throw new Error(res.data.message || 'could not start the upload');
+          localStorage.setItem(storageKey(file), res.data.url);
+          return res.data;
+        });
+    });
+  }
+
+  function sendFile(file, artworkId){
+    const bar = row(file).querySelector('progress');
+    return openSession(file, artworkId).then(session=>{
+      function next(offset){
+        bar.value = offset;
+        if (offset >= file.size){
+          return withRetry(()=>request('POST', session.url + 'complete/')).then(res=>{
+            if (res.status !== 200) throw new Error(res.data.message || 'upload failed');
+            localStorage.removeItem(storageKey(file));
+          });
+        }
+        const chunk = file.slice(offset, Math.min(file.size, offset + session.chunk_size));
+        return sha256(chunk).then(digest=>withRetry(()=>request(
+          'PUT', session.url + '?offset=' + offset, chunk, digest ? {'X-Chunk-SHA256': digest} : {}
+        ))).then(res=>{
+          // 409: the server has a different byte count (e.g. a retried chunk already landed)
+          if ((res.status === 200 || res.status === 409) && res.data.state === 'open') return next(res.data.received);
+          if (res.status === 422) return next(offset);  // corrupted on the way: send it again
+          throw new Error(res.data.message || 'upload failed');
+        });
+      }
+      return next(session.received);
+    });
+  }
+
+  form.addEventListener('submit', function(e){
+    const large = Array.from(input.files).filter(f=>f.size > threshold);
+    if (!large.length || !window.fetch) return;  // plain form post
+    e.preventDefault();
+    const fd = new FormData(form);
+    fd.delete('images');
+    Array.from(input.files).filter(f=>f.size <= threshold).forEach(f=>fd.append('images', f));
+    fd.append('chunked', '1');
+    progress.hidden = false;
+    progress.innerHTML = '';
+    form.querySelector('button[type=submit]').disabled = true;
+
+    // after a failed transfer the artwork already exists: only the files are sent again
+    const created = form.dataset.created ? Promise.resolve(JSON.parse(form.dataset.created)) :
+      fetch(form.action || window.location.href, {method: 'POST', body: fd, headers: {'X-CSRFToken': Thangka.csrfToken()}})
+        .then(r=>r.json().then(data=>({status: r.status, data: data})));
+    created
+      .then(res=>{
+        if (res.status !== 200){
+          const errors = Object.keys(res.data.errors || {}).map(k=>k + ': ' + res.data.errors[k].join(' '));
+          throw new Error(errors.join('; ') || 'please correct the form');
+        }
+        form.dataset.created = JSON.stringify(res);
+        // one file at a time keeps a single request's worth of the file in memory
+        return large.reduce((done, file)=>done.then(()=>sendFile(file, res.data.artwork_id)), Promise.resolve())
+          .then(()=>{ window.location.href = res.data.redirect; });
+      })
+      .catch(err=>{
+        const el = document.createElement('div');
+        el.className = 'upload-error';
+        el.textContent = err.message + ' - submit again to resume.';
+        progress.appendChild(el);
+        form.querySelector('button[type=submit]').disabled = false;
+      });
+  });
+})();
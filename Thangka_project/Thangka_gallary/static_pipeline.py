@@ -0,0 +1,151 @@
+"""
+Static asset pipeline used by ``collectstatic``.
+
+* content-hashed file names + ``staticfiles.json`` manifest (ManifestStaticFilesStorage)
+* page script bundles declared in ``settings.STATIC_BUNDLES``, concatenated and minified
+* ``.gz`` / ``.br`` siblings written next to every compressible file, so the
+  server can send them without compressing on the fly
+"""
+import gzip
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; only .gz copies are written without it
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.json', '.txt', '.html', '.xml', '.map')
+# don't bother keeping a compressed copy unless it saves at least this much
+MIN_SAVING = 0.05
+
+
+def minify_js(source):
+    """
+    Conservative whitespace minifier: drops indentation, blank lines and
+    whole-line ``//`` comments. It never rewrites tokens, and lines that
+    start or end inside a template literal keep their whitespace there, so
+    string and template literals, regexes and URLs are left intact.
+    """
+    lines = []
+    state = _LiteralState()
+    for line in source.splitlines():
+        if state.in_template():
+            # the line break and indentation are part of the literal's value
+            state.scan(line)
+            lines.append(line.rstrip() if not state.in_template() else line)
+            continue
+        stripped = line.strip()
+        if not stripped or stripped.startswith('//'):
+            continue
+        state.scan(line)
+        lines.append(line.lstrip() if state.in_template() else stripped)
+    return '\n'.join(lines) + '\n'
+
+
+class _LiteralState:
+    """
+    Whether the end of the lines scanned so far is inside a template literal.
+    Follows quotes, comments and ${...} nesting (with its own strings and
+    literals); a backtick inside a regex literal isn't recognised.
+    """
+
+    def __init__(self):
+        self.stack = []  # '`' for template text, an int (open braces) for a ${...} in it
+        self.comment = False
+
+    def in_template(self):
+        return bool(self.stack) and self.stack[-1] == '`'
+
+    def scan(self, line):
+        stack = self.stack
+        quote = None  # ' and " strings end with their line
+        i = 0
+        while i < len(line):
+            c = line[i]
+            if self.comment:
+                if line.startswith('*/', i):
+                    self.comment = False
+                    i += 1
+            elif self.in_template():
+                if c == '\\':
+                    i += 1
+                elif c == '`':
+                    stack.pop()
+                elif line.startswith('${', i):
+                    stack.append(0)
+                    i += 1
+            elif quote:
+                if c == '\\':
+                    i += 1
+                elif c == quote:
+                    quote = None
+            elif line.startswith('//', i):
+                break
+            elif line.startswith('/*', i):
+                self.comment = True
+                i += 1
+            elif c in '\'"':
+                quote = c
+            elif c == '`':
+                stack.append('`')
+            elif c == '{' and stack:
+                stack[-1] += 1
+            elif c == '}' and stack:
+                if stack[-1]:
+                    stack[-1] -= 1
+                else:
+                    stack.pop()
+            i += 1
+
+
+def compressed_variants(data):
+    """Yield (suffix, bytes) for each encoding that is worth storing."""
+    limit = len(data) * (1 - MIN_SAVING)
+    gz = gzip.compress(data, compresslevel=9, mtime=0)
+    if len(gz) < limit:
+        yield '.gz', gz
+    if brotli is not None:
+        br = brotli.compress(data, quality=11)
+        if len(br) < limit:
+            yield '.br', br
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def post_process(self, paths, dry_run=False, **options):
+        if not dry_run:
+            for bundle, sources in getattr(settings, 'STATIC_BUNDLES', {}).items():
+                self.build_bundle(bundle, sources)
+                paths[bundle] = (self, bundle)
+
+        yield from super().post_process(paths, dry_run, **options)
+
+        if not dry_run:
+            for name in set(self.hashed_files.values()):
+                self.compress(name)
+
+    def build_bundle(self, bundle, sources):
+        parts = []
+        for source in sources:
+            with self.open(source) as f:
+                parts.append(minify_js(f.read().decode('utf-8')))
+        if self.exists(bundle):
+            self.delete(bundle)
+        self._save(bundle, ContentFile(';\n'.join(parts).encode('utf-8')))
+
+    def compress(self, name):
+        if not name.endswith(COMPRESSIBLE_EXTENSIONS):
+            return
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            data = f.read()
+        for suffix, blob in compressed_variants(data):
+            with open(path + suffix, 'wb') as out:
+                out.write(blob)
+
+
+def bundle_sources(bundle):
+    return getattr(settings, 'STATIC_BUNDLES', {}).get(bundle, [])
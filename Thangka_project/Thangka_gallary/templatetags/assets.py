@@ -0,0 +1,21 @@
+from django import template
+from django.conf import settings
+from django.templatetags.static import static
+from django.utils.html import format_html, format_html_join
+
+from Thangka_gallary.static_pipeline import bundle_sources
+
+register = template.Library()
+
+
+@register.simple_tag
+def bundle_scripts(bundle):
+    """
+    <script> tags for a bundle from settings.STATIC_BUNDLES. In DEBUG the
+    individual source files are included (the bundle only exists after
+    collectstatic); otherwise the single hashed, minified bundle.
+    """
+    if settings.DEBUG:
+        return format_html_join('\n', '<script src="{}" defer></script>',
+                                ((static(src),) for src in bundle_sources(bundle)))
+    return format_html('<script src="{}" defer></script>', static(bundle))
@@ -1,3 +1,1185 @@
-from django.test import TestCase
+import csv
+import datetime
+import gzip
+import hashlib
+import io
+import json
+import os
+import random
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import IntegrityError, router
+from PIL import Image
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.contrib.sessions.models import Session
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import analytics, autocomplete, perceptual, publishing, ratings, slugs
+from .blobstore import ContentAddressedStorage, LocalObjectStorage, is_blob_name
+from .exports import COLUMNS, export_stream
+from .management.commands.import_artists import Command as ImportArtists
+from .middleware import ReplicaPinMiddleware
+from .models import (
+    Artist, Artwork, ArtworkImage, ArtworkLike, Bookmark, Category, EngagementDaily, EngagementHourly, Follow,
+    MediaBlob, Notification, Review, RollupWatermark, Tag, UploadSession,
+)
+from .pagination import EstimatedCountPaginator
+from .parallel import process_pool
+from .routers import is_pinned, pin_to_primary, unpin
+from .static_pipeline import minify_js
+from .throttle import hit, parse_rate, shared_cache
+from .views import MAX_BATCH_ACTIONS
+
+User = get_user_model()
+
+# pages render without a collectstatic run (the manifest storage needs one)
+UNHASHED_STATIC = {**settings.STORAGES,
+                   'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}}
+
+
+def png_bytes(color=(180, 40, 20), size=(64, 48)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+def noise_png(seed, size=(96, 72)):
+    # blocks of random grey: unlike a flat colour, every seed gets its own dhash
+    rng = random.Random(seed)
+    small = Image.new('L', (9, 8))
+    small.putdata([rng.randrange(256) for _ in range(72)])
+    buffer = io.BytesIO()
+    small.resize(size, Image.Resampling.NEAREST).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+class TemporaryMediaMixin:
+    """MEDIA_ROOT and CHUNKED_UPLOAD_DIR in a scratch directory, side by side as in settings.py."""
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root)
+        self.media_root = os.path.join(root, 'media')
+        self.upload_dir = os.path.join(root, 'var', 'uploads')
+        override = override_settings(MEDIA_ROOT=self.media_root, CHUNKED_UPLOAD_DIR=self.upload_dir)
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+# Worker processes are spawned and import this module by name, so their task
+# functions live at module level.
+
+def _spawned(_):
+    time.sleep(0.2)  # long enough for every worker of the pool to take one
+
+
+def _compute_until(args):
+    # every worker shares one file cache; returns how many times this process recomputed
+    location, key, timeout, deadline = args
+    from .caching import get_or_compute
+    recomputes = 0
+
+    def compute():
+        nonlocal recomputes
+        recomputes += 1
+        time.sleep(0.05)
+        return recomputes
+
+    with override_settings(CACHES={'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}}):
+        while time.time() < deadline:
+            get_or_compute(key, compute, timeout, beta=0)
+            time.sleep(0.005)
+    return recomputes
+
+
+def _take_tokens(args):
+    key, rate, burst, deadline = args
+    from .throttle import hit
+    admitted = 0
+    while time.time() < deadline:
+        admitted += hit(key, rate, burst)[0]
+    return admitted
+
+
+@skipUnless(shared_cache(), "the default cache isn't shared between processes (set THANGKA_REDIS_URL)")
+class RateLimitAcrossProcessesTests(SimpleTestCase):
+    workers = 4
+    seconds = 2.0
+
+    def test_admitted_stays_within_the_limit(self):
+        rate, burst = parse_rate('600/m'), 20
+        key = f'test:{uuid.uuid4().hex}'
+        with process_pool(self.workers) as pool:
+            list(pool.map(_spawned, range(self.workers)))
+            start = time.time()
+            deadline = start + self.seconds
+            admitted = sum(pool.map(_take_tokens, [(key, rate, burst, deadline)] * self.workers))
+        # the sliding window may admit up to one extra window's worth at a boundary
+        self.assertLessEqual(admitted, burst + rate * (deadline - start) + burst)
+        self.assertGreaterEqual(admitted, burst)
+
+
+class ComputeAcrossProcessesTests(SimpleTestCase):
+    """Workers sharing a cache recompute an expiring value once per expiry, not once each."""
+    workers = 4
+    seconds = 2.0
+    timeout = 0.25
+
+    def test_recomputes_are_bounded(self):
+        with tempfile.TemporaryDirectory() as location, process_pool(self.workers) as pool:
+            list(pool.map(_spawned, range(self.workers)))
+            deadline = time.time() + self.seconds
+            args = (location, f'test:{uuid.uuid4().hex}', self.timeout, deadline)
+            recomputes = sum(pool.map(_compute_until, [args] * self.workers))
+        # beta=0: refreshed on expiry only, so the count doesn't depend on the read rate;
+        # the file cache's add() isn't atomic and may let the odd second worker through
+        expiries = self.seconds / self.timeout
+        self.assertLessEqual(recomputes, expiries + self.workers)
+        self.assertGreaterEqual(recomputes, expiries / 2)
+
+
+@override_settings(STORAGES=UNHASHED_STATIC)
+class AdminChangelistQueryTests(TestCase):
+    """The large changelists run as many queries for 150 rows as for 20."""
+
+    CHANGELISTS = [
+        ('artwork', ''),
+        ('artwork', '?q=thangka 1'),
+        ('artwork', '?created_at__year={year}'),
+        ('review', ''),
+        ('review', '?q=user_1'),
+        ('review', '?created_at__year={year}'),
+        ('notification', ''),
+        ('notification', '?q=user_2'),
+        ('notification', '?created_at__year={year}'),
+    ]
+
+    def seed(self, start, stop):
+        # bulk, without signals; every other row a year older, for the date hierarchy
+        users = User.objects.bulk_create(User(username=f'user_{i}') for i in range(start, stop))
+        artists = Artist.objects.bulk_create(Artist(user=user, name=user.username) for user in users)
+        artworks = Artwork.objects.bulk_create(
+            Artwork(title=f'Thangka {i}', slug=f'thangka-{i}', artist=artist)
+            for i, artist in zip(range(start, stop), artists))
+        Review.objects.bulk_create(Review(artwork=a, user=u, rating=4) for a, u in zip(artworks, users))
+        Notification.objects.bulk_create(
+            Notification(user=u, notification_type='like', artwork=a, message='liked')
+            for a, u in zip(artworks, users))
+        older = [artwork.pk for artwork in artworks[::2]]
+        last_year = timezone.now() - datetime.timedelta(days=400)
+        Artwork.objects.filter(pk__in=older).update(created_at=last_year)
+        Review.objects.filter(artwork__in=older).update(created_at=last_year)
+        Notification.objects.filter(artwork__in=older).update(created_at=last_year)
+
+    def urls(self):
+        year = timezone.now().year
+        return [reverse(f'admin:Thangka_gallary_{model}_changelist') + query.format(year=year)
+                for model, query in self.CHANGELISTS]
+
+    def test_query_count_does_not_grow_with_rows(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.seed(0, 20)
+        counts = {}
+        for url in self.urls():
+            self.assertEqual(self.client.get(url).status_code, 200)  # session, user and permissions cached
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            counts[url] = len(queries)
+
+        self.seed(20, 150)
+        for url in self.urls():
+            with self.subTest(url=url), self.assertNumQueries(counts[url]):
+                self.assertEqual(self.client.get(url).status_code, 200)
+
+
+class EstimatedCountPaginatorTests(TestCase):
+    def test_pages_past_the_cap_stay_reachable(self):
+        user = User.objects.create_user('painter')
+        Artwork.objects.bulk_create(
+            Artwork(title=f'Thangka {i}', slug=f'thangka-{i}', artist=user.artist) for i in range(23))
+        queryset = Artwork.objects.filter(artist=user.artist).order_by('pk')
+        with mock.patch('Thangka_gallary.pagination.FILTERED_COUNT_CAP', 10):
+            paginator = EstimatedCountPaginator(queryset, 5)
+            self.assertEqual(paginator.count, 10)
+            self.assertTrue(paginator.page(2).has_next())
+            page = paginator.page(4)
+            self.assertEqual(len(page), 5)
+            self.assertTrue(page.has_next())
+            last = EstimatedCountPaginator(queryset, 5).page(5)
+            self.assertEqual(len(last), 3)
+            self.assertFalse(last.has_next())
+
+
+class AutocompleteTests(TestCase):
+    def setUp(self):
+        fresh = {kind: autocomplete.PrefixIndex(kind) for kind in autocomplete.KINDS}
+        patcher = mock.patch.dict(autocomplete.INDEXES, fresh)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_database_fallback_matches_name_prefixes(self):
+        Tag.objects.bulk_create([Tag(name='Green Tara'), Tag(name='Gold leaf'), Tag(name='Mandala')])
+        names = [item['name'] for item in autocomplete._from_database('tags', 'G', 10)]
+        self.assertEqual(names, ['Gold leaf', 'Green Tara'])
+        self.assertEqual(autocomplete._from_database('tags', 'tara', 10), [])
+
+    def test_bulk_writes_invalidate_loaded_indexes(self):
+        autocomplete.build('tags')
+        autocomplete.build('artists')
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.bulk_create([Tag(name='Gau box')])
+            Artist.objects.bulk_create([Artist(name='Tenzin Norbu')])
+        for kind in ('tags', 'artists'):
+            with self.subTest(kind=kind), mock.patch.object(autocomplete, '_build_in_background') as build:
+                autocomplete.search(kind, 'g')
+                build.assert_called_once_with(autocomplete.INDEXES[kind])
+
+
+@override_settings(CHUNKED_UPLOAD_MAX_CHUNK=100)
+class ChunkedUploadTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('painter')
+        self.artwork = Artwork.objects.create(title='Green Tara', artist=self.user.artist)
+        self.client.force_login(self.user)
+
+    def init(self, data, **fields):
+        fields = {'artwork_id': self.artwork.pk, 'filename': 'scan.png', 'size': len(data), **fields}
+        return self.client.post(reverse('upload_init'), fields, content_type='application/json')
+
+    def put(self, url, chunk, offset, digest=None):
+        headers = {'HTTP_X_CHUNK_SHA256': digest or hashlib.sha256(chunk).hexdigest()}
+        return self.client.put(f'{url}?offset={offset}', chunk, content_type='application/octet-stream', **headers)
+
+    def test_resume_and_complete(self):
+        data = png_bytes()
+        response = self.init(data, sha256=hashlib.sha256(data).hexdigest())
+        self.assertEqual(response.status_code, 201)
+        url = response.json()['url']
+        self.assertEqual(self.put(url, data[:100], 0).json()['received'], 100)
+
+        # a retried chunk is refused with the offset to resume from
+        response = self.put(url, data[:100], 0)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['received'], 100)
+        # a corrupt chunk never reaches the part file
+        self.assertEqual(self.put(url, data[100:200], 100, digest='0' * 64).status_code, 422)
+        self.assertEqual(self.client.get(url).json()['received'], 100)
+        self.assertEqual(self.client.post(url + 'complete/').status_code, 409)
+
+        received = 100
+        while received < len(data):
+            received = self.put(url, data[received:received + 100], received).json()['received']
+        response = self.client.post(url + 'complete/')
+        self.assertEqual(response.status_code, 200)
+        image = ArtworkImage.objects.get(pk=response.json()['image_id'])
+        self.assertEqual(image.artwork, self.artwork)
+        with image.image.open('rb') as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(os.listdir(self.upload_dir), [])
+        # a retried completion answers with the same image
+        self.assertEqual(self.client.post(url + 'complete/').json()['image_id'], image.pk)
+
+    def test_checksum_of_the_whole_file(self):
+        data = png_bytes()
+        url = self.init(data, sha256='0' * 64).json()['url']
+        for offset in range(0, len(data), 100):
+            self.put(url, data[offset:offset + 100], offset)
+        self.assertEqual(self.client.post(url + 'complete/').status_code, 422)
+        self.assertEqual(UploadSession.objects.get().status, 'open')
+
+    def test_malformed_init(self):
+        url = reverse('upload_init')
+        for body in ('{"artwork_id": ', '[1, 2]', '"scan.png"'):
+            with self.subTest(body=body):
+                response = self.client.post(url, body, content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['status'], 'error')
+        self.assertEqual(self.init(b'x', filename='scan.exe').status_code, 400)
+        self.assertEqual(self.init(b'x', artwork_id=self.artwork.pk + 1).status_code, 404)
+        self.assertFalse(UploadSession.objects.exists())
+
+    def test_part_files_are_not_served(self):
+        self.init(png_bytes())
+        session = UploadSession.objects.get()
+        self.assertTrue(os.path.exists(os.path.join(self.upload_dir, f'{session.pk}.part')))
+        # where part files were kept before, and wherever a deployment keeps them under MEDIA_ROOT
+        os.makedirs(os.path.join(self.media_root, 'incoming'))
+        with open(os.path.join(self.media_root, 'incoming', 'old.part'), 'wb') as f:
+            f.write(b'partial')
+        self.assertEqual(self.client.get('/media/incoming/old.part').status_code, 404)
+        with self.settings(CHUNKED_UPLOAD_DIR=os.path.join(self.media_root, 'parts')):
+            url = self.init(png_bytes()).json()['url']
+            name = url.rstrip('/').rsplit('/', 1)[1] + '.part'
+            self.assertEqual(self.client.get(f'/media/parts/{name}').status_code, 404)
+
+
+class LibraryIndexTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(perceptual, 'library', perceptual.LibraryIndex())
+        self.library = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.artwork = Artwork.objects.create(title='Green Tara', artist=User.objects.create_user('painter').artist)
+
+    def image(self, seed):
+        image = ArtworkImage(artwork=self.artwork)
+        image.image = SimpleUploadedFile(f'{seed}.png', noise_png(seed))
+        image.save()
+        return image
+
+    def matches(self, value):
+        return [image.pk for image, _ in self.library.search(value)]
+
+    def test_new_images_join_the_tail(self):
+        first = self.image(1)
+        self.assertEqual(self.matches(first.dhash), [first.pk])
+        second = self.image(2)
+        self.assertEqual(self.matches(second.dhash), [second.pk])
+
+    def test_hashes_changed_on_existing_rows_rebuild_the_index(self):
+        unhashed = self.image(1)
+        ArtworkImage.objects.filter(pk=unhashed.pk).update(dhash=None)
+        self.assertEqual(self.matches(unhashed.dhash), [])
+        # a backfill writes the hash onto an old id, below the index's high-water mark
+        self.image(2)
+        self.matches(0)
+        ArtworkImage.objects.filter(pk=unhashed.pk).update(dhash=unhashed.dhash)
+        self.assertEqual(self.matches(unhashed.dhash), [])
+        perceptual.hashes_changed()
+        self.assertEqual(self.matches(unhashed.dhash), [unhashed.pk])
+
+    def test_replaced_file_is_reindexed(self):
+        image = self.image(1)
+        self.matches(image.dhash)
+        with self.captureOnCommitCallbacks(execute=True):
+            image.image = SimpleUploadedFile('3.png', noise_png(3))
+            image.save()
+        self.assertEqual(self.matches(image.dhash), [image.pk])
+
+
+class ImportArtistsAvatarTests(TemporaryMediaMixin, TransactionTestCase):
+    """Avatars are stored from a thread with its own database connection, outside any test transaction."""
+
+    def run_import(self, rows):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        for seed in range(len(rows)):
+            with open(os.path.join(directory, f'{seed}.png'), 'wb') as f:
+                f.write(noise_png(seed))
+        path = os.path.join(directory, 'artists.csv')
+        with open(path, 'w') as f:
+            f.write('username,name,avatar\n' + ''.join(f'{row},{seed}.png\n' for seed, row in enumerate(rows)))
+        # one avatar thread: SQLite takes one writer at a time
+        call_command('import_artists', path, avatar_workers=1, stdout=io.StringIO())
+
+    def test_created_rows_keep_their_avatar(self):
+        self.run_import(['tenzin,Tenzin Norbu', 'dolma,Dolma'])
+        avatars = set(Artist.objects.values_list('avatar', flat=True))
+        self.assertEqual(set(MediaBlob.objects.values_list('name', 'refs')), {(name, 1) for name in avatars})
+        self.assertEqual(len(avatars), 2)
+
+    def test_rows_that_fail_give_their_avatar_back(self):
+        with mock.patch.object(ImportArtists, 'create_rows', side_effect=IntegrityError):
+            self.run_import(['tenzin,Tenzin Norbu', 'dolma,Dolma'])
+        self.assertFalse(Artist.objects.exists())
+        self.assertFalse(MediaBlob.objects.exists())
+        stored = [name for _, _, names in os.walk(os.path.join(self.media_root, 'blobs')) for name in names]
+        self.assertEqual(stored, [])
+
+
+class MinifyJsTests(SimpleTestCase):
+    def test_strips_indentation_blank_lines_and_comments(self):
+        source = '  // header\n\n  if (a) {\n    f("  //  ");  \n  }\n'
+        self.assertEqual(minify_js(source), 'if (a) {\nf("  //  ");\n}\n')
+
+    def test_template_literals_keep_their_whitespace(self):
+        self.assertEqual(minify_js('const a = `x   y\n   z`;'), 'const a = `x   y\n   z`;\n')
+        source = ('    el.innerHTML = `\n'
+                  '      <p>${ok ? `<b>\n  ${name}</b>` : "`"}</p>\n'
+                  '\n'
+                  '      // not a comment\n'
+                  '    `;\n'
+                  '    const s = "`"; // `\n'
+                  '    f();\n')
+        self.assertEqual(minify_js(source), (
+            'el.innerHTML = `\n'
+            '      <p>${ok ? `<b>\n  ${name}</b>` : "`"}</p>\n'
+            '\n'
+            '      // not a comment\n'
+            '    `;\n'
+            'const s = "`"; // `\n'
+            'f();\n'))
+
+
+@mock.patch.dict(settings.DATABASES, {'replica': {}})
+class ReplicaRoutingTests(SimpleTestCase):
+    def read_alias_during(self, request):
+        seen = []
+
+        def view(request):
+            seen.append(router.db_for_read(Artwork))
+            return HttpResponse()
+
+        response = ReplicaPinMiddleware(view)(request)
+        return seen[0], response
+
+    def test_reads_outside_requests_stay_on_the_primary(self):
+        self.assertTrue(is_pinned())
+        self.assertEqual(router.db_for_read(Artwork), 'default')
+        token = pin_to_primary(False)
+        try:
+            self.assertEqual(router.db_for_read(Artwork), 'replica')
+            self.assertEqual(router.db_for_read(Session), 'default')  # not a replicated app
+            self.assertEqual(router.db_for_write(Artwork), 'default')
+        finally:
+            unpin(token)
+
+    def test_writes_pin_the_following_reads(self):
+        factory = RequestFactory()
+        alias, response = self.read_alias_during(factory.get('/'))
+        self.assertEqual(alias, 'replica')
+        self.assertNotIn('db_pin', response.cookies)
+
+        alias, response = self.read_alias_during(factory.post('/'))
+        self.assertEqual(alias, 'default')
+        self.assertEqual(response.cookies['db_pin']['max-age'], settings.REPLICA_PIN_SECONDS)
+
+        request = factory.get('/')
+        request.COOKIES['db_pin'] = '1'
+        self.assertEqual(self.read_alias_during(request)[0], 'default')
+        self.assertTrue(is_pinned())  # the request's pin is undone
+
+
+class AsyncToggleTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('visitor')
+        self.painter = User.objects.create_user('painter')
+        self.artwork = Artwork.objects.create(title='Green Tara', artist=self.painter.artist)
+
+    async def test_like_and_bookmark_toggle(self):
+        await self.async_client.aforce_login(self.user)
+        url = reverse('toggle_like')
+        response = await self.async_client.post(url, {'artwork_id': self.artwork.pk})
+        self.assertEqual(response.json(), {'status': 'ok', 'action': 'liked', 'likes_count': 1})
+        response = await self.async_client.post(url, {'artwork_id': self.artwork.pk})
+        self.assertEqual(response.json(), {'status': 'ok', 'action': 'unliked', 'likes_count': 0})
+
+        url = reverse('toggle_bookmark')
+        response = await self.async_client.post(url, {'artwork_id': self.artwork.pk})
+        self.assertEqual(response.json()['action'], 'saved')
+        response = await self.async_client.post(url, {'artwork_id': self.artwork.pk})
+        self.assertEqual(response.json()['action'], 'removed')
+
+    async def test_follow(self):
+        await self.async_client.aforce_login(self.user)
+        url = reverse('toggle_follow')
+        response = await self.async_client.post(url, {'user_id': self.painter.pk})
+        self.assertEqual(response.json(), {'status': 'ok', 'action': 'followed', 'followers_count': 1})
+        response = await self.async_client.post(url, {'user_id': self.user.pk})
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.post(url, {'user_id': self.painter.pk + 1000})
+        self.assertEqual(response.status_code, 404)
+
+    async def test_bad_requests(self):
+        await self.async_client.aforce_login(self.user)
+        for name in ('toggle_like', 'toggle_bookmark'):
+            with self.subTest(name=name):
+                self.assertEqual((await self.async_client.post(reverse(name))).status_code, 400)
+                response = await self.async_client.post(reverse(name), {'artwork_id': self.artwork.pk + 1000})
+                self.assertEqual(response.status_code, 404)
+                self.assertEqual((await self.async_client.get(reverse(name))).status_code, 405)
+        self.assertEqual((await self.async_client.post(reverse('toggle_follow'))).status_code, 400)
+
+    async def test_anonymous_requests_are_sent_to_login(self):
+        response = await self.async_client.post(reverse('toggle_like'), {'artwork_id': self.artwork.pk})
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(await self.artwork.likes.aexists())
+
+    async def test_notifications(self):
+        mine = await Notification.objects.acreate(user=self.user, notification_type='like', message='liked')
+        theirs = await Notification.objects.acreate(user=self.painter, notification_type='like', message='liked')
+        await self.async_client.aforce_login(self.user)
+
+        response = await self.async_client.post(reverse('mark_notif_read', args=[mine.pk]))
+        self.assertEqual(response.status_code, 200)
+        await mine.arefresh_from_db()
+        self.assertTrue(mine.is_read)
+        response = await self.async_client.post(reverse('mark_notif_read', args=[theirs.pk]))
+        self.assertEqual(response.status_code, 404)
+
+        await self.async_client.post(reverse('clear_notifications'))
+        self.assertFalse(await Notification.objects.filter(user=self.user).aexists())
+        self.assertTrue(await Notification.objects.filter(pk=theirs.pk).aexists())
+
+
+class ServeMediaTests(TemporaryMediaMixin, TestCase):
+    DATA = bytes(range(256)) * 40
+    URL = '/media/artworks/scan.tif'
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, 'artworks'))
+        with open(os.path.join(self.media_root, 'artworks', 'scan.tif'), 'wb') as f:
+            f.write(self.DATA)
+
+    def test_whole_file_and_revalidation(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], str(len(self.DATA)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(b''.join(response.streaming_content), self.DATA)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_NONE_MATCH='"stale"').status_code, 200)
+        self.assertEqual(self.client.get(self.URL, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+    def test_ranges(self):
+        response = self.client.get(self.URL, HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.DATA)}')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(b''.join(response.streaming_content), self.DATA[10:20])
+
+        response = self.client.get(self.URL, HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), self.DATA[-5:])
+        response = self.client.get(self.URL, HTTP_RANGE='bytes=10240-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.DATA)}')
+        # malformed and multi-range headers are ignored
+        for header in ('lines=1-2', 'bytes=0-1,4-5'):
+            with self.subTest(header=header):
+                self.assertEqual(self.client.get(self.URL, HTTP_RANGE=header).status_code, 200)
+
+    def test_if_range(self):
+        etag = self.client.get(self.URL)['ETag']
+        response = self.client.get(self.URL, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, 206)
+        response = self.client.get(self.URL, HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"changed"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.DATA)
+
+    def test_missing_and_outside_files(self):
+        self.assertEqual(self.client.get('/media/artworks/missing.tif').status_code, 404)
+        self.assertEqual(self.client.get('/media/artworks/').status_code, 404)
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+        self.assertEqual(self.client.post(self.URL).status_code, 405)
+
+    @override_settings(MEDIA_ACCEL_REDIRECT='x-accel-redirect', MEDIA_ACCEL_PREFIX='/protected-media/')
+    def test_accel_redirect(self):
+        response = self.client.get(self.URL)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/artworks/scan.tif')
+        self.assertEqual(response.content, b'')
+
+
+class FeedRevalidationTests(TestCase):
+    FEEDS = ('gallery_json', 'artist_artworks_json')
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('painter')
+        self.artwork = Artwork.objects.create(title='Green Tara', artist=self.user.artist)
+
+    def test_matching_etag_is_answered_without_queries(self):
+        for name in self.FEEDS:
+            with self.subTest(feed=name):
+                response = self.client.get(reverse(name))
+                self.assertEqual(response.status_code, 200)
+                self.assertIn('public', response['Cache-Control'])
+                with self.assertNumQueries(0):
+                    response = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response.content, b'')
+
+    def test_catalog_changes_move_the_etag(self):
+        etags = {name: self.client.get(reverse(name))['ETag'] for name in self.FEEDS}
+        self.assertNotEqual(*etags.values())
+        self.assertNotEqual(self.client.get(reverse('gallery_json'), {'page': 2})['ETag'], etags['gallery_json'])
+
+        ArtworkLike.objects.create(user=self.user, artwork=self.artwork)  # counts come from my_state
+        response = self.client.get(reverse('gallery_json'), HTTP_IF_NONE_MATCH=etags['gallery_json'])
+        self.assertEqual(response.status_code, 304)
+
+        Artwork.objects.create(title='White Tara', artist=self.user.artist)
+        for name in self.FEEDS:
+            with self.subTest(feed=name):
+                response = self.client.get(reverse(name), HTTP_IF_NONE_MATCH=etags[name])
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.json()['items']), 2)
+
+    def test_signed_in_responses_are_private(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('gallery_json'))
+        self.assertIn('private', response['Cache-Control'])
+        self.assertEqual(self.client.get(reverse('gallery_json'), HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_invalid_parameters(self):
+        for query in ({'sort': 'oldest'}, {'category': 'a b'}, {'color': 'red'}):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(reverse('gallery_json'), query).status_code, 400)
+
+
+class EngagementBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()  # rate limit buckets
+        self.user = User.objects.create_user('visitor')
+        self.painter = User.objects.create_user('painter')
+        self.artworks = [Artwork.objects.create(title=f'Thangka {i}', artist=self.painter.artist) for i in range(3)]
+        self.client.force_login(self.user)
+
+    def batch(self, *actions):
+        body = json.dumps({'actions': [{'type': kind, 'id': pk, 'on': on} for kind, pk, on in actions]})
+        return self.client.post(reverse('engagement_batch'), body, content_type='application/json')
+
+    def test_actions_set_the_end_state(self):
+        first, second, third = (a.pk for a in self.artworks)
+        response = self.batch(('like', first, True), ('like', second, True), ('bookmark', third, True),
+                              ('follow', self.painter.pk, True),
+                              ('like', third + 1000, True), ('follow', self.user.pk, True))
+        self.assertEqual(response.status_code, 200)
+        result = response.json()
+        self.assertEqual(result['applied'], 4)
+        self.assertEqual(result['skipped'], [{'type': 'like', 'id': third + 1000},
+                                             {'type': 'follow', 'id': self.user.pk}])
+        self.assertEqual(result['likes_count'], {str(first): 1, str(second): 1})
+        self.assertTrue(Follow.objects.filter(follower=self.user, followee=self.painter).exists())
+        self.assertTrue(Bookmark.objects.filter(user=self.user, artwork_id=third).exists())
+
+        # replaying the queue changes nothing; the last action for a target wins
+        self.batch(('like', first, True))
+        self.assertEqual(ArtworkLike.objects.filter(user=self.user).count(), 2)
+        result = self.batch(('like', first, True), ('like', first, False)).json()
+        self.assertEqual(result['likes_count'], {str(first): 0})
+        self.assertFalse(ArtworkLike.objects.filter(user=self.user, artwork_id=first).exists())
+
+    def test_malformed_batches(self):
+        url = reverse('engagement_batch')
+        too_many = [('like', self.artworks[0].pk, True)] * (MAX_BATCH_ACTIONS + 1)
+        for response in (
+            self.client.post(url, 'x{', content_type='application/json'),
+            self.client.post(url, json.dumps({'actions': 'like'}), content_type='application/json'),
+            self.client.post(url, json.dumps([]), content_type='application/json'),
+            self.batch(('share', self.artworks[0].pk, True)),
+            self.batch(('like', self.artworks[0].pk, 'yes')),
+            self.batch(('like', 'first', True)),
+            self.batch(*too_many),
+        ):
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(ArtworkLike.objects.exists())
+
+    def test_my_state(self):
+        first, second, third = (a.pk for a in self.artworks)
+        ArtworkLike.objects.create(user=self.user, artwork_id=first)
+        ArtworkLike.objects.create(user=self.painter, artwork_id=second)
+        Bookmark.objects.create(user=self.user, artwork_id=third)
+        url = reverse('my_state') + f'?ids={first},{second},{third}'
+
+        response = self.client.get(url)
+        self.assertEqual(response.json(), {
+            'liked': [first], 'bookmarked': [third],
+            'likes_count': {str(first): 1, str(second): 1, str(third): 0},
+        })
+        self.assertIn('no-store', response['Cache-Control'])
+
+        self.client.logout()
+        response = self.client.get(url).json()
+        self.assertEqual((response['liked'], response['bookmarked']), ([], []))
+        self.assertEqual(response['likes_count'][str(second)], 1)
+        self.assertEqual(self.client.get(reverse('my_state') + '?ids=1,x').status_code, 400)
+        self.assertEqual(self.client.get(reverse('my_state')).json()['likes_count'], {})
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_bucket_refills_at_the_rate(self):
+        key = f'test:{uuid.uuid4().hex}'
+        admitted = [hit(key, 1.0, 5, now=1000.0)[0] for _ in range(8)]
+        self.assertEqual(admitted, [True] * 5 + [False] * 3)
+        allowed, retry_after = hit(key, 1.0, 5, now=1000.0)
+        self.assertFalse(allowed)
+        self.assertGreaterEqual(retry_after, 1)
+        self.assertTrue(hit(key, 1.0, 5, now=1000.0 + retry_after + 5)[0])
+
+    @override_settings(RATE_LIMITS={'gallery_json': {'rate': '60/m', 'burst': 2}})
+    def test_over_budget_requests_get_429(self):
+        codes = [self.client.get(reverse('gallery_json')).status_code for _ in range(3)]
+        self.assertEqual(codes, [200, 200, 429])
+        response = self.client.get(reverse('gallery_json'))
+        self.assertEqual(response.json()['status'], 'error')
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+        # other URL names and other clients keep their own budgets
+        self.assertEqual(self.client.get(reverse('artist_artworks_json')).status_code, 200)
+        self.assertEqual(self.client.get(reverse('gallery_json'), REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    @override_settings(RATE_LIMITS={'toggle_like': {'rate': '60/m', 'burst': 1}})
+    def test_signed_in_users_have_a_bucket_across_addresses(self):
+        user = User.objects.create_user('visitor')
+        artwork = Artwork.objects.create(title='Green Tara', artist=user.artist)
+        self.client.force_login(user)
+        url = reverse('toggle_like')
+        self.assertEqual(self.client.post(url, {'artwork_id': artwork.pk}).status_code, 200)
+        response = self.client.post(url, {'artwork_id': artwork.pk}, REMOTE_ADDR='10.0.0.2')
+        self.assertEqual(response.status_code, 429)
+        self.assertTrue(artwork.likes.exists())  # the rejected toggle never ran
+
+    @override_settings(RATE_LIMITS={'gallery_json': {'rate': '60/m', 'burst': 1, 'methods': ('POST',)}})
+    def test_methods_outside_the_rule_are_not_counted(self):
+        for _ in range(3):
+            self.assertEqual(self.client.get(reverse('gallery_json')).status_code, 200)
+
+
+class CatalogExportTests(TestCase):
+    def setUp(self):
+        self.staff = User.objects.create_user('editor', is_staff=True)
+        gold, blue = Tag.objects.create(name='gold'), Tag.objects.create(name='blue')
+        self.artworks = []
+        for i in range(5):
+            artwork = Artwork.objects.create(title=f'Tara, "form" {i}\nsecond line', artist=self.staff.artist)
+            artwork.tags.set([gold, blue] if i % 2 else [gold])
+            self.artworks.append(artwork)
+        last = self.artworks[-1]
+        ArtworkLike.objects.create(user=self.staff, artwork=last)
+        Review.objects.create(artwork=last, user=self.staff, rating=4)
+        Review.objects.create(artwork=last, rating=5)
+
+    def export(self, **params):
+        return self.client.get(reverse('catalog_export'), params)
+
+    def body(self, response):
+        return b''.join(response.streaming_content)
+
+    def test_jsonl_is_one_object_per_line(self):
+        self.client.force_login(self.staff)
+        response = self.export(format='jsonl')
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertTrue(response['Content-Disposition'].endswith('.jsonl.gz"'))
+        text = gzip.decompress(self.body(response)).decode()
+        self.assertTrue(text.endswith('\n'))
+        rows = [json.loads(line) for line in text.splitlines()]
+        self.assertEqual([row['id'] for row in rows], [a.pk for a in self.artworks])
+        self.assertEqual(list(rows[0]), list(COLUMNS))
+        self.assertEqual(rows[0]['title'], self.artworks[0].title)
+        self.assertEqual(rows[1]['tags'], ['blue', 'gold'])
+        last = rows[-1]
+        self.assertEqual((last['likes_count'], last['reviews_count'], last['average_rating'], last['deleted']),
+                         (1, 2, 4.5, False))
+
+    def test_csv_quotes_cells_and_joins_lists(self):
+        self.client.force_login(self.staff)
+        response = self.export(format='csv', compress='0')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.DictReader(io.StringIO(self.body(response).decode())))
+        self.assertEqual(len(rows), 5)
+        self.assertEqual(rows[0]['title'], self.artworks[0].title)
+        self.assertEqual(rows[1]['tags'], 'blue|gold')
+        self.assertEqual(rows[0]['deleted'], 'False')
+
+    def test_chunks_and_blocks_add_up_to_the_same_export(self):
+        whole = b''.join(export_stream('csv', compress=False))
+        small = b''.join(export_stream('csv', compress=False, chunk_size=2))
+        self.assertEqual(small, whole)
+        self.assertEqual(gzip.decompress(b''.join(export_stream('csv', chunk_size=2))), whole)
+
+    def test_incremental_export_with_deletions(self):
+        self.client.force_login(self.staff)
+        until = self.export(format='jsonl', compress='0')['X-Export-Until']
+        edited, deleted = self.artworks[0], self.artworks[1]
+        edited.save()
+        deleted_pk, deleted_slug = deleted.pk, deleted.slug
+        deleted.delete()
+
+        text = self.body(self.export(format='jsonl', compress='0', since=until)).decode()
+        rows = [json.loads(line) for line in text.splitlines()]
+        self.assertEqual([(row['id'], row['deleted']) for row in rows], [(edited.pk, False), (deleted_pk, True)])
+        self.assertEqual((rows[1]['slug'], rows[1]['title']), (deleted_slug, None))
+
+    def test_bad_requests(self):
+        self.assertEqual(self.export().status_code, 302)
+        self.client.force_login(self.staff)
+        self.assertEqual(self.export(format='xml').status_code, 400)
+        self.assertEqual(self.export(since='last week').status_code, 400)
+
+
+@mock.patch.object(publishing, 'SITEMAP_CHUNK', 3)
+class SitemapTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        override = override_settings(PUBLISHED_ROOT=self.root, SITE_URL='https://example.org')
+        override.enable()
+        self.addCleanup(override.disable)
+        user = User.objects.create_user('painter')
+        self.artworks = [Artwork.objects.create(title=f'Thangka {i}', artist=user.artist) for i in range(7)]
+
+    def chunks(self, artworks):
+        return {(a.pk - 1) // 3 for a in artworks}
+
+    def urls(self, chunk):
+        with gzip.open(os.path.join(self.root, publishing.sitemap_name(chunk)), 'rt') as f:
+            return re.findall(r'<loc>(.*?)</loc>', f.read())
+
+    def test_chunks_are_rewritten_only_when_they_change(self):
+        chunks = self.chunks(self.artworks)
+        self.assertEqual(publishing.build_sitemaps(), (len(chunks), 0))
+        self.assertEqual(publishing.build_sitemaps(), (0, 0))
+        for chunk in chunks:
+            members = [a for a in self.artworks if (a.pk - 1) // 3 == chunk]
+            self.assertEqual(self.urls(chunk), [f'https://example.org/artwork/{a.slug}/' for a in members])
+        with open(os.path.join(self.root, 'sitemap.xml')) as f:
+            index = re.findall(r'<loc>(.*?)</loc>', f.read())
+        self.assertEqual(index, [f'https://example.org/{publishing.sitemap_name(c)}' for c in sorted(chunks)])
+
+        edited = self.artworks[-1]
+        edited.title = 'Green Tara'
+        edited.save()
+        self.assertEqual(publishing.build_sitemaps(), (1, 0))
+        self.assertEqual(publishing.build_sitemaps(full=True), (len(chunks), 0))
+
+    def test_emptied_chunks_are_removed(self):
+        publishing.build_sitemaps()
+        first = (self.artworks[0].pk - 1) // 3
+        emptied = [a.pk for a in self.artworks if (a.pk - 1) // 3 == first]
+        Artwork.objects.filter(pk__in=emptied).update(is_published=False)
+        self.assertEqual(publishing.build_sitemaps(), (0, 1))
+        self.assertFalse(os.path.exists(os.path.join(self.root, publishing.sitemap_name(first))))
+        with open(os.path.join(self.root, 'sitemap.xml')) as f:
+            self.assertNotIn(publishing.sitemap_name(first), f.read())
+
+    def test_files_are_served(self):
+        publishing.build_sitemaps()
+        response = self.client.get('/sitemap.xml')
+        self.assertEqual(response.status_code, 200)
+        chunk = min(self.chunks(self.artworks))
+        response = self.client.get('/' + publishing.sitemap_name(chunk))
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(self.client.get('/sitemaps/manifest.json').status_code, 404)
+
+
+class RatingAggregateTests(TestCase):
+    def setUp(self):
+        self.artwork = Artwork.objects.create(title='Green Tara')
+        self.user = User.objects.create_user('visitor')
+
+    def aggregates(self, artwork=None):
+        artwork = artwork or self.artwork
+        artwork.refresh_from_db()
+        return (artwork.rating_count, artwork.rating_avg,
+                [getattr(artwork, field) for field in ratings.HISTOGRAM_FIELDS])
+
+    def test_reviews_are_counted_as_they_are_written(self):
+        reviews = [Review.objects.create(artwork=self.artwork, rating=r) for r in (5, 4, 4, 1)]
+        self.assertEqual(self.aggregates(), (4, 3.5, [1, 0, 0, 2, 1]))
+
+        reviews[3].rating = 5
+        reviews[3].save()
+        self.assertEqual(self.aggregates(), (4, 4.5, [0, 0, 0, 2, 2]))
+        reviews[1].comment = 'still a four'
+        reviews[1].save()
+        self.assertEqual(self.aggregates()[0], 4)
+
+        reviews[0].delete()
+        self.assertEqual(self.aggregates(), (3, 13 / 3, [0, 0, 0, 2, 1]))
+        for review in reviews[1:]:
+            review.delete()
+        self.assertEqual(self.aggregates(), (0, None, [0] * 5))
+
+    def test_moving_a_review_moves_its_rating(self):
+        other = Artwork.objects.create(title='White Tara')
+        review = Review.objects.create(artwork=self.artwork, user=self.user, rating=3)
+        review.artwork = other
+        review.save()
+        self.assertEqual(self.aggregates(), (0, None, [0] * 5))
+        self.assertEqual(self.aggregates(other), (1, 3.0, [0, 0, 1, 0, 0]))
+
+    def test_rebuild_matches_the_deltas(self):
+        for r in (2, 5, 5):
+            Review.objects.create(artwork=self.artwork, rating=r)
+        expected = self.aggregates()
+        # bulk updates bypass the signals
+        Review.objects.filter(rating=2).update(rating=1)
+        self.assertEqual(self.aggregates(), expected)
+        ratings.rebuild([self.artwork.pk])
+        self.assertEqual(self.aggregates(), (3, 11 / 3, [1, 0, 0, 0, 2]))
+        ratings.rebuild()
+        self.assertEqual(self.aggregates()[0], 3)
+
+
+class BlobStorageTests(TemporaryMediaMixin, TestCase):
+    def storage(self, backend=ContentAddressedStorage):
+        return backend(location=self.media_root, workers=2, fsync=False)
+
+    def refs(self, name):
+        return MediaBlob.objects.filter(name=name).values_list('refs', flat=True).first()
+
+    def test_same_bytes_are_stored_once(self):
+        storage = self.storage()
+        first = storage.save('scan.JPG', ContentFile(b'tara'))
+        second = storage.save('copy.jpg', ContentFile(b'tara'))
+        other = storage.save('other.jpg', ContentFile(b'mandala'))
+        self.assertTrue(is_blob_name(first))
+        self.assertEqual(first, second)
+        self.assertNotEqual(first, other)
+        self.assertEqual((self.refs(first), self.refs(other)), (2, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            storage.delete(first)
+        self.assertEqual(self.refs(first), 1)
+        self.assertTrue(storage.exists(first))
+        with self.captureOnCommitCallbacks(execute=True):
+            storage.delete(second)
+        self.assertIsNone(self.refs(first))
+        self.assertFalse(storage.exists(first))
+        self.assertTrue(storage.exists(other))
+
+    def test_a_save_after_the_last_delete_keeps_the_blob(self):
+        storage = self.storage()
+        name = storage.save('scan.jpg', ContentFile(b'tara'))
+        with self.captureOnCommitCallbacks(execute=True):
+            storage.delete(name)
+            storage.save('again.jpg', ContentFile(b'tara'))
+        self.assertEqual(self.refs(name), 1)
+        self.assertTrue(storage.exists(name))
+
+    def test_batches(self):
+        for backend in (ContentAddressedStorage, LocalObjectStorage):
+            with self.subTest(backend=backend.__name__):
+                storage = self.storage(backend)
+                names = storage.save_many([(f'{backend.__name__}-{i}.png', ContentFile(data))
+                                           for i, data in enumerate([b'a', b'b', b'a'])])
+                self.assertEqual(names[0], names[2])
+                self.assertEqual((self.refs(names[0]), self.refs(names[1])), (2, 1))
+                self.assertEqual(storage.open(names[1]).read(), b'b')
+                self.assertEqual(os.listdir(os.path.join(self.media_root, 'blobs', 'tmp')), [])
+                MediaBlob.objects.all().delete()
+        with self.assertRaises(NotImplementedError):
+            self.storage(LocalObjectStorage).path(names[0])
+
+    def test_rows_give_their_files_back(self):
+        user = User.objects.create_user('painter')
+        artworks = [Artwork.objects.create(title=f'Thangka {i}', artist=user.artist) for i in range(2)]
+        images = [ArtworkImage.objects.create(artwork=a, image=SimpleUploadedFile('scan.png', png_bytes()))
+                  for a in artworks]
+        name = images[0].image.name
+        self.assertEqual(images[1].image.name, name)
+        self.assertEqual(self.refs(name), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            artworks[0].delete()
+        self.assertEqual(self.refs(name), 1)
+
+        artist = user.artist
+        artist.avatar = SimpleUploadedFile('me.png', png_bytes((1, 2, 3)))
+        artist.save()
+        avatar = artist.avatar.name
+        artist = Artist.objects.get(pk=artist.pk)
+        artist.avatar = SimpleUploadedFile('scan.png', png_bytes())
+        with self.captureOnCommitCallbacks(execute=True):
+            artist.save()
+        self.assertIsNone(self.refs(avatar))
+        self.assertFalse(os.path.exists(os.path.join(self.media_root, avatar)))
+        self.assertEqual(self.refs(name), 2)
+
+
+class PlaceholderTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        self.user = User.objects.create_user('painter')
+
+    def add_image(self, title, data, name='scan.png'):
+        artwork = Artwork.objects.create(title=title, artist=self.user.artist)
+        return ArtworkImage.objects.create(artwork=artwork, image=SimpleUploadedFile(name, data))
+
+    def rotated_jpeg(self, size):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees clockwise
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (20, 90, 160)).save(buffer, 'JPEG', exif=exif.tobytes())
+        return buffer.getvalue()
+
+    def test_uploads_get_sizes_and_a_placeholder(self):
+        image = self.add_image('Wide', noise_png(1, size=(640, 480)))
+        self.assertEqual((image.width, image.height), (640, 480))
+        self.assertTrue(image.placeholder.startswith('data:image/webp;base64,'))
+        self.assertLessEqual(len(image.placeholder), ArtworkImage._meta.get_field('placeholder').max_length)
+
+        rotated = self.add_image('Rotated', self.rotated_jpeg((600, 300)), name='scan.jpg')
+        self.assertEqual((rotated.width, rotated.height), (300, 600))
+        broken = self.add_image('Broken', b'not an image')
+        self.assertEqual((broken.width, broken.height, broken.placeholder), (None, None, ''))
+
+    def test_feed_items_carry_the_placeholder(self):
+        image = self.add_image('Wide', noise_png(1, size=(640, 480)))
+        Artwork.objects.create(title='No scan yet', artist=self.user.artist)
+        items = {item['title']: item for item in self.client.get(reverse('gallery_json')).json()['items']}
+        self.assertEqual((items['Wide']['thumb_width'], items['Wide']['thumb_height']), (640, 480))
+        self.assertEqual(items['Wide']['placeholder'], image.placeholder)
+        empty = items['No scan yet']
+        self.assertEqual((empty['thumb'], empty['thumb_width'], empty['thumb_height'], empty['placeholder']),
+                         ('', None, None, ''))
+
+    def test_backfill(self):
+        image = self.add_image('Rotated', self.rotated_jpeg((600, 300)), name='scan.jpg')
+        ArtworkImage.objects.update(width=None, height=None, placeholder='')
+        call_command('build_placeholders', '--workers', '1', stdout=io.StringIO())
+        image.refresh_from_db()
+        self.assertEqual((image.width, image.height), (300, 600))
+        self.assertTrue(image.placeholder)
+
+
+class SlugTests(TestCase):
+    def setUp(self):
+        self.year = timezone.now().year
+
+    def stale_once(self, slug):
+        """allocate() that hands out `slug`, as a concurrent writer's lookup would, on its first call only."""
+        real, calls = slugs.allocate, []
+
+        def allocate(model, bases):
+            calls.append(bases)
+            return [slug] * len(bases) if len(calls) == 1 else real(model, bases)
+        return mock.patch.object(slugs, 'allocate', allocate), calls
+
+    def test_taken_slugs_get_the_next_suffix(self):
+        created = [Artwork.objects.create(title='Green Tara') for _ in range(3)]
+        base = f'green-tara-{self.year}'
+        self.assertEqual([a.slug for a in created], [base, f'{base}-2', f'{base}-3'])
+        created[1].delete()  # gaps aren't reused
+        self.assertEqual(Artwork.objects.create(title='Green Tara').slug, f'{base}-4')
+        self.assertEqual(Artwork.objects.create(title='ཐང་ཀ').slug, f'artwork-{self.year}')
+        Category.objects.create(name='Mandala')
+        self.assertEqual(Category.objects.create(name='Mandala!').slug, 'mandala-2')
+
+    def test_bulk_create_allocates_distinct_slugs(self):
+        Artwork.objects.create(title='Vajra')
+        titles = ['Vajra', 'Vajra', 'Lotus', 'Vajra-2'] * 150
+        with CaptureQueriesContext(connection) as queries:
+            artworks = Artwork.objects.bulk_create([Artwork(title=t) for t in titles])
+        lookups = [q for q in queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(len(lookups), 1)  # one for all three bases
+        allocated = [a.slug for a in artworks]
+        self.assertEqual(len(set(allocated)), len(titles))
+        self.assertEqual(allocated[:4], [f'vajra-{self.year}-2', f'vajra-{self.year}-3',
+                                         f'lotus-{self.year}', f'vajra-2-{self.year}'])
+        self.assertIn(f'vajra-{self.year}-301', allocated)
+        Tag.objects.bulk_create([Tag(name='gold'), Tag(name='Gold!')])
+        self.assertEqual(sorted(Tag.objects.values_list('slug', flat=True)), ['gold', 'gold-2'])
+
+    def test_collisions_with_other_writers_are_retried(self):
+        taken = Artwork.objects.create(title='Race').slug
+        patch, calls = self.stale_once(taken)
+        with patch:
+            artwork = Artwork.objects.create(title='Race')
+        self.assertEqual((artwork.slug, len(calls)), (f'{taken}-2', 2))
+
+        patch, calls = self.stale_once(taken)
+        with patch:
+            artworks = Artwork.objects.bulk_create([Artwork(title='Race'), Artwork(title='Race')])
+        self.assertEqual([a.slug for a in artworks], [f'{taken}-3', f'{taken}-4'])
+        self.assertEqual(len(calls), 2)
+
+        with mock.patch.object(slugs, 'allocate', lambda model, bases: [taken] * len(bases)):
+            with self.assertRaises(IntegrityError):
+                Artwork.objects.create(title='Race')
+            with self.assertRaises(IntegrityError):
+                Artwork.objects.bulk_create([Artwork(title='Race')])
+
+    def test_slug_url_is_canonical(self):
+        artwork = Artwork.objects.create(title='Green Tara')
+        self.assertEqual(artwork.get_absolute_url(), f'/artwork/{artwork.slug}/')
+        response = self.client.get(reverse('artwork_detail', args=[artwork.pk]))
+        self.assertEqual((response.status_code, response.url), (301, artwork.get_absolute_url()))
+        self.assertEqual(self.client.get(reverse('artwork_by_slug', args=['missing-2024'])).status_code, 404)
+
+
+class RollupTests(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.painter = User.objects.create_user('painter')
+        self.fan = User.objects.create_user('fan')
+        self.artwork = Artwork.objects.create(title='Green Tara', artist=self.painter.artist, view_count=100)
+        analytics.rollup(now=self.now)  # the first run only remembers the views so far
+
+    def backdate(self, obj, **delta):
+        type(obj).objects.filter(pk=obj.pk).update(created_at=self.now - datetime.timedelta(**delta))
+
+    def test_events_are_counted_once(self):
+        self.backdate(ArtworkLike.objects.create(user=self.fan, artwork=self.artwork), days=2)
+        self.backdate(Bookmark.objects.create(user=self.fan, artwork=self.artwork), days=2)
+        self.backdate(Review.objects.create(user=self.fan, artwork=self.artwork, rating=4), days=2)
+        self.backdate(Follow.objects.create(follower=self.fan, followee=self.painter), days=2)
+        ArtworkLike.objects.create(user=self.painter, artwork=self.artwork)  # within the lag: left for later
+        Artwork.objects.filter(pk=self.artwork.pk).update(view_count=107)
+
+        summary = analytics.rollup(now=self.now)
+        self.assertEqual({metric: summary[metric] for metric in analytics.METRICS},
+                         {'views': 7, 'likes': 1, 'bookmarks': 1, 'reviews': 1, 'follows': 1})
+        self.assertEqual(RollupWatermark.objects.get(source='likes').last_id,
+                         ArtworkLike.objects.filter(user=self.fan).get().pk)
+        summary = analytics.rollup(now=self.now)
+        self.assertEqual(sum(summary[metric] for metric in analytics.METRICS), 0)
+
+        later = self.now + datetime.timedelta(seconds=settings.ANALYTICS_ROLLUP_LAG_SECONDS + 1)
+        self.assertEqual(analytics.rollup(now=later)['likes'], 1)
+        self.assertEqual(analytics.rollup(now=later)['likes'], 0)
+
+        day = EngagementDaily.objects.get(artwork=self.artwork, day=timezone.localdate(self.now - datetime.timedelta(days=2)))
+        self.assertEqual((day.likes, day.bookmarks, day.reviews), (1, 1, 1))
+        self.assertEqual(EngagementDaily.objects.get(artist=self.painter.artist).follows, 1)
+        totals = analytics.series(self.painter.artist, 'day', 7, now=later)['totals']
+        self.assertEqual(totals, {'views': 7, 'likes': 2, 'bookmarks': 1, 'reviews': 1, 'follows': 1})
+
+    def test_unlikes_dont_take_counts_back(self):
+        like = ArtworkLike.objects.create(user=self.fan, artwork=self.artwork)
+        self.backdate(like, hours=1)
+        analytics.rollup(now=self.now)
+        like.delete()
+        self.assertEqual(analytics.rollup(now=self.now)['likes'], 0)
+        self.assertEqual(EngagementHourly.objects.get(artwork=self.artwork).likes, 1)
+
+    @mock.patch.dict(settings.DATABASES, {'replica': {}})
+    def test_runs_on_the_primary(self):
+        # reading from the replica alias would fail: it has no connection here
+        self.backdate(ArtworkLike.objects.create(user=self.fan, artwork=self.artwork), hours=1)
+        token = pin_to_primary(False)
+        try:
+            self.assertEqual(router.db_for_read(ArtworkLike), 'replica')
+            self.assertEqual(analytics.rollup(now=self.now)['likes'], 1)
+        finally:
+            unpin(token)
+
+    def test_hourly_rows_expire(self):
+        self.backdate(ArtworkLike.objects.create(user=self.fan, artwork=self.artwork), hours=1)
+        analytics.rollup(now=self.now)
+        expired = self.now + datetime.timedelta(days=settings.ANALYTICS_HOURLY_RETENTION_DAYS + 1)
+        analytics.rollup(now=expired)
+        self.assertFalse(EngagementHourly.objects.filter(likes__gt=0).exists())
+        self.assertTrue(EngagementDaily.objects.filter(likes__gt=0).exists())
+
+    def test_dashboard_api(self):
+        other = Artwork.objects.create(title='White Tara', artist=self.fan.artist)
+        self.client.force_login(self.painter)
+        url = reverse('artist_analytics')
+        response = self.client.get(url, {'granularity': 'hour', 'days': 2})
+        self.assertEqual(len(response.json()['series']), 48)
+        self.assertEqual(self.client.get(url, {'artwork': other.pk}).status_code, 404)
+        self.assertEqual(self.client.get(url, {'granularity': 'week'}).status_code, 400)
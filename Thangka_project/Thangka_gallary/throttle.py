@@ -0,0 +1,105 @@
+"""
+Rate limiting for the write APIs and the infinite-scroll feeds.
+
+Every limited URL name gets a bucket per user and per client IP, configured
+in ``settings.RATE_LIMITS``::
+
+    RATE_LIMITS = {
+        'toggle_like': {'rate': '30/m', 'burst': 10},
+        'chat_page': {'rate': '20/m', 'burst': 5, 'methods': ('POST',)},
+    }
+
+A bucket holds ``burst`` tokens and refills at ``rate``. Buckets live in the
+shared cache and are updated with atomic ``add``/``incr``/``decr`` only (no
+read-modify-write), so the limit holds across worker processes: the bucket is
+kept as a sliding-window counter over windows of ``burst / rate`` seconds,
+which admits the same bursts and the same sustained rate as a token bucket.
+"""
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+# backends whose incr() is atomic across processes, which the buckets rely on
+SHARED_CACHE_BACKENDS = (
+    'django.core.cache.backends.redis.RedisCache',
+    'django.core.cache.backends.memcached.PyMemcacheCache',
+    'django.core.cache.backends.memcached.PyLibMCCache',
+)
+
+
+def shared_cache():
+    """Whether the default cache enforces the limits across worker processes."""
+    return settings.CACHES['default']['BACKEND'] in SHARED_CACHE_BACKENDS
+
+
+def parse_rate(rate):
+    """'30/m' -> 0.5 tokens per second."""
+    count, _, period = rate.partition('/')
+    return int(count) / PERIODS[period[:1]]
+
+
+def hit(key, rate, burst, now=None):
+    """
+    Take one token from bucket `key`. Returns (allowed, retry_after_seconds).
+    """
+    now = time.time() if now is None else now
+    window = burst / rate
+    slot = int(now // window)
+    current = f'rl:{key}:{slot}'
+    previous = f'rl:{key}:{slot - 1}'
+
+    cache.add(current, 0, timeout=int(window * 2) + 1)
+    try:
+        count = cache.incr(current)
+    except ValueError:  # evicted between add and incr
+        cache.add(current, 1, timeout=int(window * 2) + 1)
+        count = 1
+    prev_count = cache.get(previous) or 0
+
+    elapsed = now - slot * window
+    used = prev_count * (1 - elapsed / window) + count
+    if used <= burst:
+        return True, 0
+    # a rejected request takes no token, as with a real bucket
+    cache.decr(current)
+    count -= 1
+
+    if count < burst and prev_count:
+        # wait until enough of the previous window has slid out for one more request
+        wait = window * (1 - (burst - count - 1) / prev_count) - elapsed
+    else:
+        wait = window - elapsed
+    return False, max(1, math.ceil(wait))
+
+
+def client_ip(request):
+    header = getattr(settings, 'RATE_LIMIT_IP_HEADER', None)
+    if header and request.META.get(header):
+        # left-most address is the original client
+        return request.META[header].split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def check_request(request, url_name):
+    """Return None if the request may proceed, else seconds until it may retry."""
+    rule = settings.RATE_LIMITS.get(url_name)
+    if rule is None or request.method not in rule.get('methods', (request.method,)):
+        return None
+    rate, burst = parse_rate(rule['rate']), rule['burst']
+
+    scopes = [f'ip:{client_ip(request)}']
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        scopes.append(f'user:{user.pk}')
+
+    retry_after = 0
+    for scope in scopes:
+        allowed, wait = hit(f'{url_name}:{scope}', rate, burst)
+        if not allowed:
+            retry_after = max(retry_after, wait)
+    return retry_after or None
@@ -0,0 +1,141 @@
+"""
+Time-decayed trending scores.
+
+    score = sum over engagement events of  weight(kind) * 0.5 ** (age / HALF_LIFE)
+
+Likes, bookmarks and reviews have timestamps, so they are rolled up in SQL
+into per-artwork, per-hour counts over the last WINDOW_HALF_LIVES half-lives
+and decayed in one vectorized pass. Views only exist as the running
+``view_count``, so TrendingState keeps the total seen at the last run and a
+decayed "view mass": each run decays the mass by the time since then and adds
+the new views.
+
+Only rows whose score actually moved are written, with a plain UPDATE that
+leaves ``updated_at`` (exports, sitemaps) alone. Everything is read from the
+database the scores are written to: views counted from a lagging replica
+would be counted again by the next run.
+"""
+import datetime
+
+import numpy as np
+from django.db import connections, router, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import Artwork, ArtworkLike, Bookmark, Review, TrendingState
+
+HALF_LIFE_HOURS = 48.0
+WINDOW_HALF_LIVES = 8  # older events contribute < 0.4% and are ignored
+WEIGHTS = {
+    'view': 1.0,
+    'like': 8.0,
+    'bookmark': 12.0,
+    'review': 15.0,  # scaled by rating / 5
+}
+# a change smaller than this (relative) is not worth a write
+TOLERANCE = 1e-3
+BATCH_SIZE = 1000
+
+
+def _decay(age_hours):
+    return np.exp2(-np.maximum(age_hours, 0) / HALF_LIFE_HOURS)
+
+
+def _hours(delta_seconds):
+    return delta_seconds / 3600.0
+
+
+def _column(queryset, fields, dtypes):
+    """values_list() -> one numpy array per field."""
+    rows = list(queryset.values_list(*fields))
+    if not rows:
+        return [np.empty(0, dtype=dtype) for dtype in dtypes]
+    return [np.fromiter((row[i] for row in rows), dtype=dtype, count=len(rows))
+            for i, dtype in enumerate(dtypes)]
+
+
+def _write_scores(pks, scores, using):
+    # executemany of a one-row UPDATE: bulk_update's CASE WHEN statements get
+    # slow (quadratic on SQLite) at tens of thousands of rows
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    sql = 'UPDATE %s SET %s = %%s WHERE %s = %%s' % (
+        qn(Artwork._meta.db_table), qn('trending_score'), qn(Artwork._meta.pk.column))
+    rows = list(zip(scores, pks))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), BATCH_SIZE):
+            cursor.executemany(sql, rows[start:start + BATCH_SIZE])
+
+
+def event_scores(ids, now, using):
+    """Decayed like / bookmark / review contribution for each id in `ids` (sorted)."""
+    scores = np.zeros(len(ids))
+    since = now - datetime.timedelta(hours=HALF_LIFE_HOURS * WINDOW_HALF_LIVES)
+    rollups = [
+        ('like', ArtworkLike, Count('id'), 1.0),
+        ('bookmark', Bookmark, Count('id'), 1.0),
+        ('review', Review, Sum('rating'), 1 / 5),
+    ]
+    for kind, model, amount, scale in rollups:
+        rollup = (model.objects.using(using).filter(created_at__gte=since).order_by()
+                  .annotate(hour=TruncHour('created_at')).values('artwork_id', 'hour')
+                  .annotate(amount=amount))
+        rows = list(rollup.values_list('artwork_id', 'hour', 'amount'))
+        if not rows:
+            continue
+        artwork_ids = np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows))
+        ages = np.fromiter((_hours((now - r[1]).total_seconds()) for r in rows), dtype=float, count=len(rows))
+        amounts = np.fromiter((r[2] for r in rows), dtype=float, count=len(rows))
+
+        positions = np.searchsorted(ids, artwork_ids)
+        known = (positions < len(ids)) & (ids[np.minimum(positions, len(ids) - 1)] == artwork_ids)
+        np.add.at(scores, positions[known], WEIGHTS[kind] * scale * amounts[known] * _decay(ages[known]))
+    return scores
+
+
+def compute(now=None):
+    """Recompute every published artwork's score. Returns (artworks, scores written)."""
+    now = now or timezone.now()
+    db = router.db_for_write(Artwork)
+    ids, view_counts, old_scores, created = _column(
+        Artwork.objects.using(db).filter(is_published=True).order_by('id'),
+        ('id', 'view_count', 'trending_score', 'created_at'),
+        (np.int64, np.int64, float, object))
+    if not len(ids):
+        return 0, 0
+    ages = np.fromiter((_hours((now - c).total_seconds()) for c in created), dtype=float, count=len(ids))
+
+    # views: decay last run's mass and add the views since
+    state_ids, seen, mass, computed = _column(
+        TrendingState.objects.using(db).filter(artwork__is_published=True).order_by('artwork_id'),
+        ('artwork_id', 'views_seen', 'views_mass', 'computed_at'),
+        (np.int64, np.int64, float, object))
+    has_state = np.isin(ids, state_ids)
+    positions = np.searchsorted(ids, state_ids)
+    views_seen = np.zeros(len(ids), dtype=np.int64)
+    views_mass = np.zeros(len(ids))
+    since_run = ages.copy()
+    views_seen[positions] = seen
+    views_mass[positions] = mass
+    since_run[positions] = [_hours((now - c).total_seconds()) for c in computed]
+    # first run for an artwork: count its existing views as if they were as old as it is
+    new_views = np.maximum(view_counts - views_seen, 0)
+    new_mass = np.where(has_state, views_mass * _decay(since_run) + new_views, view_counts * _decay(ages))
+
+    scores = WEIGHTS['view'] * new_mass + event_scores(ids, now, db)
+    scores = np.round(scores, 4)
+
+    changed = np.abs(scores - old_scores) > TOLERANCE * np.maximum(np.abs(old_scores), 1.0)
+    # a row whose views didn't move keeps decaying from its stored computed_at, no write needed
+    state_changed = ~has_state | (new_views > 0)
+
+    with transaction.atomic(using=db):
+        _write_scores(ids[changed].tolist(), scores[changed].tolist(), db)
+        TrendingState.objects.using(db).bulk_create(
+            [TrendingState(artwork_id=pk, views_seen=count, views_mass=value, computed_at=now)
+             for pk, count, value in zip(ids[state_changed].tolist(), view_counts[state_changed].tolist(),
+                                         new_mass[state_changed].tolist())],
+            update_conflicts=True, unique_fields=['artwork'],
+            update_fields=['views_seen', 'views_mass', 'computed_at'], batch_size=BATCH_SIZE)
+    return len(ids), int(changed.sum())
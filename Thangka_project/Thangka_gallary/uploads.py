@@ -0,0 +1,221 @@
+"""
+Chunked, resumable uploads of large artwork scans.
+
+    POST   /api/uploads/                  init: artwork_id, filename, size[, sha256]
+    GET    /api/uploads/<id>/             status: how many bytes the server has
+    PUT    /api/uploads/<id>/?offset=N    one chunk (raw body, X-Chunk-SHA256 header)
+    POST   /api/uploads/<id>/complete/    attach the file to the artwork as an ArtworkImage
+    DELETE /api/uploads/<id>/             abort
+
+Chunks are appended strictly in order: a PUT whose offset isn't the number of
+bytes already received gets a 409 carrying that number, which is also how a
+client resumes after a dropped connection (or asks GET first). A chunk is
+streamed from the request into its own temporary file in CHUNK_READ_SIZE
+blocks while being hashed, and only appended to the session's part file once
+its checksum matches, so a corrupt or interrupted chunk never reaches the
+part file. The part file is fsynced before `received` moves, so `received`
+never counts bytes that a crash could lose. Nothing is ever held in memory
+beyond one block, whatever the size of the file or the chunk.
+
+On completion the part file is renamed into media storage (no copy on the
+local filesystem) and becomes an ArtworkImage.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Max
+from django.http import HttpResponseBadRequest, JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.views.decorators.http import require_http_methods, require_POST
+
+from .models import Artwork, ArtworkImage, UploadSession
+
+CHUNK_READ_SIZE = 64 * 1024
+ALLOWED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp', '.tif', '.tiff')
+
+
+class PartFile(File):
+    """A finished part file; FileSystemStorage moves it into place instead of copying it."""
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+def part_path(session):
+    return os.path.join(settings.CHUNKED_UPLOAD_DIR, f'{session.pk}.part')
+
+
+def _status(session):
+    return {
+        'id': str(session.pk),
+        'url': reverse('upload_session', args=[session.pk]),
+        'filename': session.filename,
+        'size': session.size,
+        'received': session.received,
+        'state': session.status,
+        'chunk_size': settings.CHUNKED_UPLOAD_CHUNK_SIZE,
+        'image_id': session.image_id,
+    }
+
+
+def _error(message, status=400, **extra):
+    return JsonResponse({'status': 'error', 'message': message, **extra}, status=status)
+
+
+def _own_session(request, pk):
+    return UploadSession.objects.filter(pk=pk, user=request.user).select_related('artwork').first()
+
+
+@login_required
+@require_POST
+def upload_init(request):
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return _error("invalid JSON body")
+        if not isinstance(data, dict):
+            return _error("JSON body must be an object")
+    else:
+        data = request.POST
+    try:
+        artwork_id, size = int(data.get('artwork_id')), int(data.get('size'))
+    except (TypeError, ValueError):
+        return HttpResponseBadRequest("artwork_id and size must be integers")
+    filename = os.path.basename(str(data.get('filename') or ''))[:255]
+    sha256 = str(data.get('sha256') or '').lower()
+    if not filename.lower().endswith(ALLOWED_EXTENSIONS):
+        return _error("unsupported file type; allowed: %s" % ', '.join(ALLOWED_EXTENSIONS))
+    if not 0 < size <= settings.CHUNKED_UPLOAD_MAX_BYTES:
+        return _error(f"size must be between 1 and {settings.CHUNKED_UPLOAD_MAX_BYTES} bytes")
+    if sha256 and (len(sha256) != 64 or any(c not in '0123456789abcdef' for c in sha256)):
+        return _error("sha256 must be 64 hex digits")
+    if not Artwork.objects.filter(pk=artwork_id, artist__user=request.user).exists():
+        return _error("artwork not found", status=404)
+
+    session = UploadSession.objects.create(user=request.user, artwork_id=artwork_id, filename=filename,
+                                           size=size, sha256=sha256)
+    os.makedirs(settings.CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(part_path(session), 'wb').close()
+    return JsonResponse(_status(session), status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'PUT', 'DELETE'])
+def upload_session(request, pk):
+    session = _own_session(request, pk)
+    if session is None:
+        return _error("upload not found", status=404)
+    if request.method == 'GET':
+        return JsonResponse(_status(session))
+    if request.method == 'DELETE':
+        return _abort(session)
+    return _receive_chunk(request, session)
+
+
+def _abort(session):
+    if session.status == 'open':
+        UploadSession.objects.filter(pk=session.pk, status='open').update(status='aborted', updated_at=timezone.now())
+        session.status = 'aborted'
+        remove_part(session)
+    return JsonResponse(_status(session))
+
+
+def remove_part(session):
+    try:
+        os.remove(part_path(session))
+    except FileNotFoundError:
+        pass
+
+
+def _receive_chunk(request, session):
+    if session.status != 'open':
+        return _error(f"upload is {session.status}", status=409, **_status(session))
+    try:
+        offset = int(request.GET.get('offset', ''))
+        length = int(request.META.get('CONTENT_LENGTH') or '')
+    except ValueError:
+        return HttpResponseBadRequest("offset and Content-Length are required")
+    if offset != session.received:
+        # out of order or a retry of a chunk we already have: tell the client where to resume
+        return _error("offset mismatch", status=409, **_status(session))
+    if not 0 < length <= settings.CHUNKED_UPLOAD_MAX_CHUNK or offset + length > session.size:
+        return _error(f"chunk must be 1..{settings.CHUNKED_UPLOAD_MAX_CHUNK} bytes and end within the file")
+    expected = request.META.get('HTTP_X_CHUNK_SHA256', '').lower()
+
+    # stream the body into a scratch file; request.read() never buffers the whole body
+    digest = hashlib.sha256()
+    with tempfile.TemporaryFile(dir=settings.CHUNKED_UPLOAD_DIR) as chunk:
+        remaining = length
+        while remaining:
+            block = request.read(min(CHUNK_READ_SIZE, remaining))
+            if not block:
+                return _error("connection closed mid-chunk", **_status(session))
+            digest.update(block)
+            chunk.write(block)
+            remaining -= len(block)
+        if expected and digest.hexdigest() != expected:
+            return _error("chunk checksum mismatch", status=422, **_status(session))
+
+        with transaction.atomic():
+            # claim the range first: a concurrent PUT of the same offset waits here, then gets 409
+            claimed = (UploadSession.objects.filter(pk=session.pk, status='open', received=offset)
+                       .update(received=offset + length, updated_at=timezone.now()))
+            if not claimed:
+                session.refresh_from_db()
+                return _error("offset mismatch", status=409, **_status(session))
+            chunk.seek(0)
+            with open(part_path(session), 'r+b') as part:
+                part.truncate(offset)  # drop what a crashed append may have left behind
+                part.seek(offset)
+                shutil.copyfileobj(chunk, part, CHUNK_READ_SIZE)
+                part.flush()
+                os.fsync(part.fileno())
+    session.received = offset + length
+    return JsonResponse(_status(session))
+
+
+@login_required
+@require_POST
+def upload_complete(request, pk):
+    session = _own_session(request, pk)
+    if session is None:
+        return _error("upload not found", status=404)
+    if session.status == 'complete':
+        return JsonResponse(_status(session))  # a retried completion
+    if session.status != 'open' or session.received != session.size:
+        return _error("upload is not finished", status=409, **_status(session))
+
+    path = part_path(session)
+    if session.sha256:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as part:
+            for block in iter(lambda: part.read(CHUNK_READ_SIZE), b''):
+                digest.update(block)
+        if digest.hexdigest() != session.sha256:
+            return _error("file checksum mismatch", status=422, **_status(session))
+
+    with transaction.atomic():
+        if not UploadSession.objects.filter(pk=session.pk, status='open').update(status='complete'):
+            session.refresh_from_db()
+            return JsonResponse(_status(session))
+        order = (ArtworkImage.objects.filter(artwork_id=session.artwork_id)
+                 .aggregate(last=Max('order'))['last'])
+        image = ArtworkImage(artwork_id=session.artwork_id, order=0 if order is None else order + 1)
+        # decoding a multi-hundred-megabyte scan in the request would defeat the point
+        image._skip_analysis = session.size > settings.CHUNKED_UPLOAD_ANALYZE_MAX_BYTES
+        with open(path, 'rb') as part:
+            image.image = PartFile(part, name=session.filename)
+            image.save()
+        session.status, session.image = 'complete', image
+        session.save(update_fields=['image', 'updated_at'])
+    remove_part(session)  # a no-op when storage moved it; remote storages copy
+    return JsonResponse(_status(session))
@@ -1,11 +1,13 @@
 from django.urls import path
-from . import views
+from . import uploads, views
 
 urlpatterns = [
     path('', views.index, name='index'),
     path('gallery/', views.gallery, name='gallery'),
     path('gallery/json/', views.gallery_json, name='gallery_json'),
     path('artwork/<int:pk>/', views.artwork_detail, name='artwork_detail'),
+    path('artwork/<int:pk>/reviews/', views.artwork_reviews_json, name='artwork_reviews_json'),
+    path('artwork/<slug:slug>/', views.artwork_detail, name='artwork_by_slug'),
     path('about_thangka/', views.about_thangka, name='about_thangka'),
     path('about_team/', views.about_team, name='about_team'),
     path('contact/', views.contact, name='contact'),
@@ -17,10 +19,20 @@ urlpatterns = [
     path('password-reset/', views.password_reset, name='password_reset'),
     path('artist/', views.artist_dashboard, name='artist_dashboard'),
     path('artist/artworks_json/', views.artist_artworks_json, name='artist_artworks_json'),
+    path('artist/analytics/', views.artist_analytics_json, name='artist_analytics'),
     path('chat/', views.chat_page, name='chat_page'),
     path('api/toggle_like/', views.toggle_like, name='toggle_like'),
     path('api/toggle_bookmark/', views.toggle_bookmark, name='toggle_bookmark'),
     path('api/toggle_follow/', views.toggle_follow, name='toggle_follow'),
+    path('api/engagement/batch/', views.engagement_batch, name='engagement_batch'),
+    path('api/my_state/', views.my_state, name='my_state'),
+    path('api/recommendations/', views.recommendations_json, name='recommendations'),
+    path('api/autocomplete/', views.autocomplete_json, name='autocomplete'),
+    path('api/uploads/', uploads.upload_init, name='upload_init'),
+    path('api/uploads/<uuid:pk>/', uploads.upload_session, name='upload_session'),
+    path('api/uploads/<uuid:pk>/complete/', uploads.upload_complete, name='upload_complete'),
+    path('readyz/', views.readiness, name='readiness'),
+    path('export/catalog/', views.catalog_export, name='catalog_export'),
     path('notifications/', views.notifications_page, name='notifications_page'),
     path('notifications/<int:notif_id>/read/', views.mark_notification_read, name='mark_notif_read'),
     path('notifications/clear/', views.clear_notifications, name='clear_notifications'),
@@ -1,80 +1,323 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, get_object_or_404, aget_object_or_404
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.urls import reverse
-from django.core.paginator import Paginator
-from django.db.models import Q, Count
+from django.db.models import Q, Case, Count, F, FloatField, Max, Sum, Value, When, CharField
+from django.db import router, transaction
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.cache import never_cache
 from django.views.decorators.http import require_GET, require_POST
-from django.http import JsonResponse, HttpResponseBadRequest
-
-from .models import Artwork, Category, Tag, Artist, ArtworkImage, Review, ChatMessage, ArtworkLike, Bookmark, Follow, Notification
+from django.http import JsonResponse, HttpResponseBadRequest, StreamingHttpResponse
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+
+from .models import Artwork, ArtworkSimilarity, Category, ImageColor, Tag, Artist, ArtworkImage, Review, ChatMessage, ArtworkLike, Bookmark, Follow, Notification
 from .forms import RegisterForm, ArtworkForm, ContactForm, ArtistForm
+from .caching import acatalog_generation, cached_compute, catalog_generation
+from .exports import FORMATS, export_stream, parse_since
+from .queries import count_per_artwork
+from . import analytics, autocomplete
 from django.contrib.auth.models import User
+import base64
+import json
 
 # Home page with featured artworks
 def index(request):
     featured = Artwork.objects.filter(is_published=True).order_by('-is_featured', '-created_at')[:6]
-    categories = Category.objects.all()
-    return render(request, 'Thangka_gallary/index.html', {'featured': featured, 'categories': categories})
+    trending = _feed_queryset('trending')[:6]
+    categories = _category_list()
+    return render(request, 'Thangka_gallary/index.html', {
+        'featured': featured,
+        'trending': trending,
+        'categories': categories,
+    })
+
+@cached_compute('index_categories', 300)
+def _category_list():
+    # with the number of published artworks in each
+    return list(Category.objects.annotate(
+        artwork_count=Count('artworks', filter=Q(artworks__is_published=True))))
+
+# colour filter shortcuts on the gallery page
+PIGMENTS = [
+    ('Lapis blue', '#1f3a93'),
+    ('Cinnabar red', '#c23b22'),
+    ('Malachite green', '#3f8f5f'),
+    ('Orpiment yellow', '#e8b923'),
+    ('Gold', '#c9a227'),
+    ('Indigo', '#2e2a5a'),
+]
 
 # Gallery with search, category, tag filters, and pagination
 def gallery(request):
-    # initial render - serve first page of artworks
-    qs = Artwork.objects.filter(is_published=True).order_by('-created_at')
-    paginator = Paginator(qs, 12)
-    page1 = paginator.get_page(1)
-
-    # convert to list and annotate simple attributes for template (avoid calling QuerySet methods in template)
-    artworks = list(page1)
+    # initial render - serve first page of artworks. Per-user flags (liked/saved)
+    # are not rendered: the page script loads them from my_state, so the HTML is
+    # the same for every visitor and can be cached.
+    try:
+        color = _parse_color(request)
+    except ValueError:
+        color = None
+    queryset = _feed_queryset().annotate(likes_total=count_per_artwork(ArtworkLike))
+    if color:
+        ids = list(_color_ranking(color)[:13])
+        artworks = _in_order(queryset.filter(pk__in=ids[:12]), ids)
+        has_next = len(ids) > 12
+    else:
+        artworks = list(queryset[:13])
+        has_next = len(artworks) > 12
+        artworks = artworks[:12]
     for art in artworks:
-        art.likes_count = art.likes.count() if hasattr(art, 'likes') else 0
-        art.is_bookmarked = False
-        if request.user.is_authenticated:
-            art.is_bookmarked = Bookmark.objects.filter(user=request.user, artwork=art).exists()
-        art.display_artist = art.artist.name if getattr(art, 'artist', None) and getattr(art.artist, 'name', None) else getattr(art.artist.user, 'username', '')
+        art.likes_count = art.likes_total
+        art.display_artist = _artist_name(art)
 
     return render(request, 'Thangka_gallary/gallery.html', {
         'artworks': artworks,
-        'has_next': page1.has_next(),
+        'has_next': has_next,
+        'color': '#%02x%02x%02x' % color if color else '',
+        'pigments': PIGMENTS,
     })
 
-def gallery_json(request):
-    # JSON endpoint for infinite scroll
-    page = int(request.GET.get('page', 1))
-    per_page = 12
-    qs = Artwork.objects.filter(is_published=True).order_by('-created_at')
-    paginator = Paginator(qs, per_page)
-    pg = paginator.get_page(page)
-    items = []
-    for a in pg:
-        img = a.images.order_by('order').first() if hasattr(a, 'images') else None
-        items.append({
-            'id': a.id,
-            'title': a.title,
-            'artist': (a.artist.name if getattr(a, 'artist', None) and getattr(a.artist, 'name', None) else getattr(a.artist.user, 'username', '')),
-            'thumb': img.image.url if img else '',
-            'likes_count': a.likes.count() if hasattr(a, 'likes') else 0,
-        })
-    return JsonResponse({'items': items, 'has_next': pg.has_next()})
-
-# Artwork detail with related artworks and reviews
-def artwork_detail(request, pk):
-    art = get_object_or_404(Artwork, pk=pk, is_published=True)
-    Artwork.objects.filter(pk=art.pk).update(view_count=art.view_count + 1)
-
-    related = Artwork.objects.filter(is_published=True).exclude(pk=art.pk)
-    if art.category:
-        related = related.filter(category=art.category)[:6]
-    else:
-        tag_ids = art.tags.values_list('id', flat=True)
-        related = related.filter(tags__in=tag_ids).distinct()[:6]
+def _artist_for(user):
+    # request.user comes from CachedModelBackend with the artist preloaded
+    try:
+        return user.artist
+    except Artist.DoesNotExist:
+        artist, _ = Artist.objects.get_or_create(user=user, defaults={'name': user.username})
+        return artist
+
+def _artist_name(art):
+    artist = art.artist
+    if artist is None:
+        return ''
+    return artist.name or (artist.user.username if artist.user else '')
+
+FEED_ORDERINGS = {
+    'new': ('-created_at',),
+    # trending_score is precomputed by compute_trending; both orders are index scans
+    'trending': ('-trending_score', '-id'),
+}
+
+def _feed_queryset(sort='new', category=None):
+    # published artworks with everything a feed card needs, in one query + one prefetch
+    # (like counts change too often for the generation-validated feeds: see my_state)
+    queryset = Artwork.objects.filter(is_published=True)
+    if category:
+        queryset = queryset.filter(category__slug=category)
+    return (queryset
+            .select_related('artist__user')
+            .prefetch_related('images')
+            .order_by(*FEED_ORDERINGS[sort]))
+
+def _feed_item(a):
+    images = list(a.images.all())
+    first = images[0] if images else None
+    return {
+        'id': a.id,
+        'title': a.title,
+        'artist': _artist_name(a),
+        'thumb': first.image.url if first else '',
+        # enough for the client to size and paint the card before the image loads
+        'thumb_width': first.width if first else None,
+        'thumb_height': first.height if first else None,
+        'placeholder': first.placeholder if first else '',
+        'url': a.get_absolute_url(),
+    }
+
+def _page_number(request):
+    try:
+        return max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return 1
 
-    return render(request, 'Thangka_gallary/detail.html', {
+def _color_ranking(rgb, category=None):
+    """
+    Published artwork ids, closest to the colour first: the best of their
+    images' palette colours, by share of the image x closeness of its Lab bin.
+    Reads only the ImageColor rows of the bins near the colour (imagecolor_bin_idx).
+    """
+    from .palette import nearby_bins
+
+    bins = nearby_bins(rgb)
+    closeness = Case(*[When(bin=number, then=Value(value)) for number, value in bins.items()],
+                     default=Value(0.0), output_field=FloatField())
+    queryset = ImageColor.objects.filter(bin__in=list(bins), artwork__is_published=True)
+    if category:
+        queryset = queryset.filter(artwork__category__slug=category)
+    return (queryset.values('artwork_id').annotate(score=Max(F('weight') * closeness))
+            .order_by('-score', '-artwork_id').values_list('artwork_id', flat=True))
+
+def _parse_color(request):
+    # ?color=#1f3a93 -> (r, g, b), or None; ValueError if malformed
+    value = request.GET.get('color', '')
+    if not value:
+        return None
+    from .palette import parse_color
+    return parse_color(value)
+
+async def _feed_page(page, per_page=12, sort='new', category=None, color=None):
+    # fetch one extra row to know whether there is a next page without a COUNT(*)
+    start = (page - 1) * per_page
+    if color:
+        ids = [pk async for pk in _color_ranking(color, category)[start:start + per_page + 1]]
+        artworks = _in_order([a async for a in _feed_queryset().filter(pk__in=ids[:per_page])], ids)
+        return [_feed_item(a) for a in artworks], len(ids) > per_page
+    items = [_feed_item(a) async for a in _feed_queryset(sort, category)[start:start + per_page + 1]]
+    return items[:per_page], len(items) > per_page
+
+async def _cached_feed_payload(variant, generation, page, build):
+    key = f'feed:{variant}:{generation}:{page}'
+    payload = await cache.aget(key)
+    if payload is None:
+        payload = await build(page)
+        await cache.aset(key, payload, settings.FEED_CACHE_SECONDS * 10)
+    return payload
+
+async def _conditional_feed(request, variant, build):
+    """
+    Serve a feed page with an ETag derived from the catalog generation.
+    Revalidations are answered with 304 before touching the database, and
+    built payloads are cached per generation, so they never go stale.
+    """
+    page = _page_number(request)
+    generation = await acatalog_generation()
+    etag = f'"{variant}-{generation}-{page}"'
+
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(await _cached_feed_payload(variant, generation, page, build))
+
+    response['ETag'] = etag
+    if settings.SESSION_COOKIE_NAME in request.COOKIES:
+        patch_cache_control(response, private=True, max_age=0, must_revalidate=True)
+    else:
+        # same bytes for every anonymous visitor: let shared proxies keep it
+        patch_cache_control(response, public=True, max_age=settings.FEED_CACHE_SECONDS)
+    return response
+
+async def gallery_json(request):
+    # JSON endpoint for infinite scroll; ?sort=new|trending, optional ?category=<slug>,
+    # optional ?color=#rrggbb (closest colours first; replaces sort)
+    sort = request.GET.get('sort', 'new')
+    if sort not in FEED_ORDERINGS:
+        return HttpResponseBadRequest("sort must be one of: %s" % ', '.join(FEED_ORDERINGS))
+    category = request.GET.get('category', '')
+    if category and not category.replace('-', '').replace('_', '').isalnum():
+        return HttpResponseBadRequest("invalid category")
+    try:
+        color = _parse_color(request)
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    return await _conditional_feed(request, *_gallery_feed(sort, category, color))
+
+def _gallery_feed(sort, category='', color=None):
+    """(cache variant, payload builder) of one gallery_json feed."""
+    if color:
+        sort = 'color-%02x%02x%02x' % color
+
+    async def build(page):
+        items, has_next = await _feed_page(page, sort=sort, category=category or None, color=color)
+        return {'items': items, 'has_next': has_next}
+
+    return f'gallery-{sort}-{category}', build
+
+# Artwork detail with related artworks and reviews, at /artwork/<slug>/; /artwork/<id>/ redirects there
+def artwork_detail(request, pk=None, slug=None):
+    queryset = (Artwork.objects.filter(is_published=True)
+                .select_related('artist', 'category').prefetch_related('images'))
+    if slug is None:
+        art = get_object_or_404(queryset, pk=pk)
+        if art.slug:
+            return redirect(art.get_absolute_url(), permanent=True)
+    else:
+        art = get_object_or_404(queryset, slug=slug)
+    # increment in SQL: `art` may come from a replica that lags behind
+    Artwork.objects.filter(pk=art.pk).update(view_count=F('view_count') + 1)
+    return render(request, 'Thangka_gallary/detail.html', _detail_context(art))
+
+def _related_ids(art):
+    # cached per catalog generation: the tag variant is a DISTINCT join over every published artwork
+    key = f'related:{art.pk}:{catalog_generation()}'
+    ids = cache.get(key)
+    if ids is None:
+        related = Artwork.objects.filter(is_published=True).exclude(pk=art.pk)
+        if art.category_id:
+            related = related.filter(category_id=art.category_id)
+        else:
+            related = related.filter(tags__in=art.tags.values_list('id', flat=True)).distinct()
+        ids = list(related.values_list('pk', flat=True)[:6])
+        cache.set(key, ids, settings.FEED_CACHE_SECONDS * 10)
+    return ids
+
+def _detail_context(art):
+    ids = _related_ids(art)
+    related = _in_order(Artwork.objects.filter(pk__in=ids).prefetch_related('images'), ids)
+    # first page only; the rest comes from artwork_reviews_json
+    reviews = list(_reviews_queryset(art.pk)[:REVIEWS_PER_PAGE + 1])
+    return {
         'art': art,
         'related': related,
-        'reviews': art.reviews.all()
+        'reviews': reviews[:REVIEWS_PER_PAGE],
+        'reviews_cursor': _review_cursor(reviews[REVIEWS_PER_PAGE - 1]) if len(reviews) > REVIEWS_PER_PAGE else '',
+    }
+
+REVIEWS_PER_PAGE = 10
+
+def _review_cursor(review):
+    # position of the last review shown; the next page starts strictly after it
+    raw = f'{review.created_at.isoformat()}|{review.pk}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _reviews_queryset(artwork_id, cursor=None):
+    """
+    An artwork's reviews, newest first, with their authors. Keyset pagination
+    on (created_at, id) walks review_artwork_recent_idx, so page 500 costs
+    the same as page 1. Raises ValueError for a malformed cursor.
+    """
+    queryset = (Review.objects.filter(artwork_id=artwork_id)
+                .select_related('user').order_by('-created_at', '-id'))
+    if cursor:
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+            created, _, pk = raw.partition('|')
+            created, pk = parse_datetime(created), int(pk)
+        except (ValueError, UnicodeDecodeError):
+            raise ValueError("invalid cursor")
+        if created is None:
+            raise ValueError("invalid cursor")
+        queryset = queryset.filter(Q(created_at__lt=created) | Q(created_at=created, pk__lt=pk))
+    return queryset
+
+def _review_item(review):
+    return {
+        'id': review.pk,
+        'user': review.user.username if review.user else 'Anonymous',
+        'rating': review.rating,
+        'comment': review.comment,
+        'created_at': review.created_at.isoformat(),
+    }
+
+@require_GET
+async def artwork_reviews_json(request, pk):
+    """Next page of reviews after ?cursor= (from the page or a previous call)."""
+    if not await Artwork.objects.filter(pk=pk, is_published=True).aexists():
+        return JsonResponse({'error': 'not found'}, status=404)
+    try:
+        queryset = _reviews_queryset(pk, request.GET.get('cursor'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    reviews = [r async for r in queryset[:REVIEWS_PER_PAGE + 1]]
+    has_next = len(reviews) > REVIEWS_PER_PAGE
+    reviews = reviews[:REVIEWS_PER_PAGE]
+    response = JsonResponse({
+        'items': [_review_item(r) for r in reviews],
+        'next': _review_cursor(reviews[-1]) if has_next else None,
     })
+    patch_cache_control(response, public=True, max_age=settings.FEED_CACHE_SECONDS)
+    return response
 
 # Static pages
 def about_thangka(request):
@@ -107,8 +350,8 @@ def user_register(request):
         artist_form = ArtistForm(request.POST, request.FILES)
         if form.is_valid():
             user = form.save()
-            # Create or update Artist profile
-            artist = Artist.objects.create(user=user, name=user.username)
+            # the post_save signal already created the Artist profile; update it
+            artist = _artist_for(user)
             if artist_form.is_valid():
                 artist.bio = artist_form.cleaned_data.get('bio') or artist.bio
                 if artist_form.cleaned_data.get('avatar'):
@@ -142,6 +385,21 @@ def user_logout(request):
     # send to login page after logout
     return redirect('login')
 
+def _save_images(request, artwork, files):
+    """Attach uploaded files to `artwork` and warn about near-duplicates already in the library."""
+    from .perceptual import library
+
+    reported = set()
+    for order, f in enumerate(files):
+        image = ArtworkImage.objects.create(artwork=artwork, image=f, order=order)
+        if image.dhash is None:
+            continue
+        for match, _ in library.search(image.dhash, exclude_artwork=artwork.pk):
+            if match.artwork_id not in reported:
+                reported.add(match.artwork_id)
+                messages.warning(request, f'"{f.name}" looks like a duplicate of "{match.artwork.title}" '
+                                          f'({match.artwork.get_absolute_url()}).')
+
 # Upload artwork (supports multiple images)
 @login_required
 def upload_artwork(request):
@@ -151,19 +409,26 @@ def upload_artwork(request):
         if form.is_valid():
             artwork = form.save(commit=False)
             # assign artist profile
-            artwork.artist, created = Artist.objects.get_or_create(user=request.user, defaults={'name': request.user.username})
+            artwork.artist = _artist_for(request.user)
             artwork.save()
             form.save_m2m()  # save tags
             # save multiple images
-            for order, f in enumerate(files):
-                ArtworkImage.objects.create(artwork=artwork, image=f, order=order)
+            _save_images(request, artwork, files)
             messages.success(request, "Artwork uploaded successfully.")
+            if request.POST.get('chunked'):
+                # uploads.js sends the large scans to /api/uploads/ next, then follows `redirect`
+                return JsonResponse({'artwork_id': artwork.pk, 'redirect': '/gallery/'})
             return redirect('/gallery/')
+        elif request.POST.get('chunked'):
+            return JsonResponse({'errors': form.errors}, status=400)
         else:
             messages.error(request, "Please correct the errors below.")
     else:
         form = ArtworkForm()
-    return render(request, 'Thangka_gallary/upload_artwork.html', {'form': form})
+    return render(request, 'Thangka_gallary/upload_artwork.html', {
+        'form': form,
+        'chunked_threshold': settings.CHUNKED_UPLOAD_THRESHOLD,
+    })
 
 # User profile page
 @login_required
@@ -189,11 +454,10 @@ def artist_dashboard(request):
         files = request.FILES.getlist('images')
         if form.is_valid():
             artwork = form.save(commit=False)
-            artwork.artist, _ = Artist.objects.get_or_create(user=request.user, defaults={'name': request.user.username})
+            artwork.artist = _artist_for(request.user)
             artwork.save()
             form.save_m2m()
-            for order, f in enumerate(files):
-                ArtworkImage.objects.create(artwork=artwork, image=f, order=order)
+            _save_images(request, artwork, files)
             messages.success(request, "Artwork uploaded.")
             return redirect('artist_dashboard')
         else:
@@ -216,38 +480,133 @@ def artist_dashboard(request):
         # artist display name fallback
         art.display_artist = art.artist.name if getattr(art, 'artist', None) and getattr(art.artist, 'name', None) else getattr(art.artist.user, 'username', '')
 
+    recommended, recommended_source = _recommended(request.user)
+    for art in recommended:
+        art.display_artist = _artist_name(art)
+
     return render(request, 'Thangka_gallary/artist_dashboard.html', {
         'form': form,
         'user_artworks': user_artworks,
         'feed_artworks': feed_artworks,
+        'recommended': recommended,
+        'recommended_source': recommended_source,
     })
 
+@login_required
+@require_GET
+def artist_analytics_json(request):
+    """
+    The caller's engagement over time (views, likes, bookmarks, reviews,
+    follows), from the rollup tables only. Query params: granularity
+    (day|hour), days (int), artwork (id of one of the caller's artworks)
+    """
+    granularity = request.GET.get('granularity', 'day')
+    if granularity not in analytics.ROLLUPS:
+        return HttpResponseBadRequest("granularity must be one of: %s" % ', '.join(analytics.ROLLUPS))
+    try:
+        days = int(request.GET.get('days', 30))
+        artwork_id = int(request.GET['artwork']) if request.GET.get('artwork') else None
+    except ValueError:
+        return HttpResponseBadRequest("days and artwork must be integers")
+    artist = _artist_for(request.user)
+    if artwork_id is not None and not Artwork.objects.filter(pk=artwork_id, artist=artist).exists():
+        return JsonResponse({'error': 'not found'}, status=404)
+    response = JsonResponse(analytics.series(artist, granularity, days, artwork_id))
+    patch_cache_control(response, private=True, max_age=60)
+    return response
+
+async def _artist_feed_payload(page):
+    items, _ = await _feed_page(page)
+    return {'items': items}
+
 @require_GET
-def artist_artworks_json(request):
+async def artist_artworks_json(request):
     """
     Returns paginated artworks as JSON for infinite scroll.
     Query params: page (int)
     """
-    page = int(request.GET.get('page', 1))
-    per_page = 12
-    qs = Artwork.objects.filter(is_published=True).order_by('-created_at')
-    start = (page - 1) * per_page
-    end = start + per_page
-    items = []
-    for a in qs[start:end]:
-        thumb = ''
-        # attempt to get first image url
-        img = a.images.order_by('order').first() if hasattr(a, 'images') else None
-        if img:
-            thumb = img.image.url
-        items.append({
-            'id': a.id,
-            'title': a.title,
-            'artist': a.artist.name if a.artist else a.artist.user.username,
-            'thumb': thumb,
-            'url': a.get_absolute_url() if hasattr(a, 'get_absolute_url') else f"/gallery/{a.id}/"
-        })
-    return JsonResponse({'items': items})
+    return await _conditional_feed(request, 'artist', _artist_feed_payload)
+
+RECOMMENDATION_SEEDS = 30  # most recent likes, and as many bookmarks, whose neighbours are merged
+RECOMMENDATIONS_PER_PAGE = 12
+
+def _recommended_ids(user):
+    """
+    Neighbours of the user's recent likes and bookmarks, from the precomputed
+    ArtworkSimilarity table (`manage.py compute_similarities`), scores summed
+    over seeds, minus what the user already liked or saved. A single query:
+    the seeds are LIMITed subqueries and every seed is one indexed range scan.
+    """
+    likes = ArtworkLike.objects.filter(user=user).values('artwork_id')
+    bookmarks = Bookmark.objects.filter(user=user).values('artwork_id')
+    return (ArtworkSimilarity.objects
+            .filter(Q(artwork_id__in=likes.order_by('-created_at')[:RECOMMENDATION_SEEDS])
+                    | Q(artwork_id__in=bookmarks.order_by('-created_at')[:RECOMMENDATION_SEEDS]),
+                    neighbor__is_published=True)
+            .exclude(neighbor_id__in=likes).exclude(neighbor_id__in=bookmarks)
+            .values('neighbor_id').annotate(total=Sum('score'))
+            .order_by('-total', 'neighbor_id').values_list('neighbor_id', flat=True))
+
+def _in_order(artworks, ids):
+    by_id = {a.pk: a for a in artworks}
+    return [by_id[pk] for pk in ids if pk in by_id]
+
+def _recommended(user, limit=RECOMMENDATIONS_PER_PAGE):
+    """(artworks, source): 'similar' from the user's history, else 'trending'."""
+    ids = list(_recommended_ids(user)[:limit])
+    if ids:
+        return _in_order(_feed_queryset().filter(pk__in=ids), ids), 'similar'
+    return list(_feed_queryset('trending')[:limit]), 'trending'
+
+async def _arecommended(user, limit=RECOMMENDATIONS_PER_PAGE):
+    ids = [pk async for pk in _recommended_ids(user)[:limit]]
+    if ids:
+        return _in_order([a async for a in _feed_queryset().filter(pk__in=ids)], ids), 'similar'
+    return [a async for a in _feed_queryset('trending')[:limit]], 'trending'
+
+@login_required
+@require_GET
+async def recommendations_json(request):
+    """
+    "For you": artworks similar to the caller's recent likes and bookmarks,
+    or trending ones while there is no history. Query params: limit (int)
+    """
+    try:
+        limit = min(max(int(request.GET.get('limit', RECOMMENDATIONS_PER_PAGE)), 1), 48)
+    except ValueError:
+        return HttpResponseBadRequest("limit must be an integer")
+    artworks, source = await _arecommended(await request.auser(), limit)
+    response = JsonResponse({'items': [_feed_item(a) for a in artworks], 'source': source})
+    patch_cache_control(response, private=True, max_age=60)
+    return response
+
+@require_GET
+def autocomplete_json(request):
+    """
+    Names starting with what was typed, for tag pickers and the chat user
+    search. Query params: kind (tags|artists|categories), q, limit (int)
+    """
+    kind = request.GET.get('kind', '')
+    if kind not in autocomplete.KINDS:
+        return HttpResponseBadRequest("kind must be one of " + ', '.join(autocomplete.KINDS))
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        return HttpResponseBadRequest("limit must be an integer")
+    prefix = request.GET.get('q', '').strip()[:100]
+    results, source = autocomplete.search(kind, prefix, limit) if prefix else ([], 'index')
+    response = JsonResponse({'results': results, 'source': source})
+    patch_cache_control(response, public=True, max_age=60)
+    return response
+
+CHAT_ARTISTS = 20
+
+@cached_compute('chat_artist_ranking', 60)
+def _chat_artist_ranking():
+    # one more than shown: the viewer may be in it
+    return list(Artwork.objects.filter(artist__user__isnull=False)
+                .values_list('artist__user_id').annotate(n=Count('id')).order_by('-n', 'artist__user_id')
+                [:CHAT_ARTISTS + 1])
 
 @login_required
 def chat_page(request):
@@ -282,30 +641,9 @@ def chat_page(request):
             Q(sender=selected_user, recipient=request.user)
         ).order_by('created_at')
 
-    # get list of artists (users who have an artist profile)
-    from Thangka_gallary.models import Artwork
-    artist_users = Artist.objects.filter(
-        user__isnull=False
-    ).values_list('user_id', flat=True)
-    
-    # get artworks per user
-    artwork_counts = {}
-    for user_id in artist_users:
-        count = Artwork.objects.filter(artist__user_id=user_id).count()
-        if count > 0:
-            artwork_counts[user_id] = count
-
-    # fetch users sorted by artwork count
-    artists = User.objects.filter(
-        pk__in=artwork_counts.keys()
-    ).exclude(pk=request.user.pk)
-    
-    # sort in Python by artwork count descending
-    artists_list = sorted(
-        artists,
-        key=lambda u: artwork_counts.get(u.pk, 0),
-        reverse=True
-    )[:20]
+    # artists (users with an artist profile) with the most artworks
+    ranking = [user_id for user_id, _ in _chat_artist_ranking() if user_id != request.user.pk][:CHAT_ARTISTS]
+    artists_list = _in_order(User.objects.filter(pk__in=ranking), ranking)
 
     return render(request, 'Thangka_gallary/chat.html', {
         'selected_user': selected_user,
@@ -315,35 +653,37 @@ def chat_page(request):
 
 @login_required
 @require_POST
-def toggle_like(request):
+async def toggle_like(request):
     art_id = request.POST.get('artwork_id')
     if not art_id:
         return HttpResponseBadRequest("Missing artwork_id")
+    user = await request.auser()
     try:
-        art = Artwork.objects.get(pk=art_id)
+        art = await Artwork.objects.aget(pk=art_id)
     except Artwork.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'Artwork not found'}, status=404)
-    liked, created = ArtworkLike.objects.get_or_create(user=request.user, artwork=art)
+    liked, created = await ArtworkLike.objects.aget_or_create(user=user, artwork=art)
     if not created:
-        liked.delete()
+        await liked.adelete()
         action = 'unliked'
     else:
         action = 'liked'
-    return JsonResponse({'status': 'ok', 'action': action, 'likes_count': art.likes.count()})
+    return JsonResponse({'status': 'ok', 'action': action, 'likes_count': await art.likes.acount()})
 
 @login_required
 @require_POST
-def toggle_bookmark(request):
+async def toggle_bookmark(request):
     art_id = request.POST.get('artwork_id')
     if not art_id:
         return HttpResponseBadRequest("Missing artwork_id")
+    user = await request.auser()
     try:
-        art = Artwork.objects.get(pk=art_id)
+        art = await Artwork.objects.aget(pk=art_id)
     except Artwork.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'Artwork not found'}, status=404)
-    bm, created = Bookmark.objects.get_or_create(user=request.user, artwork=art)
+    bm, created = await Bookmark.objects.aget_or_create(user=user, artwork=art)
     if not created:
-        bm.delete()
+        await bm.adelete()
         action = 'removed'
     else:
         action = 'saved'
@@ -351,23 +691,172 @@ def toggle_bookmark(request):
 
 @login_required
 @require_POST
-def toggle_follow(request):
+async def toggle_follow(request):
     user_id = request.POST.get('user_id')
     if not user_id:
         return HttpResponseBadRequest("Missing user_id")
-    if str(request.user.id) == str(user_id):
+    user = await request.auser()
+    if str(user.id) == str(user_id):
         return JsonResponse({'status': 'error', 'message': "Can't follow yourself"}, status=400)
     try:
-        target = User.objects.get(pk=user_id)
+        target = await User.objects.aget(pk=user_id)
     except User.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'User not found'}, status=404)
-    f, created = Follow.objects.get_or_create(follower=request.user, followee=target)
+    f, created = await Follow.objects.aget_or_create(follower=user, followee=target)
     if not created:
-        f.delete()
+        await f.adelete()
         action = 'unfollowed'
     else:
         action = 'followed'
-    return JsonResponse({'status': 'ok', 'action': action, 'followers_count': target.followers.count()})
+    return JsonResponse({'status': 'ok', 'action': action, 'followers_count': await target.followers.acount()})
+
+MAX_BATCH_ACTIONS = 200
+# kind -> (model, owner field, target field)
+ENGAGEMENT_KINDS = {
+    'like': (ArtworkLike, 'user', 'artwork'),
+    'bookmark': (Bookmark, 'user', 'artwork'),
+    'follow': (Follow, 'follower', 'followee'),
+}
+
+def _parse_actions(body):
+    """
+    Decode {"actions": [{"type": "like", "id": 5, "on": true}, ...]} into
+    {(type, id): on}; the last action for a target wins. Raises ValueError.
+    """
+    actions = json.loads(body).get('actions')
+    if not isinstance(actions, list) or len(actions) > MAX_BATCH_ACTIONS:
+        raise ValueError("actions must be a list of at most %d items" % MAX_BATCH_ACTIONS)
+    desired = {}
+    for action in actions:
+        kind = action.get('type')
+        if kind not in ENGAGEMENT_KINDS or not isinstance(action.get('on'), bool):
+            raise ValueError("invalid action: %r" % (action,))
+        desired[(kind, int(action['id']))] = action['on']
+    return desired
+
+@login_required
+@require_POST
+def engagement_batch(request):
+    """
+    Apply many like / bookmark / follow changes in one transaction.
+    Actions carry the desired end state rather than a toggle, so the
+    frontend's offline queue can be replayed without flipping things twice.
+    """
+    try:
+        desired = _parse_actions(request.body)
+    except (ValueError, TypeError, AttributeError, KeyError) as e:
+        return HttpResponseBadRequest(str(e))
+
+    artwork_ids = {pk for (kind, pk) in desired if kind != 'follow'}
+    user_ids = {pk for (kind, pk) in desired if kind == 'follow'}
+    valid = {
+        'artwork': set(Artwork.objects.filter(pk__in=artwork_ids).values_list('pk', flat=True)),
+        'followee': set(User.objects.filter(pk__in=user_ids).exclude(pk=request.user.pk).values_list('pk', flat=True)),
+    }
+
+    applied, skipped = 0, []
+    with transaction.atomic():
+        for kind, (model, owner, target) in ENGAGEMENT_KINDS.items():
+            on, off = [], []
+            for (k, pk), state in desired.items():
+                if k != kind:
+                    continue
+                if pk not in valid[target]:
+                    skipped.append({'type': kind, 'id': pk})
+                    continue
+                (on if state else off).append(pk)
+            if on:
+                model.objects.bulk_create(
+                    [model(**{owner: request.user, f'{target}_id': pk}) for pk in on],
+                    ignore_conflicts=True)
+            if off:
+                model.objects.filter(**{owner: request.user, f'{target}_id__in': off}).delete()
+            applied += len(on) + len(off)
+
+    liked_ids = [pk for (kind, pk) in desired if kind == 'like' and pk in valid['artwork']]
+    likes_count = dict(ArtworkLike.objects.filter(artwork_id__in=liked_ids)
+                       .values('artwork_id').annotate(n=Count('id')).values_list('artwork_id', 'n'))
+    return JsonResponse({
+        'status': 'ok',
+        'applied': applied,
+        'skipped': skipped,
+        'likes_count': {str(pk): likes_count.get(pk, 0) for pk in liked_ids},
+    })
+
+async def my_state(request):
+    """
+    The caller's liked / bookmarked flags for ?ids=1,2,3 in a single query,
+    so pages can render the same HTML for everyone and hydrate per-user state,
+    and the like counts of those artworks, which the cached feeds leave out.
+    """
+    try:
+        ids = [int(i) for i in request.GET.get('ids', '').split(',') if i.strip()][:MAX_BATCH_ACTIONS]
+    except ValueError:
+        return HttpResponseBadRequest("ids must be a comma separated list of integers")
+
+    liked, bookmarked, likes_count = [], [], {}
+    user = await request.auser()
+    if ids:
+        def rows(queryset, kind):
+            return queryset.annotate(kind=Value(kind, output_field=CharField()))
+
+        counts = (rows(ArtworkLike.objects.filter(artwork_id__in=ids).order_by().values('artwork_id'), 'count')
+                  .annotate(n=Count('id')).values_list('artwork_id', 'kind', 'n'))
+        if user.is_authenticated:
+            mine = [rows(model.objects.filter(user=user, artwork_id__in=ids), kind)
+                    .annotate(n=Value(1)).values_list('artwork_id', 'kind', 'n')
+                    for model, kind in ((ArtworkLike, 'like'), (Bookmark, 'bookmark'))]
+            counts = counts.union(*mine, all=True)
+        async for artwork_id, kind, n in counts:
+            if kind == 'count':
+                likes_count[artwork_id] = n
+            else:
+                (liked if kind == 'like' else bookmarked).append(artwork_id)
+
+    response = JsonResponse({'liked': liked, 'bookmarked': bookmarked,
+                             'likes_count': {str(pk): likes_count.get(pk, 0) for pk in ids}})
+    patch_cache_control(response, private=True, no_store=True)
+    return response
+
+@staff_member_required
+@require_GET
+def catalog_export(request):
+    """
+    Stream the whole catalog (or what changed since ?since=<ISO date>) as
+    ?format=csv|jsonl, gzipped unless ?compress=0. The X-Export-Until header
+    is the `since` to pass next time for an incremental export.
+    """
+    fmt = request.GET.get('format', 'csv')
+    if fmt not in FORMATS:
+        return HttpResponseBadRequest("format must be one of: %s" % ', '.join(FORMATS))
+    try:
+        since = parse_since(request.GET.get('since'))
+    except ValueError as e:
+        return HttpResponseBadRequest(str(e))
+    compress = request.GET.get('compress', '1') != '0'
+    until = timezone.now()
+
+    filename = f"catalog-{until:%Y%m%dT%H%M%S}.{fmt}" + ('.gz' if compress else '')
+    content_type = 'application/gzip' if compress else (
+        'text/csv; charset=utf-8' if fmt == 'csv' else 'application/x-ndjson; charset=utf-8')
+    response = StreamingHttpResponse(export_stream(fmt, since, until, compress), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response['X-Export-Until'] = until.isoformat()
+    patch_cache_control(response, private=True, no_store=True)
+    return response
+
+@cached_compute('notification_summary', 300)
+def notification_summary(user_id):
+    """Unread and per-type counts of a user's notifications; dropped by signals on every change."""
+    # on the primary: a lagging replica's counts would be cached for the full timeout
+    counts = (Notification.objects.using(router.db_for_write(Notification))
+              .filter(user_id=user_id).order_by()
+              .values_list('notification_type')
+              .annotate(total=Count('id'), unread=Count('id', filter=Q(is_read=False))))
+    return {
+        'unread': sum(unread for _, _, unread in counts),
+        'by_type': {kind: total for kind, total, _ in counts},
+    }
 
 @login_required
 def notifications_page(request):
@@ -375,10 +864,12 @@ def notifications_page(request):
     Display user notifications - what's new in the community.
     """
     notifications = Notification.objects.filter(user=request.user)
-    
+    summary = notification_summary(request.user.pk)
+
     # Mark as read if viewing
     unread = notifications.filter(is_read=False)
-    unread.update(is_read=True)
+    if unread.update(is_read=True):
+        notification_summary.invalidate(request.user.pk)
     
     # Group by type
     notifications_by_type = {}
@@ -391,19 +882,29 @@ def notifications_page(request):
     return render(request, 'Thangka_gallary/notifications.html', {
         'notifications': notifications[:50],
         'notifications_by_type': notifications_by_type,
-        'unread_count': Notification.objects.filter(user=request.user, is_read=False).count(),
+        # as it was before this visit marked everything read
+        'unread_count': summary['unread'],
+        'type_counts': summary['by_type'],
     })
 
 @login_required
-def mark_notification_read(request, notif_id):
+async def mark_notification_read(request, notif_id):
     """Mark a single notification as read."""
-    notif = get_object_or_404(Notification, pk=notif_id, user=request.user)
+    notif = await aget_object_or_404(Notification, pk=notif_id, user=await request.auser())
     notif.is_read = True
-    notif.save()
+    await notif.asave(update_fields=['is_read'])
     return JsonResponse({'status': 'ok'})
 
 @login_required
-def clear_notifications(request):
+async def clear_notifications(request):
     """Clear all notifications for user."""
-    Notification.objects.filter(user=request.user).delete()
+    await Notification.objects.filter(user=await request.auser()).adelete()
     return JsonResponse({'status': 'ok'})
+
+@never_cache
+def readiness(request):
+    """Load balancer readiness probe: 503 while this process is still warming up (warmup.py)."""
+    from . import warmup
+
+    ready = warmup.ready()
+    return JsonResponse({'ready': ready, 'warmup': warmup.state.as_dict()}, status=200 if ready else 503)
@@ -0,0 +1,194 @@
+"""
+Post-deploy warmup.
+
+After a deploy every worker starts with an empty template cache and
+unimported lazy modules, and the shared cache has nothing for the new catalog
+generation, so the first requests to the home page, the gallery, its JSON
+feeds and the popular artwork pages are slow. run() does that work ahead of
+them:
+
+* compiles every template of the project's template directories into the
+  cached loader (per process)
+* resolves the URLconf, which imports every view module, and imports the
+  modules views load lazily (per process)
+* loads the autocomplete indexes (per process)
+* builds the first WARMUP_FEED_PAGES pages of each public feed into the
+  shared cache under the current catalog generation
+* caches the related artworks of the WARMUP_TOP_ARTWORKS most-viewed
+  artworks (shared) and renders their pages, the home page and the gallery
+  once (per process)
+
+`manage.py warmup` runs it after a deploy, which primes the shared cache for
+every worker. With WARMUP_ON_STARTUP each web process also runs it in a
+background thread as it starts (see wsgi.py / asgi.py), and the readiness
+endpoint answers 503 until that has finished.
+"""
+import importlib
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# loaded on first use by the views (colour filter, uploads, placeholders)
+LAZY_MODULES = ['Thangka_gallary.palette', 'Thangka_gallary.perceptual', 'Thangka_gallary.placeholders', 'PIL.Image']
+
+
+class State:
+    """This process's startup warmup, as reported by the readiness endpoint."""
+
+    def __init__(self):
+        self.started = None
+        self.finished = None
+        self.error = ''
+        self.steps = {}
+
+    def as_dict(self):
+        return {
+            'started': self.started,
+            'finished': self.finished,
+            'error': self.error,
+            'steps': self.steps,
+        }
+
+
+state = State()
+
+
+def _anonymous_get(path):
+    from django.contrib.auth.models import AnonymousUser
+    from django.http import HttpRequest
+
+    request = HttpRequest()
+    request.method = 'GET'
+    request.path = request.path_info = path
+    request.META = {'SERVER_NAME': 'warmup', 'SERVER_PORT': '80', 'REMOTE_ADDR': '127.0.0.1'}
+    request.user = AnonymousUser()
+    return request
+
+
+def compile_templates():
+    """Load every template under the project's template directories into the cached loader."""
+    from django.template import engines
+
+    compiled = 0
+    root = str(settings.BASE_DIR)
+    for engine in engines.all():
+        loaders = getattr(getattr(engine, 'engine', None), 'template_loaders', [])
+        for loader in loaders:
+            for inner in getattr(loader, 'loaders', [loader]):
+                # the project's own templates; contrib apps' (admin) are left cold
+                for directory in {str(d) for d in inner.get_dirs() if str(d).startswith(root)}:
+                    for path, _, files in os.walk(directory):
+                        for name in files:
+                            template = os.path.relpath(os.path.join(path, name), directory)
+                            try:
+                                engine.get_template(template)
+                                compiled += 1
+                            except Exception:
+                                logger.exception("warmup: template %s doesn't compile", template)
+    return compiled
+
+
+def import_modules():
+    from django.urls import get_resolver
+
+    get_resolver().reverse_dict  # imports the URLconf and with it every view module
+    for name in LAZY_MODULES:
+        importlib.import_module(name)
+    return len(LAZY_MODULES)
+
+
+def build_autocomplete():
+    from . import autocomplete
+
+    return sum(autocomplete.build(kind) for kind in autocomplete.KINDS)
+
+
+def prime_feeds(pages):
+    """Build the first `pages` pages of every public feed into the shared cache; returns the page count."""
+    from asgiref.sync import async_to_sync
+    from .caching import catalog_generation
+    from .models import Category
+    from . import views
+
+    generation = catalog_generation()
+    categories = [''] + list(Category.objects.values_list('slug', flat=True))
+    feeds = [views._gallery_feed(sort, category) for category in categories for sort in views.FEED_ORDERINGS]
+    feeds.append(('artist', views._artist_feed_payload))
+
+    async def build_all():
+        built = 0
+        for variant, build in feeds:
+            for page in range(1, pages + 1):
+                payload = await views._cached_feed_payload(variant, generation, page, build)
+                built += 1
+                if not payload.get('has_next', bool(payload['items'])):
+                    break
+        return built
+
+    return async_to_sync(build_all)()
+
+
+def prime_pages(top_artworks):
+    """Cache the related artworks of the most-viewed artworks and render them and the public pages once."""
+    from django.template.loader import render_to_string
+    from .models import Artwork
+    from . import views
+
+    views.index(_anonymous_get('/'))
+    views.gallery(_anonymous_get('/gallery/'))
+    artworks = (Artwork.objects.filter(is_published=True).select_related('artist', 'category')
+                .prefetch_related('images').order_by('-view_count', '-id')[:top_artworks])
+    rendered = 2
+    for art in artworks:
+        # not through the view: warming up isn't a visit (view_count)
+        render_to_string('Thangka_gallary/detail.html', views._detail_context(art),
+                         _anonymous_get(art.get_absolute_url()))
+        rendered += 1
+    return rendered
+
+
+def run(feed_pages=None, top_artworks=None, on_step=None):
+    """Run every warmup step; returns {step: {'count': n, 'ms': elapsed}}."""
+    feed_pages = settings.WARMUP_FEED_PAGES if feed_pages is None else feed_pages
+    top_artworks = settings.WARMUP_TOP_ARTWORKS if top_artworks is None else top_artworks
+    steps = {}
+    for name, step in [
+        ('templates', compile_templates),
+        ('modules', import_modules),
+        ('autocomplete', build_autocomplete),
+        ('feed pages', lambda: prime_feeds(feed_pages)),
+        ('pages', lambda: prime_pages(top_artworks)),
+    ]:
+        started = time.perf_counter()
+        steps[name] = {'count': step(), 'ms': round((time.perf_counter() - started) * 1000)}
+        if on_step:
+            on_step(name, steps[name])
+    return steps
+
+
+def start():
+    """Warm this process up in a background thread; the readiness endpoint reports when it's done."""
+    from django.db import connections
+
+    def warm():
+        state.started = time.time()
+        try:
+            run(on_step=state.steps.__setitem__)
+        except Exception as e:
+            # a failed warmup only costs latency: report ready anyway, with the error
+            logger.exception("warmup failed")
+            state.error = str(e)
+        finally:
+            state.finished = time.time()
+            connections.close_all()
+
+    threading.Thread(target=warm, name='warmup', daemon=True).start()
+
+
+def ready():
+    return state.finished is not None or not settings.WARMUP_ON_STARTUP
@@ -3,6 +3,10 @@ ASGI config for Thangka_project project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The JSON feeds, toggle APIs and notification endpoints are async views; serve
+them without tying up a thread per request with e.g.
+``uvicorn Thangka_project.asgi:application``.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
@@ -14,3 +18,10 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Thangka_project.settings')
 
 application = get_asgi_application()
+
+# optionally warm this process up in the background; /readyz/ reports when done
+from django.conf import settings
+
+if settings.WARMUP_ON_STARTUP:
+    from Thangka_gallary.warmup import start
+    start()
@@ -47,10 +47,13 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'Thangka_gallary.middleware.PrecompressedStaticMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'Thangka_gallary.middleware.ReplicaPinMiddleware',
+    'Thangka_gallary.middleware.RateLimitMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -78,8 +81,69 @@ STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'Thangka_gallary', 'static')]
 STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')  # for collectstatic
 
+# collectstatic writes content-hashed copies + staticfiles.json, builds the
+# script bundles below and stores .gz/.br siblings of every text asset
+STORAGES = {
+    # uploads are stored by content hash and reference-counted (Thangka_gallary/blobstore.py);
+    # THANGKA_MEDIA_STORAGE=object-store swaps in the local stand-in for an S3-style bucket
+    'default': {
+        'BACKEND': {
+            'object-store': 'Thangka_gallary.blobstore.LocalObjectStorage',
+        }.get(os.environ.get('THANGKA_MEDIA_STORAGE'), 'Thangka_gallary.blobstore.ContentAddressedStorage'),
+        'OPTIONS': {'workers': 8, 'fsync': True},
+    },
+    'staticfiles': {'BACKEND': 'Thangka_gallary.static_pipeline.CompressedManifestStaticFilesStorage'},
+}
+STATIC_BUNDLES = {
+    'Thangka_gallary/js/gallery.bundle.js': [
+        'Thangka_gallary/js/common.js',
+        'Thangka_gallary/js/gallery.js',
+    ],
+    'Thangka_gallary/js/artist_dashboard.bundle.js': [
+        'Thangka_gallary/js/common.js',
+        'Thangka_gallary/js/artist_dashboard.js',
+        'Thangka_gallary/js/autocomplete.js',
+    ],
+    'Thangka_gallary/js/artwork_detail.bundle.js': [
+        'Thangka_gallary/js/common.js',
+        'Thangka_gallary/js/artwork_detail.js',
+    ],
+    'Thangka_gallary/js/upload.bundle.js': [
+        'Thangka_gallary/js/common.js',
+        'Thangka_gallary/js/uploads.js',
+        'Thangka_gallary/js/autocomplete.js',
+    ],
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
+MEDIA_CACHE_SECONDS = 86400
+# Hand media transfers to the front proxy: None (Django streams the file),
+# 'x-accel-redirect' (nginx, needs an `internal` location at MEDIA_ACCEL_PREFIX
+# aliased to MEDIA_ROOT) or 'x-sendfile' (Apache mod_xsendfile / lighttpd).
+MEDIA_ACCEL_REDIRECT = os.environ.get('THANGKA_MEDIA_ACCEL') or None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Chunked, resumable uploads of large scans (see Thangka_gallary/uploads.py).
+# Part files live here until completed: outside MEDIA_ROOT, so /media/ never
+# serves them, but on the same filesystem so completion is a rename, not a copy.
+CHUNKED_UPLOAD_DIR = BASE_DIR / 'var' / 'uploads'
+CHUNKED_UPLOAD_MAX_BYTES = 2 * 1024 ** 3
+CHUNKED_UPLOAD_CHUNK_SIZE = 8 * 1024 ** 2  # suggested to clients
+CHUNKED_UPLOAD_MAX_CHUNK = 32 * 1024 ** 2
+# files the browser sends this way instead of in the form post
+CHUNKED_UPLOAD_THRESHOLD = 20 * 1024 ** 2
+# bigger files skip the hash / palette analysis on completion (backfilled later)
+CHUNKED_UPLOAD_ANALYZE_MAX_BYTES = 64 * 1024 ** 2
+# open sessions untouched this long are removed by `clean_uploads`
+CHUNKED_UPLOAD_EXPIRY_HOURS = 48
+
+# Sitemaps and RSS/Atom feeds written by `build_sitemaps` / `build_feeds` and
+# served as plain files (by Django, or by the front proxy straight from disk)
+PUBLISHED_ROOT = BASE_DIR / 'published'
+PUBLISHED_CACHE_SECONDS = 3600
+# absolute URLs in sitemaps and feeds
+SITE_URL = os.environ.get('THANGKA_SITE_URL', 'http://localhost:8000')
 
 WSGI_APPLICATION = 'Thangka_project.wsgi.application'
 
@@ -104,6 +168,74 @@ DATABASES = {
     }
 }
 
+# Read replica. Locally this is a second SQLite file refreshed from the
+# primary by `python manage.py sync_replica`; reads are only routed to it once
+# the file exists (restart the server after the first sync).
+REPLICA_DB_PATH = Path(os.environ.get('THANGKA_REPLICA_DB', BASE_DIR / 'db_replica.sqlite3'))
+if REPLICA_DB_PATH.exists():
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': REPLICA_DB_PATH,
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['Thangka_gallary.routers.PrimaryReplicaRouter']
+REPLICA_ROUTED_APPS = ('Thangka_gallary', 'auth')
+# after a write, the same browser keeps reading from the primary for this long
+# (keep it above the sync_replica interval)
+REPLICA_PIN_SECONDS = 15
+
+
+# Cache
+# Feed validators, and anything else that must agree across worker processes,
+# live here. Point THANGKA_REDIS_URL at Redis in production; the local-memory
+# fallback is per process and only suitable for development.
+if os.environ.get('THANGKA_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['THANGKA_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Rate limits per URL name: `burst` requests at once, refilled at `rate`.
+# Counted separately per user and per client IP (see Thangka_gallary/throttle.py).
+RATE_LIMITS = {
+    'gallery_json': {'rate': '120/m', 'burst': 30},
+    'artist_artworks_json': {'rate': '120/m', 'burst': 30},
+    'toggle_like': {'rate': '60/m', 'burst': 20},
+    'toggle_bookmark': {'rate': '60/m', 'burst': 20},
+    'toggle_follow': {'rate': '30/m', 'burst': 10},
+    'engagement_batch': {'rate': '30/m', 'burst': 10},
+    'chat_page': {'rate': '20/m', 'burst': 5, 'methods': ('POST',)},
+    'upload_init': {'rate': '30/h', 'burst': 10},
+}
+# e.g. 'HTTP_X_FORWARDED_FOR' when running behind a trusted reverse proxy
+RATE_LIMIT_IP_HEADER = None
+
+# max-age for the JSON feeds (shared caches may keep the anonymous variant this long)
+FEED_CACHE_SECONDS = 30
+
+# Post-deploy warmup (`manage.py warmup`, Thangka_gallary/warmup.py): pages of
+# each public feed and most-viewed artwork pages to prime. With
+# THANGKA_WARMUP=1 every web process also warms itself up as it starts, and
+# /readyz/ answers 503 until it has.
+WARMUP_FEED_PAGES = 3
+WARMUP_TOP_ARTWORKS = 50
+WARMUP_ON_STARTUP = os.environ.get('THANGKA_WARMUP') == '1'
+
+# Engagement rollups (`manage.py rollup_engagement`, Thangka_gallary/analytics.py):
+# events younger than the lag are left for the next run, in case their
+# transaction hasn't committed yet; hourly rows older than the retention are dropped
+ANALYTICS_ROLLUP_LAG_SECONDS = 60
+ANALYTICS_HOURLY_RETENTION_DAYS = 90
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -123,6 +255,19 @@ AUTH_PASSWORD_VALIDATORS = [
     },
 ]
 
+# request.user (with its artist profile) comes from the cache; ModelBackend
+# stays listed so sessions created before the switch remain valid
+AUTHENTICATION_BACKENDS = [
+    'Thangka_gallary.backends.CachedModelBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+USER_CACHE_SECONDS = 300
+
+# Sessions are read from the cache and only fall back to the database on a
+# miss; they are written through to the database, which only happens on
+# login/logout since nothing else modifies the session.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 LOGIN_URL = '/login/'
 
 # Redirect after login/logout
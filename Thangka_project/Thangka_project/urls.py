@@ -15,16 +15,21 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, re_path, include
 from django.conf import settings
-from django.conf.urls.static import static
+
+from Thangka_gallary.media import serve_media, serve_published
 
 urlpatterns = [
     path('admin/', admin.site.urls),
 
+    # Uploaded media, in development and production (ETag/Range/X-Accel-Redirect aware)
+    re_path(r'^%s(?P<path>.+)$' % settings.MEDIA_URL.lstrip('/'), serve_media, name='media'),
+
+    # Precomputed sitemaps and feeds (manage.py build_sitemaps / build_feeds)
+    re_path(r'^(?P<path>sitemap\.xml|sitemaps/[\w-]+\.xml\.gz|feeds/(?:category|artist)/[\w-]+\.(?:rss|atom))$',
+            serve_published, name='published'),
+
     # Main app — everything inside thangka_gallary.urls
     path('', include('Thangka_gallary.urls')),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -14,3 +14,10 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Thangka_project.settings')
 
 application = get_wsgi_application()
+
+# optionally warm this process up in the background; /readyz/ reports when done
+from django.conf import settings
+
+if settings.WARMUP_ON_STARTUP:
+    from Thangka_gallary.warmup import start
+    start()